@@ -6,16 +6,30 @@ Simple FastAPI wrapper around the LangGraph healthcare chatbot.
 Provides /chat endpoint and serves the frontend.
 """
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
 from typing import Optional
+from datetime import date, timedelta
+import asyncio
+import hashlib
+import logging
+import os
 import uuid
 
+from app.events import STATUSES
+from app.idempotency import IdempotencyConflict, IdempotencyStore
+from app.portal import TOKEN_TTL, decode_cursor, encode_cursor, issue_token, token_patient
+from app.profiling import request_profiler, should_profile
+from app.tools import DB, EVENTS, query_appointments, verify_patient
+from app.turns import TurnQueue
 from graph.builder import create_healthcare_chatbot
+from graph.models import date_readings, normalize_date, normalize_phone
 from langchain_core.messages import HumanMessage
 
+logger = logging.getLogger(__name__)
+
 # =============================================================================
 # SCHEMAS
 # =============================================================================
@@ -26,6 +40,19 @@ class ChatRequest(BaseModel):
 
     message: str
     thread_id: Optional[str] = None
+    # Client-generated id reused across retries of the same message
+    request_id: Optional[str] = None
+
+
+class Appointment(BaseModel):
+    """Appointment as rendered by the frontend"""
+
+    id: int
+    date: str
+    time: str
+    doctor: str
+    type: str
+    status: str
 
 
 class ChatResponse(BaseModel):
@@ -34,6 +61,30 @@ class ChatResponse(BaseModel):
     message: str
     thread_id: str
     authenticated: bool
+    appointments: Optional[list[Appointment]] = None  # Set on list turns
+
+
+class LoginRequest(BaseModel):
+    """Patient identity, as verified by the chatbot"""
+
+    full_name: str
+    phone_number: str
+    date_of_birth: str
+
+
+class LoginResponse(BaseModel):
+    """Bearer token for the patient's portal endpoints"""
+
+    patient_id: int
+    token: str
+    expires_in: int
+
+
+class AppointmentPage(BaseModel):
+    """One page of a patient's appointments"""
+
+    appointments: list[Appointment]
+    next_cursor: Optional[str] = None  # Pass as ?cursor= for the next page
 
 
 # =============================================================================
@@ -58,6 +109,15 @@ app.add_middleware(
 # Create the chatbot graph once at startup
 chatbot = create_healthcare_chatbot()
 
+# Deduplicates retried /chat requests that carry the same thread_id and request_id
+idempotency = IdempotencyStore(
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "600")),
+)
+
+# One graph turn at a time per thread; messages sent meanwhile are merged
+turns = TurnQueue()
+
 # =============================================================================
 # ENDPOINTS
 # =============================================================================
@@ -71,35 +131,204 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy"}
+    """Health check endpoint, with checkpoint memory gauges when bounded"""
+    health = {"status": "healthy"}
+    if hasattr(chatbot.checkpointer, "gauges"):
+        health["checkpoints"] = chatbot.checkpointer.gauges()
+    return health
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+@app.get("/stats")
+async def appointment_stats(
+    start: Optional[str] = None, end: Optional[str] = None, doctor: Optional[str] = None
+):
+    """Appointments per status and cancellation rate per doctor for days in
+    [start, end] (YYYY-MM-DD, default: the current week), from the
+    aggregates folded so far"""
+    try:
+        first = date.fromisoformat(start) if start else None
+        last = date.fromisoformat(end) if end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="dates must be YYYY-MM-DD")
+    if first is None:
+        today = date.today()
+        first = today - timedelta(days=today.weekday())
+    last = last or first + timedelta(days=6)
+    # Reads the directory: off the event loop
+    return await asyncio.to_thread(EVENTS.stats, first.isoformat(), last.isoformat(), doctor)
+
+
+@app.post("/patients/login", response_model=LoginResponse)
+async def patient_login(request: LoginRequest):
+    """Exchange a patient's name, phone and date of birth for a portal token"""
+    date_of_birth = normalize_date(request.date_of_birth)
+    if len(date_readings(date_of_birth)) > 1:
+        raise HTTPException(
+            status_code=400, detail="ambiguous date of birth; send it as YYYY-MM-DD"
+        )
+    result = verify_patient.func(
+        " ".join(request.full_name.split()),
+        normalize_phone(request.phone_number),
+        date_of_birth,
+    )
+    if not result["verified"]:
+        raise HTTPException(status_code=401, detail="patient not found")
+    return LoginResponse(
+        patient_id=result["user_id"],
+        token=issue_token(result["user_id"]),
+        expires_in=TOKEN_TTL,
+    )
+
+
+@app.get("/patients/{patient_id}/appointments", response_model=AppointmentPage)
+async def patient_appointments(
+    patient_id: int,
+    response: Response,
+    status: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    authorization: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+):
     """
-    Main chat endpoint that processes messages through the LangGraph chatbot
+    A patient's appointments by date, without going through the chatbot.
+
+    Filters: ``status``, and ``start``/``end`` dates (YYYY-MM-DD, inclusive).
+    The ETag changes whenever the patient's appointments do, so a client
+    revalidating with If-None-Match gets a 304 after a single version lookup,
+    without querying the appointments.
     """
+    token = (authorization or "").removeprefix("Bearer ").strip()
+    owner = token_patient(token) if token else None
+    if owner is None:
+        raise HTTPException(
+            status_code=401,
+            detail="missing or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if owner != patient_id:
+        raise HTTPException(status_code=403, detail="token is for another patient")
+
+    try:
+        for day in (start, end):
+            if day:
+                date.fromisoformat(day)
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid date or cursor")
+    if status and status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {STATUSES}")
+
+    # Read the version before the rows: a write racing the query leaves a
+    # stale tag that won't match again, never a fresh tag on stale rows
+    query = f"{status}|{start}|{end}|{cursor}|{limit}"
+    version = await asyncio.to_thread(DB.patient_version, patient_id)
+    etag = '"{}.{}"'.format(
+        version, hashlib.blake2b(query.encode(), digest_size=6).hexdigest()
+    )
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if if_none_match and etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    # One extra row tells whether there is a next page
+    rows = await asyncio.to_thread(
+        query_appointments,
+        patient_id,
+        [status] if status else None,
+        start,
+        end,
+        after,
+        limit + 1,
+    )
+    response.headers.update(headers)
+    return AppointmentPage(
+        appointments=rows[:limit],
+        next_cursor=encode_cursor(rows[limit - 1]) if len(rows) > limit else None,
+    )
+
+
+def invoke_chatbot(message: str, config: dict, profile: bool) -> dict:
+    """Invoke the graph, under the request profiler when asked to"""
+    graph_input = {"messages": [HumanMessage(content=message)]}
+    if not profile:
+        return chatbot.invoke(graph_input, config)
+
+    with request_profiler(config["configurable"]["thread_id"]) as profiler:
+        response = chatbot.invoke(
+            graph_input, {**config, "callbacks": profiler.callbacks}
+        )
+    logger.info("profile written to %s/%s", profiler.directory, profiler.name)
+    return response
+
+
+async def run_chat(request: ChatRequest, profile: bool = False) -> ChatResponse:
+    """Run one conversation turn through the LangGraph chatbot"""
     # Generate thread_id if not provided
     thread_id = request.thread_id or str(uuid.uuid4())
 
     # Configure for the graph
     config = {"configurable": {"thread_id": thread_id}}
 
-    # Invoke the LangGraph chatbot
-    response = chatbot.invoke(
-        {"messages": [HumanMessage(content=request.message)]}, config
+    # Invoke the LangGraph chatbot off the event loop so other requests
+    # (including retries of this one) are served while the LLM is working
+    response = await asyncio.to_thread(
+        invoke_chatbot, request.message, config, profile
     )
 
     # Extract the bot's response
-    bot_message = response["messages"][-1].content
+    last_message = response["messages"][-1]
     authenticated = response.get("user_verified", False)
 
     return ChatResponse(
-        message=bot_message, thread_id=thread_id, authenticated=authenticated
+        message=last_message.content,
+        thread_id=thread_id,
+        authenticated=authenticated,
+        appointments=last_message.additional_kwargs.get("appointments"),
     )
 
 
+async def queued_chat(request: ChatRequest, profile: bool = False) -> ChatResponse:
+    """Run the request's turn once the thread is idle, merged with any other
+    messages sent to the same thread while it was busy"""
+    thread_id = request.thread_id or str(uuid.uuid4())
+    return await turns.submit(
+        thread_id,
+        request.message,
+        lambda messages: run_chat(
+            ChatRequest(message="\n".join(messages), thread_id=thread_id), profile
+        ),
+        # Profiled and unprofiled requests don't share a turn
+        options=profile,
+    )
+
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest, x_profile: Optional[str] = Header(None)):
+    """
+    Main chat endpoint that processes messages through the LangGraph chatbot
+    """
+    profile = should_profile(x_profile)
+    # Request ids are the client's and only unique within its conversation; a
+    # request that starts one has no thread to scope its id to
+    if not request.request_id or not request.thread_id:
+        return await queued_chat(request, profile)
+
+    try:
+        # A retry attaches to the in-flight turn or gets its cached response
+        return await idempotency.run(
+            (request.thread_id, request.request_id),
+            request.message,
+            lambda: queued_chat(request, profile),
+        )
+    except IdempotencyConflict:
+        raise HTTPException(
+            status_code=409,
+            detail="request_id was already used for a different message",
+        )
+
+
 if __name__ == "__main__":
     import uvicorn
 
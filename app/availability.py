@@ -0,0 +1,313 @@
+"""Doctor availability: free-slot index and conflict-free booking"""
+
+import bisect
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from app.events import EventLog, write_events
+from app.sharding import ShardedDatabase, bump_versions
+
+
+def to_minutes(hhmm: str) -> int:
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def to_hhmm(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class FreeSlotIndex:
+    """In-memory index of open slots per doctor per day.
+
+    Each doctor has a weekly template of working intervals. A day's free
+    intervals are only materialized once something is booked on it, so a year
+    of untouched calendar costs nothing. Free intervals are kept sorted as
+    ``(start, end, slot_minutes)`` tuples in minutes since midnight, and
+    booking a slot splits the interval that contains it.
+    """
+
+    def __init__(self, horizon_days: int = 365):
+        self.horizon_days = horizon_days
+        self._templates: dict[str, dict[int, list[tuple[int, int, int]]]] = {}
+        self._days: dict[str, dict[date, list[tuple[int, int, int]]]] = {}
+        self._locks: dict[str, threading.Lock] = {}
+
+    @classmethod
+    def from_database(
+        cls,
+        conn: sqlite3.Connection,
+        horizon_days: int = 365,
+        appointment_conns: Optional[list[sqlite3.Connection]] = None,
+    ):
+        """Build the index from doctor schedules in ``conn`` and live
+        appointments in ``appointment_conns`` (the shards; default ``conn``)"""
+        index = cls(horizon_days)
+        rows = conn.execute(
+            """SELECT d.name, s.weekday, s.start_time, s.end_time, s.slot_minutes
+            FROM doctor_schedules s JOIN doctors d ON d.id = s.doctor_id"""
+        ).fetchall()
+        for name, weekday, start, end, slot_minutes in rows:
+            index.add_schedule(name, weekday, start, end, slot_minutes)
+
+        for shard_conn in appointment_conns or [conn]:
+            booked = shard_conn.execute(
+                """SELECT doctor_name, appointment_date, appointment_time
+                FROM appointments
+                WHERE status != 'cancelled' AND appointment_date >= ?""",
+                (date.today().isoformat(),),
+            ).fetchall()
+            for doctor, day, time in booked:
+                index.reserve(doctor, date.fromisoformat(day), time)
+        return index
+
+    # -------------------------------------------------------------------------
+    # Schedule and doctor lookup
+    # -------------------------------------------------------------------------
+
+    def add_schedule(
+        self, doctor: str, weekday: int, start: str, end: str, slot_minutes: int
+    ):
+        """Register working hours for a doctor on a weekday"""
+        template = self._templates.setdefault(doctor, {})
+        intervals = template.setdefault(weekday, [])
+        bisect.insort(intervals, (to_minutes(start), to_minutes(end), slot_minutes))
+        self._days.setdefault(doctor, {})
+        self._locks.setdefault(doctor, threading.Lock())
+
+    @property
+    def doctors(self) -> list[str]:
+        return sorted(self._templates)
+
+    def __contains__(self, doctor: str) -> bool:
+        """Whether ``doctor`` has a schedule"""
+        return doctor in self._templates
+
+    def resolve_doctor(self, name: str) -> Optional[str]:
+        """Match "Brown", "dr brown" or "Dr. Brown" to a known doctor"""
+        wanted = name.lower().replace("dr.", "").replace("dr ", "").strip()
+        if not wanted:
+            return None
+        matches = [d for d in self._templates if wanted in d.lower()]
+        return matches[0] if len(matches) == 1 else None
+
+    # -------------------------------------------------------------------------
+    # Queries
+    # -------------------------------------------------------------------------
+
+    def _free_intervals(self, doctor: str, day: date) -> list[tuple[int, int, int]]:
+        materialized = self._days[doctor].get(day)
+        if materialized is not None:
+            return materialized
+        return self._templates[doctor].get(day.weekday(), [])
+
+    def next_slots(
+        self, doctor: str, after: Optional[datetime] = None, limit: int = 5
+    ) -> list[dict]:
+        """Return the next ``limit`` open slots for a doctor strictly after ``after``"""
+        if doctor not in self._templates:
+            return []
+        now = datetime.now()
+        after = max(after or now, now)
+        first_day = after.date()
+        after_minute = after.hour * 60 + after.minute
+        last_day = date.today() + timedelta(days=self.horizon_days)
+
+        slots = []
+        day = first_day
+        while day <= last_day and len(slots) < limit:
+            for start, end, length in self._free_intervals(doctor, day):
+                minute = start
+                if day == first_day and minute <= after_minute:
+                    # Jump to the first grid-aligned slot after the cut-off
+                    steps = (after_minute - start) // length + 1
+                    minute = start + steps * length
+                while minute + length <= end and len(slots) < limit:
+                    slots.append(
+                        {
+                            "doctor": doctor,
+                            "date": day.isoformat(),
+                            "time": to_hhmm(minute),
+                        }
+                    )
+                    minute += length
+                if len(slots) >= limit:
+                    break
+            day += timedelta(days=1)
+        return slots
+
+    def in_horizon(self, day: date) -> bool:
+        """Whether ``day`` is between today and the booking horizon"""
+        today = date.today()
+        return today <= day <= today + timedelta(days=self.horizon_days)
+
+    def is_free(self, doctor: str, day: date, time: str) -> bool:
+        minute = to_minutes(time)
+        return any(
+            start <= minute
+            and minute + length <= end
+            and (minute - start) % length == 0
+            for start, end, length in self._free_intervals(doctor, day)
+        )
+
+    # -------------------------------------------------------------------------
+    # Mutations
+    # -------------------------------------------------------------------------
+
+    def lock(self, doctor: str) -> threading.Lock:
+        return self._locks[doctor]
+
+    def reserve(self, doctor: str, day: date, time: str) -> bool:
+        """Remove a slot from the free intervals; False if it wasn't free or
+        lies outside the booking horizon"""
+        if doctor not in self._templates or not self.in_horizon(day):
+            return False
+        minute = to_minutes(time)
+        intervals = list(self._free_intervals(doctor, day))
+        for i, (start, end, length) in enumerate(intervals):
+            if start <= minute and minute + length <= end:
+                if (minute - start) % length:
+                    return False
+                pieces = [
+                    piece
+                    for piece in ((start, minute, length), (minute + length, end, length))
+                    if piece[0] < piece[1]
+                ]
+                intervals[i : i + 1] = pieces
+                self._days[doctor][day] = intervals
+                return True
+        return False
+
+    def release(self, doctor: str, day: date, time: str):
+        """Return a slot to the free intervals, merging with its neighbours"""
+        if doctor not in self._templates or not self.in_horizon(day):
+            return
+        minute = to_minutes(time)
+        template = self._templates[doctor].get(day.weekday(), [])
+        length = next(
+            (ln for start, end, ln in template if start <= minute < end), None
+        )
+        if length is None or self.is_free(doctor, day, time):
+            return
+        intervals = list(self._free_intervals(doctor, day))
+        bisect.insort(intervals, (minute, minute + length, length))
+        merged: list[tuple[int, int, int]] = []
+        for start, end, ln in intervals:
+            if merged and merged[-1][1] == start and merged[-1][2] == ln:
+                merged[-1] = (merged[-1][0], end, ln)
+            else:
+                merged.append((start, end, ln))
+        self._days[doctor][day] = merged
+
+
+def book_slot(
+    conn: sqlite3.Connection,
+    conn_lock: threading.RLock,
+    index: FreeSlotIndex,
+    patient_id: int,
+    doctor: str,
+    day: str,
+    time: str,
+    appointment_type: str,
+    replaces: Optional[int] = None,
+    appointment_id: Optional[int] = None,
+    events: Optional[EventLog] = None,
+    claims: Optional[ShardedDatabase] = None,
+) -> dict:
+    """Book a slot, optionally cancelling the appointment it replaces.
+
+    The doctor lock makes check-and-reserve atomic across threads of this
+    process, and the partial unique index on appointments rejects a second
+    booking of the slot on the same shard. Other processes, and patients on
+    other shards, are only kept out by ``claims``: when given, the slot is
+    claimed in its directory (``ShardedDatabase.claim_slot``) before the
+    appointment is written, and the claim is dropped if the booking fails.
+    The replaced appointment's claim is dropped once the booking commits.
+    ``appointment_id`` is the id allocated by the shard directory, if any
+    (required with ``claims``); booking fails with ``patient_not_found``
+    when the patient isn't on ``conn`` (e.g. moved to another shard
+    meanwhile), and with ``outside_horizon`` for a day in the past or beyond
+    the index's ``horizon_days``. The booking, and the cancellation it
+    implies, are written to the shard's event outbox and the patient's
+    version tag is bumped in the same transaction; ``events`` is notified to
+    fold them, when given.
+    """
+    doctor = index.resolve_doctor(doctor) or doctor
+    slot_day = date.fromisoformat(day)
+    if doctor not in index:
+        return {"success": False, "reason": "unknown_doctor"}
+    if not index.in_horizon(slot_day):
+        return {"success": False, "reason": "outside_horizon"}
+
+    with index.lock(doctor):
+        if not index.reserve(doctor, slot_day, time):
+            return {"success": False, "reason": "slot_unavailable"}
+        if claims is not None and not claims.claim_slot(doctor, day, time, appointment_id):
+            # Booked by another process: now reserved in this index too
+            return {"success": False, "reason": "slot_unavailable"}
+        try:
+            with conn_lock:
+                cursor = conn.cursor()
+                old = None
+                if appointment_id is not None and not cursor.execute(
+                    "SELECT 1 FROM patients WHERE id = ?", (patient_id,)
+                ).fetchone():
+                    raise LookupError("patient_not_found")
+                if replaces is not None:
+                    old = cursor.execute(
+                        """SELECT doctor_name, appointment_date, appointment_time, status
+                        FROM appointments
+                        WHERE id = ? AND patient_id = ? AND status != 'cancelled'""",
+                        (replaces, patient_id),
+                    ).fetchone()
+                    if old is None:
+                        raise LookupError("appointment_not_found")
+                    cursor.execute(
+                        "UPDATE appointments SET status = 'cancelled' WHERE id = ?",
+                        (replaces,),
+                    )
+                cursor.execute(
+                    """INSERT INTO appointments
+                    (id, patient_id, appointment_date, appointment_time, doctor_name,
+                     appointment_type, status)
+                    VALUES (?, ?, ?, ?, ?, ?, 'scheduled')""",
+                    (appointment_id, patient_id, day, time, doctor, appointment_type),
+                )
+                appointment_id = cursor.lastrowid
+                changes = [(appointment_id, doctor, day, None, "scheduled")]
+                if old is not None:
+                    changes.append((replaces, old[0], old[1], old[3], "cancelled"))
+                write_events(conn, changes)
+                bump_versions(conn, [patient_id])
+                conn.commit()
+        except (sqlite3.IntegrityError, LookupError) as e:
+            conn.rollback()
+            index.release(doctor, slot_day, time)
+            if claims is not None:
+                claims.release_slots([appointment_id])
+            reason = (
+                "slot_unavailable" if isinstance(e, sqlite3.IntegrityError) else str(e)
+            )
+            return {"success": False, "reason": reason}
+
+    if old is not None:
+        # Free the old slot outside the new doctor's lock to avoid lock ordering issues
+        with index.lock(old[0]):
+            index.release(old[0], date.fromisoformat(old[1]), old[2])
+        if claims is not None:
+            claims.release_slots([replaces])
+
+    if events is not None:
+        events.notify()
+
+    return {
+        "success": True,
+        "appointment_id": appointment_id,
+        "doctor": doctor,
+        "date": day,
+        "time": time,
+        "type": appointment_type,
+        "replaced": replaces,
+    }
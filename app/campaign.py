@@ -0,0 +1,299 @@
+"""Batch reminder and confirmation campaigns for upcoming appointments"""
+
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.database import DB
+from app.sharding import ShardedDatabase
+from app.tools import update_appointment_statuses
+from graph.nodes import (
+    await_reply,
+    confirmation_decision,
+    confirmation_outcome,
+    confirmation_reply,
+    confirmed_in,
+)
+
+
+def reminder_thread_id(patient_id: int) -> str:
+    """Each patient gets one long-lived reminder thread"""
+    return f"reminder-{patient_id}"
+
+
+def _iter_shard(
+    conn: sqlite3.Connection,
+    window_start: str,
+    window_end: str,
+    after: tuple,
+    chunk_size: int,
+) -> Iterator[dict]:
+    """Scheduled appointments in the window on one shard, in (date, time, id)
+    order, after the ``after`` keyset cursor"""
+    start_date, start_time = window_start.split(" ")
+    end_date, end_time = window_end.split(" ")
+    # The cursor doubles as the window's lower bound (ids start at 1)
+    after = max(tuple(after), (start_date, start_time, 0))
+    while True:
+        rows = conn.execute(
+            """SELECT a.id, a.patient_id, p.full_name, a.appointment_date,
+                      a.appointment_time, a.doctor_name, a.appointment_type, a.status
+            FROM appointments a JOIN patients p ON p.id = a.patient_id
+            WHERE a.status = 'scheduled'
+              AND (a.appointment_date, a.appointment_time, a.id) > (?, ?, ?)
+              AND (a.appointment_date, a.appointment_time) < (?, ?)
+            ORDER BY a.appointment_date, a.appointment_time, a.id
+            LIMIT ?""",
+            (*after, end_date, end_time, chunk_size),
+        ).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield {
+                "id": row[0],
+                "patient_id": row[1],
+                "patient_name": row[2],
+                "date": row[3],
+                "time": row[4],
+                "doctor": row[5],
+                "type": row[6],
+                "status": row[7],
+            }
+        after = (rows[-1][3], rows[-1][4], rows[-1][0])
+
+
+def iter_upcoming_appointments(
+    db: ShardedDatabase,
+    window_start: str,
+    window_end: str,
+    after: tuple = ("", "", 0),
+    chunk_size: int = 500,
+) -> Iterator[list[dict]]:
+    """Stream scheduled appointments in [window_start, window_end) ("YYYY-MM-DD
+    HH:MM") in (date, time, id) order.
+
+    Each shard is paged with a keyset on (date, time, id), which
+    idx_appointments_status_date serves as one index range per chunk: the
+    cost follows the appointments in the window, not the table size. The
+    shards' streams are merged in the same order (ids are global), so a
+    resumed campaign can start right after the ``after`` cursor of the last
+    processed appointment.
+    """
+    merged = heapq.merge(
+        *(
+            _iter_shard(shard.conn, window_start, window_end, after, chunk_size)
+            for shard in db.shards
+        ),
+        key=lambda apt: (apt["date"], apt["time"], apt["id"]),
+    )
+    while chunk := list(itertools.islice(merged, chunk_size)):
+        yield chunk
+
+
+class CampaignCheckpoint:
+    """Progress of a campaign run, persisted atomically after every chunk"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.state = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+
+    def get(self, key: str, default=None):
+        return self.state.get(key, default)
+
+    def save(self, **values):
+        self.state.update(values)
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
+
+
+class ReminderCampaign:
+    """Sends reminders into patient threads and resolves their replies in bulk.
+
+    Reminder texts are generated with batched ``llm`` calls, and replies are
+    decided with confirm_node's logic (resolver, repair, model tiers), both
+    capped at ``concurrency`` in flight. Status changes from a batch of replies
+    are written in a single transaction. The threads live in ``chatbot``'s
+    checkpointer, which must be one the API reads too (``CHECKPOINTER=sqlite``)
+    for patients to continue them.
+    """
+
+    def __init__(
+        self,
+        chatbot,
+        llm,
+        db: ShardedDatabase = DB,
+        concurrency: int = 8,
+        chunk_size: int = 500,
+    ):
+        self.chatbot = chatbot
+        self.llm = llm
+        self.db = db
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+
+    def _batch(self, runnable, inputs: list) -> list:
+        return runnable.batch(
+            inputs, config={"max_concurrency": self.concurrency}, return_exceptions=True
+        )
+
+    # -------------------------------------------------------------------------
+    # Outbound reminders
+    # -------------------------------------------------------------------------
+
+    def _reminder_prompt(self, apt: dict) -> list:
+        return [
+            SystemMessage(
+                content="You are a healthcare assistant writing a short SMS appointment reminder. Mention the appointment type, doctor, date and time, and ask the patient to reply to confirm. Keep it under 300 characters."
+            ),
+            HumanMessage(
+                content=f"Patient: {apt['patient_name']}. Appointment: {apt['type']} with {apt['doctor']} on {apt['date']} at {apt['time']}."
+            ),
+        ]
+
+    def send_reminders(
+        self, hours: int = 48, checkpoint: Optional[CampaignCheckpoint] = None
+    ) -> dict:
+        """Remind every patient with a scheduled appointment in the next ``hours``.
+
+        The window is fixed when the campaign first starts, so a resumed run
+        continues over the same appointment set. A chunk interrupted by a crash
+        is re-sent on resume (at-least-once delivery).
+        """
+        checkpoint = checkpoint or CampaignCheckpoint(None)
+        now = datetime.now()
+        window_start = checkpoint.get("window_start") or now.strftime("%Y-%m-%d %H:%M")
+        window_end = checkpoint.get("window_end") or (
+            now + timedelta(hours=hours)
+        ).strftime("%Y-%m-%d %H:%M")
+        # (date, time, id) of the last appointment reminded
+        last = tuple(checkpoint.get("last_appointment") or ("", "", 0))
+        sent = checkpoint.get("sent", 0)
+        failed = checkpoint.get("failed", 0)
+        checkpoint.save(window_start=window_start, window_end=window_end)
+
+        for chunk in iter_upcoming_appointments(
+            self.db, window_start, window_end, last, self.chunk_size
+        ):
+            reminders = self._batch(
+                self.llm, [self._reminder_prompt(apt) for apt in chunk]
+            )
+            for apt, reminder in zip(chunk, reminders):
+                if isinstance(reminder, Exception):
+                    # Template fallback keeps the campaign moving through model errors
+                    failed += 1
+                    reminder = AIMessage(
+                        content=f"Reminder: {apt['type']} with {apt['doctor']} on {apt['date']} at {apt['time']}. Reply to confirm."
+                    )
+                self._append_to_thread(apt, reminder)
+                sent += 1
+            last = (chunk[-1]["date"], chunk[-1]["time"], chunk[-1]["id"])
+            checkpoint.save(last_appointment=last, sent=sent, failed=failed)
+
+        checkpoint.save(completed=True)
+        return {"sent": sent, "failed": failed, "last_appointment_id": last[2]}
+
+    def _append_to_thread(self, apt: dict, reminder: AIMessage):
+        """Create or continue the patient's thread as an authenticated session"""
+        config = {"configurable": {"thread_id": reminder_thread_id(apt["patient_id"])}}
+        existing = self.chatbot.get_state(config).values
+        appointments = [
+            a for a in existing.get("available_appointments", []) if a["id"] != apt["id"]
+        ]
+        appointments.append(
+            {key: apt[key] for key in ("id", "date", "time", "doctor", "type", "status")}
+        )
+        self.chatbot.update_state(
+            config,
+            {
+                "user_verified": True,
+                "user_data": {
+                    **existing.get("user_data", {}),
+                    "user_id": apt["patient_id"],
+                },
+                "available_appointments": appointments,
+                "messages": [reminder],
+            },
+        )
+
+    # -------------------------------------------------------------------------
+    # Inbound replies
+    # -------------------------------------------------------------------------
+
+    def resolve_replies(
+        self, replies: Iterable[dict], checkpoint: Optional[CampaignCheckpoint] = None
+    ) -> dict:
+        """Resolve replies ({thread_id, message}) with confirm_node's decision logic.
+
+        Replies are consumed a chunk at a time: each chunk's status changes are
+        committed and its threads updated before the next one is read, so
+        memory stays flat however many replies there are. Progress is saved in
+        ``checkpoint`` after every chunk, and a resumed run skips the replies
+        already resolved, so pass the same replies in the same order. A chunk
+        interrupted by a crash is resolved again on resume (at-least-once).
+        """
+        checkpoint = checkpoint or CampaignCheckpoint(None)
+        resolved = checkpoint.get("replies_resolved", 0)
+        confirmed = checkpoint.get("replies_confirmed", 0)
+        decide = RunnableLambda(lambda context: confirmation_decision(*context[1:3]))
+        remaining = itertools.islice(replies, resolved, None)
+
+        while chunk := list(itertools.islice(remaining, self.chunk_size)):
+            contexts = []
+            for reply in chunk:
+                config = {"configurable": {"thread_id": reply["thread_id"]}}
+                values = self.chatbot.get_state(config).values
+                messages = values.get("messages", []) + [
+                    HumanMessage(content=reply["message"])
+                ]
+                contexts.append(
+                    (config, values.get("available_appointments", []), messages, values)
+                )
+            decisions = self._batch(decide, contexts)
+
+            updates, states = [], []
+            for (config, appointments, messages, values), decision in zip(
+                contexts, decisions
+            ):
+                state = {"messages": messages, "available_appointments": appointments}
+                if isinstance(decision, Exception):
+                    outcome, apt = "error", None
+                else:
+                    outcome, apt = confirmation_outcome(decision, appointments)
+                if outcome == "confirm":
+                    updates.append({"appointment_id": apt["id"], "status": "confirmed"})
+                    state["available_appointments"] = confirmed_in(
+                        appointments, apt["id"]
+                    )
+                if outcome in ("unclear", "error"):
+                    # The patient's next message answers the question, as in chat
+                    state["pending_action"] = await_reply(
+                        {**values, "messages": messages}, "confirm"
+                    )
+                reply_text = confirmation_reply(outcome, decision, apt)
+                state["messages"] = [messages[-1], AIMessage(content=reply_text)]
+                states.append((config, state))
+
+            # One transaction per chunk instead of one commit per appointment
+            if updates:
+                update_appointment_statuses.invoke({"updates": updates})
+            for config, state in states:
+                self.chatbot.update_state(config, state)
+            resolved += len(chunk)
+            confirmed += len(updates)
+            checkpoint.save(replies_resolved=resolved, replies_confirmed=confirmed)
+
+        checkpoint.save(replies_completed=True)
+        return {"replies": resolved, "confirmed": confirmed}
@@ -1,17 +1,25 @@
 """Database setup and sample data"""
 
+import os
 import sqlite3
 from datetime import datetime, timedelta
+from typing import Optional
+from dotenv import load_dotenv
 
+from app.events import rebuild_stats
+from app.sharding import ShardedDatabase
 
-def setup_database():
-    """Setup database with sample data"""
-    conn = sqlite3.connect(":memory:")
+load_dotenv()
+
+
+def create_schema(conn: sqlite3.Connection):
+    """Create shard tables and indexes: patients, their appointments with
+    their version tags, and the outbox of appointment events"""
     cursor = conn.cursor()
 
     cursor.execute(
         """
-        CREATE TABLE patients (
+        CREATE TABLE IF NOT EXISTS patients (
             id INTEGER PRIMARY KEY,
             full_name TEXT NOT NULL,
             phone_number TEXT NOT NULL,
@@ -22,7 +30,7 @@ def setup_database():
 
     cursor.execute(
         """
-        CREATE TABLE appointments (
+        CREATE TABLE IF NOT EXISTS appointments (
             id INTEGER PRIMARY KEY,
             patient_id INTEGER,
             appointment_date TEXT NOT NULL,
@@ -34,12 +42,254 @@ def setup_database():
     """
     )
 
+    # Serves a patient's appointments by date (and the keyset order of the
+    # portal) straight from the index; supersedes the patient_id-only index
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_appointments_patient_date
+        ON appointments (patient_id, appointment_date, appointment_time)
+    """
+    )
+    cursor.execute("DROP INDEX IF EXISTS idx_appointments_patient")
+
+    # Reminder campaigns page through a window of scheduled appointments by
+    # (date, time, id)
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_appointments_status_date
+        ON appointments (status, appointment_date, appointment_time, id)
+    """
+    )
+
+    # A doctor can't hold two live appointments in the same slot on one shard;
+    # across shards (and processes) the directory's doctor_slots claims guard it
+    cursor.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_doctor_slot
+        ON appointments (doctor_name, appointment_date, appointment_time)
+        WHERE status != 'cancelled'
+    """
+    )
+
+    # Per patient, a tag that changes with every write to their appointments
+    # (the portal's ETag)
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS patient_versions (
+            patient_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """
+    )
+
+    # Outbox of appointment status changes, written in the same transaction as
+    # the change and folded into the directory by EventLog. AUTOINCREMENT keeps
+    # ids increasing after folded rows are pruned.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS appointment_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            appointment_id INTEGER NOT NULL,
+            doctor_name TEXT NOT NULL,
+            appointment_date TEXT NOT NULL,
+            old_status TEXT,
+            new_status TEXT NOT NULL,
+            recorded_at TEXT NOT NULL
+        )
+    """
+    )
+
+
+def create_directory_schema(conn: sqlite3.Connection):
+    """Create the directory tables: shard membership, patient and appointment
+    placement, the doctor reference data and slot claims shared by all
+    shards, and the appointment event log with its stats"""
+    cursor = conn.cursor()
+
+    cursor.execute("CREATE TABLE IF NOT EXISTS shards (name TEXT PRIMARY KEY)")
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS patient_directory (
+            patient_id INTEGER PRIMARY KEY,
+            full_name TEXT NOT NULL,
+            phone_number TEXT NOT NULL,
+            date_of_birth TEXT NOT NULL,
+            shard TEXT NOT NULL
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_patient_directory_identity
+        ON patient_directory (full_name, phone_number, date_of_birth)
+    """
+    )
+
+    # Hands out globally unique appointment ids and maps them to patients
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS appointment_directory (
+            appointment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            patient_id INTEGER NOT NULL
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS doctors (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    """
+    )
+
+    # Weekly working hours; weekday follows date.weekday() (0 = Monday)
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS doctor_schedules (
+            doctor_id INTEGER NOT NULL REFERENCES doctors(id),
+            weekday INTEGER NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            slot_minutes INTEGER NOT NULL DEFAULT 30
+        )
+    """
+    )
+
+    # The doctor slot each booked appointment holds, across all shards. Booking
+    # claims the slot here before writing the appointment to the patient's
+    # shard, so two processes can't book one slot for patients on different
+    # shards; cancelling an appointment drops its claim.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS doctor_slots (
+            doctor TEXT NOT NULL,
+            date TEXT NOT NULL,
+            time TEXT NOT NULL,
+            appointment_id INTEGER NOT NULL,
+            UNIQUE (doctor, date, time)
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_doctor_slots_appointment
+        ON doctor_slots (appointment_id)
+    """
+    )
+
+    # Append-only history of appointment status changes; old_status is NULL
+    # for a new booking
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS appointment_events (
+            id INTEGER PRIMARY KEY,
+            appointment_id INTEGER NOT NULL,
+            doctor_name TEXT NOT NULL,
+            appointment_date TEXT NOT NULL,
+            old_status TEXT,
+            new_status TEXT NOT NULL,
+            recorded_at TEXT NOT NULL
+        )
+    """
+    )
+
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_appointment_events_appointment
+        ON appointment_events (appointment_id)
+    """
+    )
+
+    # Per shard, the last outbox event folded into the history and the stats
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS event_offsets (
+            shard TEXT PRIMARY KEY,
+            last_event_id INTEGER NOT NULL
+        )
+    """
+    )
+
+    # Appointments per day, doctor and status, kept current from the events
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS appointment_stats (
+            day TEXT NOT NULL,
+            doctor_name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, doctor_name, status)
+        ) WITHOUT ROWID
+    """
+    )
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open a database file (or ``:memory:``) shared across worker threads"""
+    # Nodes fetch appointments from worker threads while the LLM is running
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    if path != ":memory:":
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={os.getenv('DB_SYNCHRONOUS', 'FULL')}")
+    return conn
+
+
+def directory_connection(db: ShardedDatabase) -> sqlite3.Connection:
+    """A separate connection to ``db``'s directory file, or the shared one
+    when the database is in memory"""
+    path = db.directory.execute("PRAGMA database_list").fetchone()[2]
+    return connect(path) if path else db.directory
+
+
+def open_database(directory: Optional[str] = None, shards: int = 1) -> ShardedDatabase:
+    """Open (creating if needed) a directory database and ``shards`` shard files
+    under ``directory``, or a single in-memory shard when no directory is given.
+
+    Opening with more shards than before only registers the new ones; existing
+    patients stay where they are until ``ShardedDatabase.rebalance`` runs.
+    """
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        directory_conn = connect(os.path.join(directory, "directory.db"))
+    else:
+        directory_conn = connect(":memory:")
+    create_directory_schema(directory_conn)
+
+    def connect_shard(name: str) -> sqlite3.Connection:
+        conn = connect(os.path.join(directory, f"{name}.db") if directory else ":memory:")
+        create_schema(conn)
+        return conn
+
+    directory_conn.executemany(
+        "INSERT OR IGNORE INTO shards VALUES (?)",
+        [(f"shard-{i:03d}",) for i in range(shards if directory else 1)],
+    )
+    directory_conn.commit()
+    return ShardedDatabase(directory_conn, connect_shard)
+
+
+def setup_database():
+    """Open the configured database (``DB_DIR``, ``DB_SHARDS``), loading sample
+    data when it is new"""
+    db = open_database(os.getenv("DB_DIR"), int(os.getenv("DB_SHARDS", "1")))
+    if db.directory.execute("SELECT 1 FROM patient_directory LIMIT 1").fetchone():
+        if not db.directory.execute("SELECT 1 FROM appointment_stats LIMIT 1").fetchone():
+            rebuild_stats(db)  # Database predates the event log
+        if not db.directory.execute("SELECT 1 FROM doctor_slots LIMIT 1").fetchone():
+            db.rebuild_slot_claims()  # Database predates the slot claims
+        return db
+
     # Sample data
     patients_data = [
         (1, "John Smith", "555-010-1001", "1985-03-15"),
         (2, "Maria Garcia", "555-010-2001", "1990-07-22"),
     ]
-    cursor.executemany("INSERT INTO patients VALUES (?, ?, ?, ?)", patients_data)
+    db.add_patients(patients_data)
 
     # Sample appointments
     base_date = datetime.now() + timedelta(days=1)
@@ -72,12 +322,27 @@ def setup_database():
             "scheduled",
         ),
     ]
+    db.add_appointments(appointments_data)
+
+    cursor = db.directory.cursor()
+    doctors_data = [(1, "Dr. Anderson"), (2, "Dr. Brown"), (3, "Dr. Wilson")]
+    cursor.executemany("INSERT INTO doctors VALUES (?, ?)", doctors_data)
+
+    # Weekday office hours: Anderson and Brown book 30-minute slots,
+    # Wilson books 15-minute follow-ups
+    schedules_data = [
+        (doctor_id, weekday, "09:00", "17:00", 15 if doctor_id == 3 else 30)
+        for doctor_id, _ in doctors_data
+        for weekday in range(5)
+    ]
     cursor.executemany(
-        "INSERT INTO appointments VALUES (?, ?, ?, ?, ?, ?, ?)", appointments_data
+        "INSERT INTO doctor_schedules VALUES (?, ?, ?, ?, ?)", schedules_data
     )
 
-    conn.commit()
-    return conn
+    db.directory.commit()
+    rebuild_stats(db)
+    db.rebuild_slot_claims()
+    return db
 
 
-DB_CONN = setup_database()
+DB = setup_database()
@@ -0,0 +1,253 @@
+"""Appointment event outboxes, folded into a history with incrementally
+maintained stats"""
+
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Optional
+
+from app.sharding import Shard, ShardedDatabase
+
+STATUSES = ("scheduled", "confirmed", "cancelled")
+
+logger = logging.getLogger(__name__)
+
+
+def write_events(conn: sqlite3.Connection, events: list[tuple]):
+    """Append ``events`` to the shard outbox on ``conn``, inside the caller's
+    open transaction, so they commit or roll back with the change itself"""
+    now = datetime.now().isoformat(timespec="seconds")
+    conn.executemany(
+        """INSERT INTO appointment_events
+        (appointment_id, doctor_name, appointment_date, old_status, new_status, recorded_at)
+        VALUES (?, ?, ?, ?, ?, ?)""",
+        [(*event, now) for event in events],
+    )
+
+
+def rebuild_stats(db: ShardedDatabase):
+    """Recompute ``appointment_stats`` from the appointments on every shard
+    (after a bulk import, or for a database that predates the event log).
+
+    Every shard is write-locked (BEGIN IMMEDIATE, in name order like
+    ``move_patient``) until the new stats and fold offsets are committed, so
+    no event can commit, be folded or be pruned between the recount and the
+    offsets moving past it."""
+    counts = Counter()
+    offsets = []
+    shards = sorted(db.shards, key=lambda shard: shard.name)
+    with ExitStack() as stack:
+        for shard in shards:
+            stack.enter_context(shard.lock)
+            shard.conn.execute("BEGIN IMMEDIATE")
+            stack.callback(shard.conn.rollback)
+            for day, doctor, status, count in shard.conn.execute(
+                """SELECT appointment_date, doctor_name, status, COUNT(*)
+                FROM appointments GROUP BY appointment_date, doctor_name, status"""
+            ):
+                counts[(day, doctor, status)] += count
+            last = shard.conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM appointment_events"
+            ).fetchone()[0]
+            offsets.append((shard.name, last))
+        with db.directory_lock:
+            db.directory.execute("DELETE FROM appointment_stats")
+            db.directory.executemany(
+                "INSERT INTO appointment_stats VALUES (?, ?, ?, ?)",
+                [(*key, count) for key, count in counts.items()],
+            )
+            db.directory.executemany(
+                "INSERT OR REPLACE INTO event_offsets VALUES (?, ?)", offsets
+            )
+            db.directory.commit()
+
+
+class EventLog:
+    """Folds the shards' appointment event outboxes into the directory.
+
+    An event is ``(appointment_id, doctor, day, old_status, new_status)``,
+    with ``old_status`` None for a new booking. Writers add events to their
+    shard's ``appointment_events`` outbox in the transaction that makes the
+    change (``write_events``), so an event exists exactly when its change
+    committed, and then ``notify`` the log. One folder thread waits
+    ``fold_delay`` seconds for more commits to join, then copies the notified
+    shards' new events into the directory history and folds them into
+    ``appointment_stats`` (appointments per day, doctor and status), which is
+    what ``stats`` reads: its cost depends on the days and doctors asked
+    for, not on how many events were ever logged.
+
+    A shard's batch is folded in one directory transaction that also moves
+    the shard's offset in ``event_offsets``, so every event is folded once,
+    even with several processes folding. A fold that fails leaves the events
+    in the outbox and is retried after ``retry_delay`` seconds. Folded events
+    are pruned from the outbox every ``batch_size`` events.
+    """
+
+    def __init__(
+        self,
+        db: ShardedDatabase,
+        conn: Optional[sqlite3.Connection] = None,
+        batch_size: int = 5000,
+        retry_delay: float = 1.0,
+        fold_delay: float = 0.1,
+    ):
+        self.db = db
+        # A dedicated directory connection waits out other writers (e.g. a
+        # rebalance in another process); the shared one can fail outright
+        # when one of its readers holds an older snapshot
+        self.conn = conn or db.directory
+        self._lock = db.directory_lock if self.conn is db.directory else threading.Lock()
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self.fold_delay = fold_delay
+        self._cond = threading.Condition()
+        # Names of the shards notified since the last fold; None for all
+        self._notified: set[Optional[str]] = set()
+        self._flusher: Optional[threading.Thread] = None
+        self._fold_lock = threading.Lock()
+        # Shard name -> offset up to which its outbox was last pruned
+        self._pruned: dict[str, int] = {}
+        self.batches = 0
+        self.events = 0
+        self.failures = 0
+
+    def notify(self, shard: Optional[Shard] = None):
+        """Fold ``shard``'s (default: every shard's) new outbox events in the
+        background"""
+        with self._cond:
+            self._notified.add(shard.name if shard else None)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._run, daemon=True)
+                self._flusher.start()
+            self._cond.notify()
+
+    def flush(self, shards: Optional[list[Shard]] = None):
+        """Fold every event committed so far on ``shards`` (default: all)"""
+        with self._fold_lock:
+            for shard in self.db.shards if shards is None else shards:
+                while self._fold(shard) == self.batch_size:
+                    pass
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._notified:
+                    self._cond.wait()
+            time.sleep(self.fold_delay)
+            with self._cond:
+                # Notifications arriving during the fold trigger one more
+                notified, self._notified = self._notified, set()
+            shards = [
+                shard
+                for shard in self.db.shards
+                if None in notified or shard.name in notified
+            ]
+            try:
+                self.flush(shards)
+            except Exception as e:
+                # The events stay in the outboxes; fold them on the next try
+                self.failures += 1
+                logger.warning("folding appointment events failed, retrying: %s", e)
+                with self._cond:
+                    self._cond.wait(self.retry_delay)
+                    self._notified |= notified
+
+    def _offset(self, shard: Shard) -> int:
+        row = self.conn.execute(
+            "SELECT last_event_id FROM event_offsets WHERE shard = ?", (shard.name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _fold(self, shard: Shard) -> int:
+        """Fold the next batch of ``shard``'s outbox; the number of events read"""
+        with self._lock:
+            offset = self._offset(shard)
+        # Under the shard's lock, so a writer's uncommitted events on the shared
+        # connection aren't read
+        with shard.lock:
+            events = shard.conn.execute(
+                """SELECT id, appointment_id, doctor_name, appointment_date,
+                    old_status, new_status, recorded_at
+                FROM appointment_events WHERE id > ? ORDER BY id LIMIT ?""",
+                (offset, self.batch_size),
+            ).fetchall()
+        if not events:
+            return 0
+
+        conn = self.conn
+        with self._lock:
+            try:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                # Another process may have folded some of them meanwhile
+                offset = self._offset(shard)
+                fresh = [event for event in events if event[0] > offset]
+                deltas = Counter()
+                for _, _, doctor, day, old_status, new_status, _ in fresh:
+                    if old_status:
+                        deltas[(day, doctor, old_status)] -= 1
+                    deltas[(day, doctor, new_status)] += 1
+                conn.executemany(
+                    """INSERT INTO appointment_events
+                    (appointment_id, doctor_name, appointment_date, old_status, new_status, recorded_at)
+                    VALUES (?, ?, ?, ?, ?, ?)""",
+                    [event[1:] for event in fresh],
+                )
+                conn.executemany(
+                    """INSERT INTO appointment_stats VALUES (?, ?, ?, ?)
+                    ON CONFLICT (day, doctor_name, status)
+                    DO UPDATE SET count = count + excluded.count""",
+                    [(*key, delta) for key, delta in deltas.items() if delta],
+                )
+                conn.execute(
+                    """INSERT INTO event_offsets VALUES (?, ?)
+                    ON CONFLICT (shard) DO UPDATE
+                    SET last_event_id = MAX(last_event_id, excluded.last_event_id)""",
+                    (shard.name, events[-1][0]),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        if fresh:
+            self.batches += 1
+            self.events += len(fresh)
+        self._prune(shard, events[-1][0])
+        return len(events)
+
+    def _prune(self, shard: Shard, offset: int):
+        """Delete folded events from the outbox once enough have piled up"""
+        if offset - self._pruned.get(shard.name, 0) < self.batch_size:
+            return
+        with shard.lock:
+            shard.conn.execute("DELETE FROM appointment_events WHERE id <= ?", (offset,))
+            shard.conn.commit()
+        self._pruned[shard.name] = offset
+
+    def stats(self, start: str, end: str, doctor: Optional[str] = None) -> dict:
+        """Appointment counts and cancellation rate per doctor for days in
+        ``[start, end]`` (YYYY-MM-DD) from the folded counters. Changes
+        committed since the last fold (normally within ``fold_delay``) are
+        not counted yet; ``flush`` first for an exact count."""
+        sql = """SELECT doctor_name, status, SUM(count) FROM appointment_stats
+            WHERE day BETWEEN ? AND ?"""
+        params = [start, end]
+        if doctor:
+            sql += " AND doctor_name = ?"
+            params.append(doctor)
+        doctors: dict[str, dict] = {}
+        for name, status, count in self.db.directory.execute(
+            sql + " GROUP BY doctor_name, status", params
+        ):
+            doctors.setdefault(name, dict.fromkeys(STATUSES, 0))[status] = count
+        for counts in doctors.values():
+            counts["total"] = sum(counts[status] for status in STATUSES)
+            counts["cancellation_rate"] = (
+                round(counts["cancelled"] / counts["total"], 4) if counts["total"] else 0.0
+            )
+        return {"start": start, "end": end, "doctors": doctors}
+
@@ -0,0 +1,78 @@
+"""Request-id deduplication for client retries"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+class IdempotencyConflict(Exception):
+    """A request key was reused for a different payload"""
+
+
+class IdempotencyStore:
+    """Bounded, TTL-evicted map from request key to its (possibly pending) result.
+
+    The first request for a key runs; retries that arrive while it is still
+    in flight await the same future, and retries after it completed get the
+    cached result. Failed requests are forgotten so a retry can run again.
+    Completed entries expire ``ttl_seconds`` after completion; beyond
+    ``max_entries`` the oldest completed entries are evicted first. Both
+    follow completion order, so eviction only looks at the entries it drops.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (fingerprint, future, completed at or None while in flight)
+        self._entries: dict[Hashable, list] = {}
+        # Completed keys, oldest completion first -> completed at
+        self._completed: OrderedDict[Hashable, float] = OrderedDict()
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _evict(self, now: float):
+        while self._completed:
+            key, done_at = next(iter(self._completed.items()))
+            if now - done_at <= self.ttl_seconds and len(self._entries) < self.max_entries:
+                break
+            del self._completed[key]
+            del self._entries[key]
+
+    async def run(
+        self,
+        key: Hashable,
+        fingerprint: Optional[str],
+        factory: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """Return the result for ``key``, running ``factory`` only once"""
+        now = time.monotonic()
+        self._evict(now)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] != fingerprint:
+                raise IdempotencyConflict(key)
+            self.hits += 1
+            # Shield so a retry that disconnects doesn't cancel the original
+            return await asyncio.shield(entry[1])
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [fingerprint, future, None]
+        self._entries[key] = entry
+        try:
+            result = await factory()
+        except BaseException as e:
+            self._entries.pop(key, None)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # Nobody else may be waiting; avoid "exception never retrieved"
+                future.exception()
+            raise
+        future.set_result(result)
+        entry[2] = self._completed[key] = time.monotonic()
+        return result
@@ -0,0 +1,54 @@
+"""Patient-portal helpers: signed patient tokens and keyset cursors"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import time
+from typing import Optional
+
+# Without PORTAL_SECRET tokens are signed with a per-process key, so they stop
+# working when the server restarts
+SECRET = (os.getenv("PORTAL_SECRET") or secrets.token_hex(32)).encode()
+TOKEN_TTL = int(os.getenv("PORTAL_TOKEN_TTL_SECONDS", "3600"))
+
+
+def _sign(payload: str) -> str:
+    return hmac.new(SECRET, payload.encode(), hashlib.sha256).hexdigest()
+
+
+def issue_token(patient_id: int) -> str:
+    """A bearer token for ``patient_id``'s records, valid for ``TOKEN_TTL``"""
+    payload = f"{patient_id}.{int(time.time()) + TOKEN_TTL}"
+    return f"{payload}.{_sign(payload)}"
+
+
+def token_patient(token: str) -> Optional[int]:
+    """The patient a token was issued for, or None if forged or expired"""
+    try:
+        patient_id, expires, signature = token.split(".")
+        if not hmac.compare_digest(signature, _sign(f"{patient_id}.{expires}")):
+            return None
+        if int(expires) < time.time():
+            return None
+        return int(patient_id)
+    except ValueError:
+        return None
+
+
+def encode_cursor(appointment: dict) -> str:
+    """Opaque keyset cursor resuming after ``appointment``"""
+    key = f"{appointment['date']}|{appointment['time']}|{appointment['id']}"
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """(date, time, id) from ``encode_cursor``; raises ValueError if malformed"""
+    try:
+        day, time_of_day, appointment_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        )
+    except ValueError:  # Also covers bad base64 and UTF-8
+        raise ValueError(f"invalid cursor {cursor!r}")
+    return day, time_of_day, int(appointment_id)
@@ -0,0 +1,178 @@
+"""Opt-in per-request profiling: sampled stacks and per-node timings
+
+A profiled request runs the graph under a sampling profiler that reads the
+invoking thread's stack every ``interval`` seconds from a background thread
+(no tracing hooks, so unprofiled code is not slowed down), and a callback
+handler that times each graph node. On exit it writes:
+
+- ``<name>.collapsed``: one ``frame;frame;...;leaf count`` line per distinct
+  stack, rooted at the graph node, for flamegraph.pl or speedscope
+- ``<name>.json``: wall time per node plus where its samples landed (LLM
+  HTTP, pydantic, LangGraph, LangChain, app code, other)
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Any, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Path fragments that identify where a sample's time went, checked leaf first
+CATEGORIES = [
+    ("llm", ("/anthropic/", "/httpx/", "/httpcore/", "/ssl.py", "/socket.py")),
+    ("pydantic", ("/pydantic/", "/pydantic_core/")),
+    ("langgraph", ("/langgraph/",)),
+    ("langchain", ("/langchain_core/", "/langchain_anthropic/")),
+    ("app", ("/app/", "/graph/")),
+]
+
+
+def categorize(filenames: list[str]) -> str:
+    """Category of the innermost frame that belongs to a known package"""
+    for filename in reversed(filenames):
+        for category, fragments in CATEGORIES:
+            if any(fragment in filename for fragment in fragments):
+                return category
+    return "other"
+
+
+def _label(code) -> str:
+    filename = code.co_filename
+    for marker in ("site-packages/", "/package/"):
+        if marker in filename:
+            filename = filename.split(marker, 1)[1]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+class NodeTimer(BaseCallbackHandler):
+    """Times graph nodes and tracks which node the invoking thread is in"""
+
+    def __init__(self):
+        self.current = "graph"
+        self.wall: defaultdict[str, float] = defaultdict(float)
+        self.calls: Counter = Counter()
+        self._running: dict[Any, tuple[str, float]] = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        # Nested runnables inside a node carry the same metadata; only time the
+        # node's own run
+        if node and kwargs.get("name") == node:
+            self._running[run_id] = (node, time.perf_counter())
+            self.current = node
+
+    def _finish(self, run_id):
+        started = self._running.pop(run_id, None)
+        if started:
+            node, start = started
+            self.wall[node] += time.perf_counter() - start
+            self.calls[node] += 1
+            self.current = "graph"
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
+
+
+class RequestProfiler:
+    """Context manager profiling the calling thread until exit.
+
+    Pass ``profiler.callbacks`` in the graph config so node timings are
+    recorded.
+    """
+
+    def __init__(self, directory: str, label: str, interval: float = 0.005):
+        self.directory = directory
+        self.name = f"{time.strftime('%Y%m%dT%H%M%S')}-{label}"
+        self.interval = interval
+        self.timer = NodeTimer()
+        self.callbacks = [self.timer]
+        self.stacks: Counter = Counter()
+        self.node_categories: defaultdict[str, Counter] = defaultdict(Counter)
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self._target = threading.get_ident()
+        self._root = sys._getframe(1)
+        self._start = time.perf_counter()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            codes = []
+            while frame is not None and frame is not self._root:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            if not codes:
+                continue
+            codes.reverse()
+            node = self.timer.current
+            self.stacks[";".join([f"node:{node}", *map(_label, codes)])] += 1
+            self.node_categories[node][
+                categorize([code.co_filename for code in codes])
+            ] += 1
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._sampler.join()
+        self.elapsed = time.perf_counter() - self._start
+        self.write()
+        return False
+
+    def summary(self) -> dict:
+        samples = sum(self.stacks.values())
+        return {
+            "name": self.name,
+            "wall_ms": round(self.elapsed * 1000, 1),
+            "samples": samples,
+            "interval_ms": self.interval * 1000,
+            "nodes": {
+                node: {
+                    "calls": self.timer.calls[node],
+                    "wall_ms": round(self.timer.wall[node] * 1000, 1),
+                    "samples": dict(self.node_categories[node].most_common()),
+                }
+                for node in sorted(
+                    set(self.timer.wall) | set(self.node_categories),
+                    key=lambda n: -self.timer.wall.get(n, 0),
+                )
+            },
+        }
+
+    def write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, self.name)
+        with open(f"{path}.collapsed", "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(f"{path}.json", "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+
+def should_profile(header: Optional[str]) -> bool:
+    """Profile when ``PROFILE_DIR`` is set and the request asks for it via the
+    ``X-Profile`` header or falls within ``PROFILE_SAMPLE_RATE``"""
+    if not os.getenv("PROFILE_DIR"):
+        return False
+    if header and header.lower() in ("1", "true", "yes"):
+        return True
+    return random.random() < float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+
+def request_profiler(thread_id: str) -> RequestProfiler:
+    return RequestProfiler(
+        os.environ["PROFILE_DIR"],
+        label=f"{thread_id[:8]}-{uuid.uuid4().hex[:6]}",
+        interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+    )
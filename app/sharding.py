@@ -0,0 +1,497 @@
+"""Patient-sharded storage: consistent hashing plus a small directory index"""
+
+import bisect
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Callable, Iterable, Optional
+
+
+def bump_versions(conn: sqlite3.Connection, patient_ids: Iterable[int]):
+    """Give patients a new appointments version tag, inside the caller's open
+    transaction on their shard. Tags are random rather than counters, so a
+    tag handed out before an in-memory database was recreated never matches
+    again."""
+    conn.executemany(
+        """INSERT INTO patient_versions VALUES (?, random())
+        ON CONFLICT (patient_id) DO UPDATE SET version = random()""",
+        [(patient_id,) for patient_id in set(patient_ids)],
+    )
+
+
+class HashRing:
+    """Consistent hash ring over shard names.
+
+    Each shard owns ``vnodes`` points on the ring, so adding a shard moves
+    only about 1/N of the patients, taken evenly from every existing shard.
+    """
+
+    def __init__(self, shards: Iterable[str], vnodes: int = 64):
+        self._points = sorted(
+            (self._hash(f"{shard}#{i}"), shard) for shard in shards for i in range(vnodes)
+        )
+        self._keys = [point for point, _ in self._points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def shard_for(self, patient_id: int) -> str:
+        i = bisect.bisect(self._keys, self._hash(str(patient_id))) % len(self._keys)
+        return self._points[i][1]
+
+
+class Shard:
+    """One database file holding a subset of patients and their appointments"""
+
+    def __init__(self, name: str, conn: sqlite3.Connection):
+        self.name = name
+        self.conn = conn
+        self.lock = threading.RLock()  # serializes write transactions on conn
+
+    def __repr__(self) -> str:
+        return f"Shard({self.name!r})"
+
+
+class ShardedDatabase:
+    """Routes patients and their appointments to shards.
+
+    The directory database records which shard each patient lives on (and
+    their identity, for ``verify_patient``), hands out globally unique
+    appointment ids and maps them to patients, and holds the doctor reference
+    data. Placement of new patients follows the hash ring; lookups always go
+    through the directory, so patients can be moved online by ``rebalance``.
+    Shards listed in the directory but not yet opened are connected lazily,
+    so a running server picks up shards added by a rebalance.
+    """
+
+    def __init__(
+        self,
+        directory: sqlite3.Connection,
+        connect: Callable[[str], sqlite3.Connection],
+        vnodes: int = 64,
+    ):
+        self.directory = directory
+        self.directory_lock = threading.RLock()
+        self._connect = connect
+        self._shards: dict[str, Shard] = {}
+        self._open_lock = threading.Lock()
+        self.vnodes = vnodes
+        self.reload()
+
+    def reload(self):
+        """Re-read shard membership from the directory"""
+        self.names = [
+            row[0] for row in self.directory.execute("SELECT name FROM shards ORDER BY name")
+        ]
+        self.ring = HashRing(self.names, self.vnodes)
+
+    # -------------------------------------------------------------------------
+    # Shards
+    # -------------------------------------------------------------------------
+
+    def shard(self, name: str) -> Shard:
+        shard = self._shards.get(name)
+        if shard is None:
+            with self._open_lock:
+                shard = self._shards.get(name)
+                if shard is None:
+                    shard = self._shards[name] = Shard(name, self._connect(name))
+        return shard
+
+    @property
+    def shards(self) -> list[Shard]:
+        return [self.shard(name) for name in self.names]
+
+    def add_shards(self, names: Iterable[str]):
+        with self.directory_lock:
+            self.directory.executemany(
+                "INSERT OR IGNORE INTO shards VALUES (?)", [(name,) for name in names]
+            )
+            self.directory.commit()
+        self.reload()
+
+    # -------------------------------------------------------------------------
+    # Routing
+    # -------------------------------------------------------------------------
+
+    def shard_of_patient(self, patient_id: int) -> Shard:
+        row = self.directory.execute(
+            "SELECT shard FROM patient_directory WHERE patient_id = ?", (patient_id,)
+        ).fetchone()
+        return self.shard(row[0] if row else self.ring.shard_for(patient_id))
+
+    def shard_of_appointment(self, appointment_id: int) -> Optional[Shard]:
+        row = self.directory.execute(
+            """SELECT p.shard FROM appointment_directory a
+            JOIN patient_directory p ON p.patient_id = a.patient_id
+            WHERE a.appointment_id = ?""",
+            (appointment_id,),
+        ).fetchone()
+        return self.shard(row[0]) if row else None
+
+    def _lookup(self, sql: str, keys: list[int]) -> list[tuple]:
+        """Run an ``IN (...)`` directory query in chunks below SQLite's limit"""
+        rows = []
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            rows += self.directory.execute(
+                sql.format(",".join("?" * len(chunk))), chunk
+            ).fetchall()
+        return rows
+
+    def appointments_by_shard(self, appointment_ids: list[int]) -> dict[Shard, list[int]]:
+        groups: dict[Shard, list[int]] = {}
+        rows = self._lookup(
+            """SELECT a.appointment_id, p.shard FROM appointment_directory a
+            JOIN patient_directory p ON p.patient_id = a.patient_id
+            WHERE a.appointment_id IN ({})""",
+            appointment_ids,
+        )
+        for appointment_id, name in rows:
+            groups.setdefault(self.shard(name), []).append(appointment_id)
+        return groups
+
+    def on_patient_shard(self, patient_id: int, op: Callable[[Shard], Any]) -> Any:
+        """Run ``op`` on the patient's shard. ``op`` returns None when the
+        patient's rows aren't there; if a rebalance moved the patient while it
+        ran, it is retried once on the new shard."""
+        shard = self.shard_of_patient(patient_id)
+        result = op(shard)
+        if result is None:
+            moved = self.shard_of_patient(patient_id)
+            if moved is not shard:
+                result = op(moved)
+        return result
+
+    def on_appointment_shard(
+        self, appointment_id: int, op: Callable[[Shard], Any]
+    ) -> Any:
+        """Like ``on_patient_shard``, routed by appointment id"""
+        shard = self.shard_of_appointment(appointment_id)
+        if shard is None:
+            return None
+        result = op(shard)
+        if result is None:
+            moved = self.shard_of_appointment(appointment_id)
+            if moved is not None and moved is not shard:
+                result = op(moved)
+        return result
+
+    def patient_version(self, patient_id: int) -> Optional[int]:
+        """The patient's appointments version tag (0 before any write), or None
+        for an unknown patient"""
+
+        def read(shard: Shard) -> Optional[int]:
+            row = shard.conn.execute(
+                """SELECT COALESCE(v.version, 0) FROM patients p
+                LEFT JOIN patient_versions v ON v.patient_id = p.id
+                WHERE p.id = ?""",
+                (patient_id,),
+            ).fetchone()
+            return row[0] if row else None
+
+        return self.on_patient_shard(patient_id, read)
+
+    def find_patient(
+        self, full_name: str, phone_number: str, date_of_birth: str
+    ) -> Optional[tuple[int, str]]:
+        return self.directory.execute(
+            """SELECT patient_id, full_name FROM patient_directory
+            WHERE full_name = ? AND phone_number = ? AND date_of_birth = ?""",
+            (full_name, phone_number, date_of_birth),
+        ).fetchone()
+
+    # -------------------------------------------------------------------------
+    # Writes that span the directory and shards
+    # -------------------------------------------------------------------------
+
+    def add_patients(self, rows: list[tuple]):
+        """Insert (id, full_name, phone_number, date_of_birth) rows"""
+        placed = [(*row, self.ring.shard_for(row[0])) for row in rows]
+        with self.directory_lock:
+            self.directory.executemany(
+                "INSERT INTO patient_directory VALUES (?, ?, ?, ?, ?)", placed
+            )
+            self.directory.commit()
+        for name in self.names:
+            shard = self.shard(name)
+            with shard.lock:
+                shard.conn.executemany(
+                    "INSERT INTO patients VALUES (?, ?, ?, ?)",
+                    [row[:4] for row in placed if row[4] == name],
+                )
+                shard.conn.commit()
+
+    def add_appointments(self, rows: list[tuple]) -> list[int]:
+        """Insert (id or None, patient_id, date, time, doctor, type, status)
+        rows; returns their appointment ids"""
+        with self.directory_lock:
+            ids = []
+            for row in rows:
+                cursor = self.directory.execute(
+                    "INSERT INTO appointment_directory VALUES (?, ?)", (row[0], row[1])
+                )
+                ids.append(cursor.lastrowid)
+            self.directory.commit()
+        placement = dict(
+            self._lookup(
+                "SELECT patient_id, shard FROM patient_directory WHERE patient_id IN ({})",
+                sorted({row[1] for row in rows}),
+            )
+        )
+        by_shard: dict[str, list[tuple]] = {}
+        for appointment_id, row in zip(ids, rows):
+            by_shard.setdefault(placement[row[1]], []).append((appointment_id, *row[1:]))
+        for name, shard_rows in by_shard.items():
+            shard = self.shard(name)
+            with shard.lock:
+                shard.conn.executemany(
+                    "INSERT INTO appointments VALUES (?, ?, ?, ?, ?, ?, ?)", shard_rows
+                )
+                bump_versions(shard.conn, [row[1] for row in shard_rows])
+                shard.conn.commit()
+        return ids
+
+    def _write_grouped(
+        self,
+        sql: str,
+        rows: list[tuple],
+        shard_names: list[str],
+        patient_column: Optional[int] = None,
+    ):
+        """executemany ``sql`` on each shard with the rows placed there; with
+        ``patient_column``, the rows' patients get new version tags in the same
+        transaction"""
+        by_shard: dict[str, list[tuple]] = {}
+        for row, name in zip(rows, shard_names):
+            by_shard.setdefault(name, []).append(row)
+        for name, shard_rows in by_shard.items():
+            shard = self.shard(name)
+            with shard.lock:
+                shard.conn.executemany(sql, shard_rows)
+                if patient_column is not None:
+                    bump_versions(shard.conn, [row[patient_column] for row in shard_rows])
+                shard.conn.commit()
+
+    def upsert_patients(self, rows: list[tuple]):
+        """Insert or update (id, full_name, phone_number, date_of_birth) rows;
+        existing patients stay on their current shard"""
+        placement = dict(
+            self._lookup(
+                "SELECT patient_id, shard FROM patient_directory WHERE patient_id IN ({})",
+                [row[0] for row in rows],
+            )
+        )
+        names = [placement.get(row[0]) or self.ring.shard_for(row[0]) for row in rows]
+        with self.directory_lock:
+            self.directory.executemany(
+                """INSERT INTO patient_directory VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(patient_id) DO UPDATE SET full_name = excluded.full_name,
+                    phone_number = excluded.phone_number,
+                    date_of_birth = excluded.date_of_birth""",
+                [(*row, name) for row, name in zip(rows, names)],
+            )
+            self.directory.commit()
+        self._write_grouped(
+            """INSERT INTO patients VALUES (?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET full_name = excluded.full_name,
+                phone_number = excluded.phone_number,
+                date_of_birth = excluded.date_of_birth""",
+            rows,
+            names,
+        )
+
+    def upsert_appointments(self, rows: list[tuple]) -> int:
+        """Insert or update (id, patient_id, date, time, doctor, type, status)
+        rows on their patient's shard; returns how many were skipped because
+        the patient is unknown"""
+        placement = dict(
+            self._lookup(
+                "SELECT patient_id, shard FROM patient_directory WHERE patient_id IN ({})",
+                sorted({row[1] for row in rows}),
+            )
+        )
+        known = [row for row in rows if row[1] in placement]
+        with self.directory_lock:
+            self.directory.executemany(
+                """INSERT INTO appointment_directory VALUES (?, ?)
+                ON CONFLICT(appointment_id) DO UPDATE SET patient_id = excluded.patient_id""",
+                [row[:2] for row in known],
+            )
+            self.directory.commit()
+        self._write_grouped(
+            """INSERT INTO appointments VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET patient_id = excluded.patient_id,
+                appointment_date = excluded.appointment_date,
+                appointment_time = excluded.appointment_time,
+                doctor_name = excluded.doctor_name,
+                appointment_type = excluded.appointment_type,
+                status = excluded.status""",
+            known,
+            [placement[row[1]] for row in known],
+            patient_column=1,
+        )
+        return len(rows) - len(known)
+
+    def allocate_appointment_id(self, patient_id: int) -> int:
+        with self.directory_lock:
+            cursor = self.directory.execute(
+                "INSERT INTO appointment_directory (patient_id) VALUES (?)", (patient_id,)
+            )
+            self.directory.commit()
+            return cursor.lastrowid
+
+    def release_appointment_id(self, appointment_id: int):
+        """Give back an id whose booking failed"""
+        with self.directory_lock:
+            self.directory.execute(
+                "DELETE FROM appointment_directory WHERE appointment_id = ?",
+                (appointment_id,),
+            )
+            self.directory.commit()
+
+    # -------------------------------------------------------------------------
+    # Doctor slot claims
+    # -------------------------------------------------------------------------
+
+    def claim_slot(self, doctor: str, day: str, time: str, appointment_id: int) -> bool:
+        """Claim a doctor's slot for an appointment about to be booked; False
+        if another appointment, on any shard, already holds it"""
+        with self.directory_lock:
+            try:
+                self.directory.execute(
+                    "INSERT INTO doctor_slots VALUES (?, ?, ?, ?)",
+                    (doctor, day, time, appointment_id),
+                )
+                self.directory.commit()
+                return True
+            except sqlite3.IntegrityError:
+                self.directory.rollback()
+                return False
+
+    def release_slots(self, appointment_ids: list[int]):
+        """Drop the slot claims of cancelled appointments (or failed bookings)"""
+        if not appointment_ids:
+            return
+        with self.directory_lock:
+            self.directory.executemany(
+                "DELETE FROM doctor_slots WHERE appointment_id = ?",
+                [(appointment_id,) for appointment_id in appointment_ids],
+            )
+            self.directory.commit()
+
+    def rebuild_slot_claims(self):
+        """Recompute ``doctor_slots`` from the live appointments on every shard
+        (after a bulk import, or for a database that predates the claims)"""
+        claims = []
+        for shard in self.shards:
+            claims += shard.conn.execute(
+                """SELECT doctor_name, appointment_date, appointment_time, id
+                FROM appointments WHERE status != 'cancelled'"""
+            ).fetchall()
+        with self.directory_lock:
+            self.directory.execute("DELETE FROM doctor_slots")
+            # Slots already double-booked before the claims keep one claim
+            self.directory.executemany(
+                "INSERT OR IGNORE INTO doctor_slots VALUES (?, ?, ?, ?)", claims
+            )
+            self.directory.commit()
+
+    # -------------------------------------------------------------------------
+    # Rebalancing
+    # -------------------------------------------------------------------------
+
+    def move_patient(self, patient_id: int, target_name: str) -> bool:
+        """Move a patient and their appointments to another shard.
+
+        The source shard's write lock is held for the whole move (BEGIN
+        IMMEDIATE also blocks writers in other processes), so no write to the
+        patient's rows can land between the copy and the delete. Writers
+        that routed to the source before the directory flip find nothing
+        there afterwards and are retried on the new shard by
+        ``on_patient_shard``/``on_appointment_shard``.
+        """
+        source = self.shard_of_patient(patient_id)
+        target = self.shard(target_name)
+        if source is target:
+            return False
+
+        first, second = sorted((source, target), key=lambda shard: shard.name)
+        with first.lock, second.lock:
+            source.conn.execute("BEGIN IMMEDIATE")
+            try:
+                patient = source.conn.execute(
+                    "SELECT * FROM patients WHERE id = ?", (patient_id,)
+                ).fetchone()
+                appointments = source.conn.execute(
+                    "SELECT * FROM appointments WHERE patient_id = ?", (patient_id,)
+                ).fetchall()
+                try:
+                    # Upserts make a move interrupted before the flip safe to redo
+                    if patient:
+                        target.conn.execute(
+                            """INSERT INTO patients VALUES (?, ?, ?, ?)
+                            ON CONFLICT(id) DO NOTHING""",
+                            patient,
+                        )
+                    target.conn.executemany(
+                        """INSERT INTO appointments VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(id) DO UPDATE SET status = excluded.status,
+                            appointment_date = excluded.appointment_date,
+                            appointment_time = excluded.appointment_time,
+                            doctor_name = excluded.doctor_name""",
+                        appointments,
+                    )
+                    bump_versions(target.conn, [patient_id])
+                    target.conn.commit()
+                except sqlite3.Error:
+                    target.conn.rollback()
+                    raise
+
+                with self.directory_lock:
+                    self.directory.execute(
+                        "UPDATE patient_directory SET shard = ? WHERE patient_id = ?",
+                        (target.name, patient_id),
+                    )
+                    self.directory.commit()
+
+                source.conn.execute(
+                    "DELETE FROM appointments WHERE patient_id = ?", (patient_id,)
+                )
+                source.conn.execute("DELETE FROM patients WHERE id = ?", (patient_id,))
+                source.conn.execute(
+                    "DELETE FROM patient_versions WHERE patient_id = ?", (patient_id,)
+                )
+                source.conn.commit()
+            except BaseException:
+                source.conn.rollback()
+                raise
+        return True
+
+    def rebalance(
+        self, batch_size: int = 1000, on_progress: Optional[Callable[[int], None]] = None
+    ) -> int:
+        """Move every patient whose shard differs from the ring's choice.
+
+        Patients are moved one at a time, so the database stays online and each
+        patient is only briefly locked. Returns the number of patients moved.
+        """
+        self.reload()
+        moved = 0
+        after_id = 0
+        while True:
+            rows = self.directory.execute(
+                """SELECT patient_id, shard FROM patient_directory
+                WHERE patient_id > ? ORDER BY patient_id LIMIT ?""",
+                (after_id, batch_size),
+            ).fetchall()
+            if not rows:
+                return moved
+            for patient_id, name in rows:
+                target = self.ring.shard_for(patient_id)
+                if target != name and self.move_patient(patient_id, target):
+                    moved += 1
+            after_id = rows[-1][0]
+            if on_progress:
+                on_progress(moved)
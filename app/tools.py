@@ -1,18 +1,43 @@
 """LangChain tools for patient and appointment operations"""
 
+import atexit
+import functools
+import os
+from datetime import datetime
+from typing import Optional
 from langchain_core.tools import tool
-from app.database import DB_CONN
+from app.availability import FreeSlotIndex, book_slot
+from app.database import DB, directory_connection
+from app.events import EventLog, write_events
+from app.sharding import bump_versions
+from app.writer import CommitError, StatusWriter
+
+SLOT_INDEX = FreeSlotIndex.from_database(
+    DB.directory, appointment_conns=[shard.conn for shard in DB.shards]
+)
+
+# Status-change history and the per-doctor/day stats behind /stats
+EVENTS = EventLog(
+    DB,
+    directory_connection(DB),
+    fold_delay=float(os.getenv("EVENT_FOLD_DELAY_MS", "100")) / 1000,
+)
+
+
+def _release_slots(freed: list[tuple]):
+    """Return cancelled appointments' (id, doctor, date, time) slots to the
+    index and drop their claims in the directory"""
+    DB.release_slots([appointment_id for appointment_id, _, _, _ in freed])
+    for _, doctor, day, time in freed:
+        if doctor in SLOT_INDEX:
+            with SLOT_INDEX.lock(doctor):
+                SLOT_INDEX.release(doctor, datetime.fromisoformat(day).date(), time)
 
 
 @tool
 def verify_patient(full_name: str, phone_number: str, date_of_birth: str) -> dict:
     """Verify patient in database"""
-    cursor = DB_CONN.cursor()
-    cursor.execute(
-        "SELECT id, full_name FROM patients WHERE full_name = ? AND phone_number = ? AND date_of_birth = ?",
-        (full_name, phone_number, date_of_birth),
-    )
-    result = cursor.fetchone()
+    result = DB.find_patient(full_name, phone_number, date_of_birth)
     return (
         {"verified": True, "user_id": result[0], "name": result[1]}
         if result
@@ -20,33 +45,292 @@ def verify_patient(full_name: str, phone_number: str, date_of_birth: str) -> dic
     )
 
 
-@tool
-def get_appointments(patient_id: int) -> list:
-    """Get patient appointments"""
-    cursor = DB_CONN.cursor()
-    cursor.execute(
-        "SELECT id, appointment_date, appointment_time, doctor_name, appointment_type, status FROM appointments WHERE patient_id = ?",
-        (patient_id,),
+def query_appointments(
+    patient_id: int,
+    statuses: Optional[list[str]] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    after: Optional[tuple] = None,
+    limit: Optional[int] = None,
+    upcoming: bool = False,
+) -> list[dict]:
+    """A patient's appointments ordered by (date, time, id), optionally only
+    with the given statuses, dates in [start, end] (from today on with
+    ``upcoming``), and those after the ``after`` (date, time, id) keyset
+    cursor. Walks idx_appointments_patient_date, so the cost follows the
+    rows returned rather than the patient's history."""
+    if upcoming:
+        start = max(start or "", datetime.now().date().isoformat())
+    sql = """SELECT id, appointment_date, appointment_time, doctor_name, appointment_type, status
+        FROM appointments WHERE patient_id = ?"""
+    params: list = [patient_id]
+    if statuses:
+        sql += f" AND status IN ({','.join('?' * len(statuses))})"
+        params += statuses
+    if start:
+        sql += " AND appointment_date >= ?"
+        params.append(start)
+    if end:
+        sql += " AND appointment_date <= ?"
+        params.append(end)
+    if after:
+        sql += " AND (appointment_date, appointment_time, id) > (?, ?, ?)"
+        params += after
+    sql += " ORDER BY appointment_date, appointment_time, id"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    def fetch(shard):
+        rows = shard.conn.execute(sql, params).fetchall()
+        return rows or None
+
+    appointments = STATUS_WRITER.overlay(
+        patient_id,
+        [
+            {
+                "id": row[0],
+                "date": row[1],
+                "time": row[2],
+                "doctor": row[3],
+                "type": row[4],
+                "status": row[5],
+            }
+            for row in DB.on_patient_shard(patient_id, fetch) or []
+        ],
     )
-    return [
-        {
-            "id": row[0],
-            "date": row[1],
-            "time": row[2],
-            "doctor": row[3],
-            "type": row[4],
-            "status": row[5],
-        }
-        for row in cursor.fetchall()
-    ]
+    if statuses:
+        # The patient's uncommitted updates may have changed a status
+        appointments = [apt for apt in appointments if apt["status"] in statuses]
+    return appointments
 
 
 @tool
-def update_appointment_status(appointment_id: int, status: str) -> dict:
+def get_appointments(
+    patient_id: int,
+    upcoming: bool = False,
+    statuses: Optional[list[str]] = None,
+    limit: Optional[int] = None,
+) -> list:
+    """Get patient appointments, soonest first; optionally only upcoming ones,
+    only some statuses, and at most ``limit``"""
+    return query_appointments(patient_id, statuses, upcoming=upcoming, limit=limit)
+
+
+@tool
+def update_appointment_status(
+    appointment_id: int,
+    status: str,
+    patient_id: Optional[int] = None,
+    wait: bool = True,
+) -> dict:
     """Update appointment status"""
-    cursor = DB_CONN.cursor()
-    cursor.execute(
-        "UPDATE appointments SET status = ? WHERE id = ?", (status, appointment_id)
-    )
-    DB_CONN.commit()
-    return {"success": True, "appointment_id": appointment_id, "new_status": status}
+    # Committed on its own, which keeps concurrent updates of different
+    # shards in parallel; without ``wait`` the write-behind writer commits
+    # it, and "ack" resolves once it is durable
+    if wait:
+        commit_status_updates(
+            [{"appointment_id": appointment_id, "status": status}],
+            _shard_name(appointment_id),
+        )
+        return {
+            "success": True,
+            "appointment_id": appointment_id,
+            "new_status": status,
+            "durable": True,
+        }
+    ack = STATUS_WRITER.submit(appointment_id, status, patient_id)
+    return {
+        "success": True,
+        "appointment_id": appointment_id,
+        "new_status": status,
+        "durable": ack.done(),
+        "ack": ack,
+    }
+
+
+def _commit_shard(shard, ids: list[int], by_id: dict[int, list[dict]]) -> list[int]:
+    """Apply the updates of ``ids`` on ``shard`` in one transaction that also
+    records their events and bumps the patients' version tags, rolled back if
+    anything fails; then free the cancelled appointments' slots. Returns the
+    ids not found there."""
+    shard_updates = [update for i in ids for update in by_id[i]]
+    with shard.lock:
+        try:
+            # Take the write lock before reading, so the update can't fail
+            # on a snapshot another process (e.g. a rebalance) has moved past
+            shard.conn.execute("BEGIN IMMEDIATE")
+            current = shard.conn.execute(
+                f"""SELECT id, doctor_name, appointment_date, appointment_time, status, patient_id
+                FROM appointments WHERE id IN ({",".join("?" * len(ids))})""",
+                ids,
+            ).fetchall()
+            shard.conn.executemany(
+                "UPDATE appointments SET status = :status WHERE id = :appointment_id",
+                shard_updates,
+            )
+            changes, patients, freed = [], [], []
+            for appointment_id, doctor, day, time, old_status, patient_id in current:
+                # Updates of one appointment apply in order, each from the last
+                status, before = old_status, len(changes)
+                for update in by_id[appointment_id]:
+                    if update["status"] != status:
+                        changes.append((appointment_id, doctor, day, status, update["status"]))
+                        status = update["status"]
+                if len(changes) > before:
+                    patients.append(patient_id)
+                if status == "cancelled" and old_status != "cancelled":
+                    freed.append((appointment_id, doctor, day, time))
+            write_events(shard.conn, changes)
+            bump_versions(shard.conn, patients)
+            shard.conn.commit()
+        except Exception:
+            shard.conn.rollback()
+            raise
+    _release_slots(freed)
+    found = {row[0] for row in current}
+    return [i for i in ids if i not in found]
+
+
+def commit_status_updates(updates: list[dict], shard: Optional[str] = None):
+    """Apply status updates ({appointment_id, status}) in order, one
+    transaction per shard (see _commit_shard). ``shard`` names the shard
+    all of them are expected on, which skips the directory lookup; those
+    not found there are routed through the directory. Each shard's events
+    are announced and its slots freed as soon as it commits; if a shard
+    fails, the others stay committed and a CommitError names the failed
+    updates."""
+    by_id: dict[int, list[dict]] = {}
+    for update in updates:
+        by_id.setdefault(update["appointment_id"], []).append(update)
+    if shard in DB.names:
+        groups, retries = {DB.shard(shard): list(by_id)}, 2
+    else:
+        groups, retries = DB.appointments_by_shard(list(by_id)), 1
+    failed = {}
+    # Another pass re-routes updates whose patient a rebalance just moved
+    while True:
+        missed = []
+        for target, ids in groups.items():
+            try:
+                missed += _commit_shard(target, ids, by_id)
+            except Exception as e:
+                failed.update(dict.fromkeys(ids, e))
+                continue
+            EVENTS.notify(target)
+        if not missed or not retries:
+            break
+        groups, retries = DB.appointments_by_shard(missed), retries - 1
+    if failed:
+        raise CommitError(failed)
+
+
+@tool
+def update_appointment_statuses(updates: list[dict]) -> dict:
+    """Apply many status updates ({appointment_id, status}), one transaction per shard"""
+    commit_status_updates(updates)
+    return {"success": True, "updated": len(updates)}
+
+
+@functools.lru_cache(maxsize=65536)
+def _shard_name(appointment_id: int) -> Optional[str]:
+    """The appointment's shard as first looked up, which single updates and
+    writer lanes commit on. After a rebalance it may be stale; that costs a
+    directory lookup, since commit_status_updates re-routes what it misses."""
+    shard = DB.shard_of_appointment(appointment_id)
+    return shard.name if shard else None
+
+
+# Write-behind status updates queued meanwhile share one commit (one fsync)
+# per shard, and shards commit in parallel; each waits at most
+# STATUS_COMMIT_DELAY_MS for others to join
+STATUS_WRITER = StatusWriter(
+    lambda shard, updates: commit_status_updates(updates, shard),
+    max_pending=int(os.getenv("STATUS_QUEUE_SIZE", "1024")),
+    max_delay=float(os.getenv("STATUS_COMMIT_DELAY_MS", "0")) / 1000,
+    lane=_shard_name,
+)
+atexit.register(STATUS_WRITER.flush)
+
+
+@tool
+def find_open_slots(doctor: str, after: Optional[str] = None, limit: int = 5) -> list:
+    """Find the next open slots for a doctor, optionally from a YYYY-MM-DD date on"""
+    name = SLOT_INDEX.resolve_doctor(doctor)
+    if not name:
+        return []
+    start = datetime.fromisoformat(after) if after else None
+    return SLOT_INDEX.next_slots(name, start, limit)
+
+
+@tool
+def book_appointment(
+    patient_id: int, doctor: str, date: str, time: str, appointment_type: str
+) -> dict:
+    """Book a new appointment in an open slot"""
+
+    def book(shard):
+        appointment_id = DB.allocate_appointment_id(patient_id)
+        result = book_slot(
+            shard.conn,
+            shard.lock,
+            SLOT_INDEX,
+            patient_id,
+            doctor,
+            date,
+            time,
+            appointment_type,
+            appointment_id=appointment_id,
+            events=EVENTS,
+            claims=DB,
+        )
+        if not result["success"]:
+            DB.release_appointment_id(appointment_id)
+            if result["reason"] == "patient_not_found":
+                return None
+        return result
+
+    return DB.on_patient_shard(patient_id, book) or {
+        "success": False,
+        "reason": "patient_not_found",
+    }
+
+
+@tool
+def reschedule_appointment(
+    patient_id: int, appointment_id: int, doctor: str, date: str, time: str
+) -> dict:
+    """Move an existing appointment to an open slot"""
+
+    def move(shard):
+        row = shard.conn.execute(
+            "SELECT appointment_type FROM appointments WHERE id = ? AND patient_id = ?",
+            (appointment_id, patient_id),
+        ).fetchone()
+        if row is None:
+            return None
+        new_id = DB.allocate_appointment_id(patient_id)
+        result = book_slot(
+            shard.conn,
+            shard.lock,
+            SLOT_INDEX,
+            patient_id,
+            doctor,
+            date,
+            time,
+            row[0],
+            replaces=appointment_id,
+            appointment_id=new_id,
+            events=EVENTS,
+            claims=DB,
+        )
+        if not result["success"]:
+            DB.release_appointment_id(new_id)
+            if result["reason"] in ("patient_not_found", "appointment_not_found"):
+                return None
+        return result
+
+    return DB.on_patient_shard(patient_id, move) or {
+        "success": False,
+        "reason": "appointment_not_found",
+    }
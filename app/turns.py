@@ -0,0 +1,84 @@
+"""Per-thread turn serialization with coalescing of rapid-fire messages"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class TurnQueue:
+    """Runs at most one graph turn per thread at a time.
+
+    A message for an idle thread starts a turn right away. Messages that
+    arrive while a turn is running wait, and are then merged into a single
+    next turn; every request in that batch gets the batch's response. Turns
+    therefore never race on the same checkpoint, and a burst of N messages
+    with the same options costs at most two turns.
+
+    Only consecutive messages submitted with equal ``options`` (such as
+    whether the request is profiled) are merged, and a batch runs with its
+    own requests' ``run``, so no request's options are applied to, or lost
+    in, another's turn. Batches run in arrival order.
+    """
+
+    def __init__(self):
+        # thread id -> (message, future, run, options) waiting, in arrival order
+        self._pending: dict[
+            str, list[tuple[str, asyncio.Future, Callable, Hashable]]
+        ] = {}
+        self._workers: dict[str, asyncio.Task] = {}
+        self.coalesced = 0
+
+    def busy(self, thread_id: str) -> bool:
+        return thread_id in self._workers
+
+    async def submit(
+        self,
+        thread_id: str,
+        message: str,
+        run: Callable[[list[str]], Awaitable[Any]],
+        options: Hashable = None,
+    ) -> Any:
+        """Queue ``message`` for ``thread_id``; ``run`` executes one turn for
+        the list of messages merged into it, all submitted with ``options``"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(thread_id, []).append((message, future, run, options))
+        if thread_id not in self._workers:
+            self._workers[thread_id] = asyncio.create_task(self._drain(thread_id))
+        # Shield so a client that disconnects doesn't cancel the others' turn
+        return await asyncio.shield(future)
+
+    def _next_batch(self, thread_id: str) -> list:
+        """The leading run of waiting messages that share the first's options"""
+        waiting = self._pending[thread_id]
+        size = next(
+            (i for i, entry in enumerate(waiting) if entry[3] != waiting[0][3]),
+            len(waiting),
+        )
+        batch = waiting[:size]
+        del waiting[:size]
+        if not waiting:
+            del self._pending[thread_id]
+        return batch
+
+    async def _drain(self, thread_id: str):
+        try:
+            while self._pending.get(thread_id):
+                batch = self._next_batch(thread_id)
+                self.coalesced += len(batch) - 1
+                run = batch[0][2]
+                try:
+                    result = await run([message for message, _, _, _ in batch])
+                except Exception as e:
+                    for _, future, _, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                            # Avoid "exception never retrieved" for gone clients
+                            future.exception()
+                    continue
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            del self._workers[thread_id]
+            # Only reachable on cancellation (shutdown); fail whoever is left
+            for _, future, _, _ in self._pending.pop(thread_id, []):
+                future.cancel()
@@ -0,0 +1,201 @@
+"""Write-behind group commit for appointment status updates"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CommitError(Exception):
+    """Raised by a commit function when only part of a batch failed:
+    ``failed`` maps the failed updates' appointment ids to their errors"""
+
+    def __init__(self, failed: dict[int, Exception]):
+        self.failed = failed
+        super().__init__(
+            f"{len(failed)} status updates failed: {next(iter(failed.values()), '')}"
+        )
+
+
+class _Lane:
+    """The updates queued for one shard, and the thread committing them"""
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        lock = threading.Lock()
+        # Notified when updates are queued (the flusher waits on it) and when
+        # a batch is taken or committed (blocked submitters and flush)
+        self.queued = threading.Condition(lock)
+        self.changed = threading.Condition(lock)
+        # (update, future, owner, queued at) in arrival order
+        self.queue: list[tuple[dict, Future, Hashable, float]] = []
+        # The batch being committed, if any
+        self.batch: Optional[list] = None
+        self.flusher: Optional[threading.Thread] = None
+
+
+class StatusWriter:
+    """Queues appointment status updates and commits them in batches.
+
+    ``submit`` returns a Future right away, which resolves once the update
+    is durable (write-behind). Updates are queued per ``lane`` (the
+    appointment's shard, as looked up at submit time), and each lane has a
+    flusher thread, so shards commit in parallel. A flusher takes
+    everything queued on its lane, waiting at most ``max_delay`` seconds
+    after the oldest update for others to join, and hands the lane and the
+    batch to ``commit`` (one transaction, so one fsync). At most
+    ``max_pending`` updates wait per lane; beyond that new ones block until
+    a batch is taken.
+
+    Until an update is committed, reads on behalf of its ``owner`` (e.g.
+    the patient) see it through ``overlay``. While an appointment has an
+    update queued, later ones join the same lane, so they commit in
+    submission order. If ``commit`` raises a CommitError, only the updates
+    it names fail.
+    """
+
+    def __init__(
+        self,
+        commit: Callable[[Hashable, list[dict]], None],
+        max_pending: int = 1024,
+        max_delay: float = 0.002,
+        lane: Optional[Callable[[int], Hashable]] = None,
+    ):
+        self.commit = commit
+        self.max_pending = max_pending
+        self.max_delay = max_delay
+        self.lane = lane or (lambda appointment_id: None)
+        # Guards the lanes, the two maps below and the counters
+        self._lock = threading.Lock()
+        self._lanes: dict[Any, _Lane] = {}
+        # Uncommitted statuses per owner: {owner: {id: status}}
+        self._pending: dict[Hashable, dict[int, str]] = {}
+        # Lane and count of queued updates per appointment: {id: [lane, count]}
+        self._queued: dict[int, list] = {}
+        self.batches = 0
+        self.updates = 0
+
+    def submit(
+        self, appointment_id: int, status: str, owner: Optional[Hashable] = None
+    ) -> Future:
+        """Queue a status update; the Future resolves when it is durable, or
+        raises the commit's exception if it failed"""
+        future: Future = Future()
+        key = self.lane(appointment_id)  # May read the database: not under the lock
+        with self._lock:
+            queued = self._queued.get(appointment_id)
+            if queued:
+                key = queued[0]
+                queued[1] += 1
+            else:
+                self._queued[appointment_id] = [key, 1]
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = _Lane(key)
+            if owner is not None:
+                self._pending.setdefault(owner, {})[appointment_id] = status
+
+        with lane.changed:
+            while len(lane.queue) >= self.max_pending:
+                lane.changed.wait()
+            lane.queue.append(
+                (
+                    {"appointment_id": appointment_id, "status": status},
+                    future,
+                    owner,
+                    time.monotonic(),
+                )
+            )
+            if lane.flusher is None:
+                lane.flusher = threading.Thread(target=self._run, args=(lane,), daemon=True)
+                lane.flusher.start()
+            lane.queued.notify()
+        return future
+
+    def flush(self):
+        """Wait until everything submitted so far is committed"""
+        with self._lock:
+            lanes = list(self._lanes.values())
+        for lane in lanes:
+            with lane.changed:
+                futures = [future for _, future, _, _ in (lane.batch or []) + lane.queue]
+                # Failures are reported to the submitters
+                while not all(future.done() for future in futures):
+                    lane.changed.wait()
+
+    def overlay(self, owner: Hashable, appointments: list[dict]) -> list[dict]:
+        """``appointments`` with ``owner``'s uncommitted statuses"""
+        with self._lock:
+            pending = dict(self._pending.get(owner, {}))
+        if not pending:
+            return appointments
+        return [
+            {**apt, "status": pending[apt["id"]]} if apt["id"] in pending else apt
+            for apt in appointments
+        ]
+
+    def _run(self, lane: _Lane):
+        with lane.queued:
+            while True:
+                if not lane.queue:
+                    lane.queued.wait()
+                    continue
+                remaining = lane.queue[0][3] + self.max_delay - time.monotonic()
+                if len(lane.queue) < self.max_pending and remaining > 0:
+                    lane.queued.wait(remaining)
+                    continue
+                self._flush_lane(lane)
+
+    def _flush_lane(self, lane: _Lane):
+        """Commit everything queued on ``lane``. Called by its flusher with
+        the lane's lock held, which is released meanwhile."""
+        batch, lane.queue, lane.batch = lane.queue, [], lane.queue
+        lane.changed.notify_all()  # Room for blocked submitters
+        lane.changed.release()
+        try:
+            failed = self._commit(lane.key, batch)
+            self._settle(batch, failed)
+        finally:
+            lane.changed.acquire()
+            lane.batch = None
+            lane.changed.notify_all()
+
+    def _commit(self, key: Hashable, batch: list) -> dict[int, Exception]:
+        """Commit ``batch``; the failed updates' errors by appointment id"""
+        try:
+            self.commit(key, [update for update, _, _, _ in batch])
+            return {}
+        except CommitError as e:
+            logger.warning("status batch of %d partly failed: %s", len(batch), e)
+            return e.failed
+        except Exception as e:
+            logger.warning("status batch of %d failed: %s", len(batch), e)
+            return {update["appointment_id"]: e for update, _, _, _ in batch}
+
+    def _settle(self, batch: list, failed: dict[int, Exception]):
+        with self._lock:
+            for update, _, owner, _ in batch:
+                appointment_id = update["appointment_id"]
+                pending = self._pending.get(owner)
+                # A later update of the same appointment may still be queued
+                if pending and pending.get(appointment_id) == update["status"]:
+                    del pending[appointment_id]
+                    if not pending:
+                        del self._pending[owner]
+                queued = self._queued[appointment_id]
+                queued[1] -= 1
+                if not queued[1]:
+                    del self._queued[appointment_id]
+            committed = sum(u["appointment_id"] not in failed for u, _, _, _ in batch)
+            if committed:
+                self.batches += 1
+                self.updates += committed
+        for update, future, _, _ in batch:
+            error = failed.get(update["appointment_id"])
+            if error is None:
+                future.set_result(True)
+            else:
+                future.set_exception(error)
@@ -0,0 +1 @@
+"""Offline benchmarks for the healthcare chatbot (no API key required)"""
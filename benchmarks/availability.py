@@ -0,0 +1,120 @@
+"""Free-slot search latency and booking conflicts at clinic-network scale
+
+Usage: python -m benchmarks.availability [doctors] [fill_ratio] [threads]
+"""
+
+import random
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from app.availability import FreeSlotIndex, book_slot, to_hhmm
+from app.database import create_directory_schema, create_schema
+
+
+def build(doctors: int, fill_ratio: float) -> tuple[sqlite3.Connection, FreeSlotIndex]:
+    """A year of weekday 09:00-17:00 schedules with a share of slots pre-booked"""
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    create_schema(conn)
+    create_directory_schema(conn)
+    names = [f"Dr. Doctor{i:05d}" for i in range(doctors)]
+    conn.executemany(
+        "INSERT INTO doctors VALUES (?, ?)", list(enumerate(names, start=1))
+    )
+    conn.executemany(
+        "INSERT INTO doctor_schedules VALUES (?, ?, '09:00', '17:00', 30)",
+        [(i, weekday) for i in range(1, doctors + 1) for weekday in range(5)],
+    )
+
+    rng = random.Random(42)
+    today = date.today()
+    rows = []
+    for name in names:
+        for offset in range(1, 366):
+            day = today + timedelta(days=offset)
+            if day.weekday() >= 5:
+                continue
+            for minute in range(540, 1020, 30):
+                if rng.random() < fill_ratio:
+                    rows.append((1, day.isoformat(), to_hhmm(minute), name, "Checkup"))
+    conn.executemany(
+        """INSERT INTO appointments
+        (patient_id, appointment_date, appointment_time, doctor_name, appointment_type)
+        VALUES (?, ?, ?, ?, ?)""",
+        rows,
+    )
+    conn.commit()
+
+    start = time.perf_counter()
+    index = FreeSlotIndex.from_database(conn)
+    print(
+        f"{doctors} doctors, {len(rows):,} booked slots, "
+        f"index built in {time.perf_counter() - start:.2f}s"
+    )
+    return conn, index
+
+
+def bench_search(index: FreeSlotIndex, queries: int = 20000):
+    rng = random.Random(7)
+    doctors = index.doctors
+    timings = []
+    for _ in range(queries):
+        doctor = rng.choice(doctors)
+        after = datetime.now() + timedelta(days=rng.randint(0, 330))
+        start = time.perf_counter()
+        index.next_slots(doctor, after, 5)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    print(
+        f"next 5 slots: p50 {statistics.median(timings):.1f} us | "
+        f"p99 {timings[int(len(timings) * 0.99)]:.1f} us | max {timings[-1]:.1f} us"
+    )
+
+
+def bench_booking(conn: sqlite3.Connection, index: FreeSlotIndex, threads: int):
+    """Many threads race for the same few open slots; each may be won once"""
+    conn_lock = threading.RLock()
+    doctor = index.doctors[0]
+    contested = index.next_slots(doctor, datetime.now() + timedelta(days=1), 20)
+
+    def attempt(i: int) -> bool:
+        slot = contested[i % len(contested)]
+        result = book_slot(
+            conn, conn_lock, index, 1000 + i, doctor, slot["date"], slot["time"], "Race"
+        )
+        return result["success"]
+
+    attempts = threads * 50
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        wins = sum(pool.map(attempt, range(attempts)))
+    elapsed = time.perf_counter() - start
+
+    double_booked = conn.execute(
+        """SELECT COUNT(*) FROM (
+            SELECT 1 FROM appointments WHERE status != 'cancelled'
+            GROUP BY doctor_name, appointment_date, appointment_time
+            HAVING COUNT(*) > 1)"""
+    ).fetchone()[0]
+    print(
+        f"{attempts} concurrent attempts on {len(contested)} slots: {wins} booked, "
+        f"{double_booked} double-booked, {attempts / elapsed:,.0f} attempts/s"
+    )
+
+
+def main():
+    doctors = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    fill_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+
+    conn, index = build(doctors, fill_ratio)
+    bench_search(index)
+    bench_booking(conn, index, threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""Model-call and token budgets for scripted conversations
+
+Usage: python -m benchmarks.budgets [--update]
+
+Runs each scenario (login, list, confirm, cancel, clarifications, failures)
+through the graph with the counting stub model and records, per turn, the
+model calls, estimated input/output tokens and graph steps (nodes run). The
+numbers are compared with the budgets committed in benchmarks/budgets.json:
+a turn making more model calls or graph steps than its budget, or using more
+than TOKEN_TOLERANCE over its token budget, fails the run (exit status 1).
+
+``--update`` rewrites budgets.json with the measured numbers; do that only
+when a change is meant to alter the conversation flow, and commit the file
+with it.
+"""
+
+import json
+import sys
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from langchain_core.messages import HumanMessage
+
+import graph.nodes
+from benchmarks.stubs import install_stub
+from graph.builder import create_healthcare_chatbot
+
+BASELINE = Path(__file__).with_name("budgets.json")
+
+# Token counts move with prompt wording and dates; calls and steps must not
+TOKEN_TOLERANCE = 0.10
+
+JOHN = "Hi, I'm John Smith, 555-010-1001, 1985-03-15"
+MARIA = "Hello, this is Maria Garcia, 555-010-2001, 1990-07-22"
+
+
+@contextmanager
+def failing_updates():
+    """Every appointment status update raises, as if the database were down"""
+
+    class Failing:
+        @staticmethod
+        def invoke(args):
+            raise RuntimeError("database unavailable")
+
+    update = graph.nodes.update_appointment_status
+    graph.nodes.update_appointment_status = Failing
+    try:
+        yield
+    finally:
+        graph.nodes.update_appointment_status = update
+
+
+@contextmanager
+def no_fault():
+    yield
+
+
+# name -> (user turns, fault active during the scenario). Scenarios share the
+# sample database and run in this order, so the ones that change
+# appointments come after those that read them.
+SCENARIOS = {
+    "login": ([JOHN], no_fault),
+    "login_in_parts": (["Hi there", "I'm John Smith", "555-010-1001, born 1985-03-15"], no_fault),
+    "login_unknown_patient": (["I'm John Smith, 555-999-9999, 1985-03-15"], no_fault),
+    "list": ([JOHN, "Show me my appointments"], no_fault),
+    "confirm_by_type": ([JOHN, "Please confirm the blood test"], no_fault),
+    "confirm_clarify": ([JOHN, "I want to confirm my appointment", "the general checkup"], no_fault),
+    "confirm_unknown_doctor": ([JOHN, "Confirm my appointment with Dr. Smith"], no_fault),
+    "confirm_database_down": ([MARIA, "Confirm my follow-up"], failing_updates),
+    "cancel_clarify": ([JOHN, "I need to cancel an appointment", "the blood test"], no_fault),
+    "cancel_by_doctor": ([JOHN, "Cancel my appointment with Dr. Anderson"], no_fault),
+    "cancel_already_cancelled": ([JOHN, "Cancel my appointment with Dr. Anderson"], no_fault),
+    "goodbye": ([JOHN, "That's all, thanks"], no_fault),
+}
+
+METRICS = ("llm_calls", "input_tokens", "output_tokens", "steps")
+
+
+def run_scenario(app, stub, turns: list[str]) -> list[dict]:
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    measured = []
+    for text in turns:
+        before = len(stub.calls)
+        steps = sum(
+            1
+            for _ in app.stream(
+                {"messages": [HumanMessage(content=text)]}, config, stream_mode="updates"
+            )
+        )
+        calls = stub.calls[before:]
+        measured.append(
+            {
+                "message": text,
+                "llm_calls": len(calls),
+                "input_tokens": sum(call["input_tokens"] for call in calls),
+                "output_tokens": sum(call["output_tokens"] for call in calls),
+                "steps": steps,
+            }
+        )
+    return measured
+
+
+def over_budget(turn: dict, budget: dict) -> list[str]:
+    """Metrics of ``turn`` exceeding ``budget``"""
+    exceeded = []
+    for metric in METRICS:
+        limit = budget.get(metric)
+        if limit is None:
+            continue
+        if metric.endswith("_tokens"):
+            limit = int(limit * (1 + TOKEN_TOLERANCE))
+        if turn[metric] > limit:
+            exceeded.append(f"{metric} {turn[metric]} > {limit}")
+    return exceeded
+
+
+def run_scenarios() -> dict[str, list[dict]]:
+    """Every scenario's per-turn measurements, with the stub model"""
+    stub = install_stub()
+    app = create_healthcare_chatbot()
+
+    results = {}
+    for name, (turns, fault) in SCENARIOS.items():
+        with fault():
+            results[name] = run_scenario(app, stub, turns)
+    return results
+
+
+def main():
+    update = "--update" in sys.argv[1:]
+    results = run_scenarios()
+
+    if update:
+        BASELINE.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"wrote budgets for {len(results)} scenarios to {BASELINE}")
+        return
+
+    baseline = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+    failures = 0
+    print(f"{'scenario':>25} {'turn':>4} {'calls':>5} {'in tok':>7} {'out tok':>7} {'steps':>5}  budget")
+    for name, turns in results.items():
+        budgets = baseline.get(name)
+        for index, turn in enumerate(turns):
+            if budgets is None or index >= len(budgets):
+                verdict = "no budget"
+                failures += 1
+            else:
+                exceeded = over_budget(turn, budgets[index])
+                verdict = "OVER: " + ", ".join(exceeded) if exceeded else "ok"
+                failures += bool(exceeded)
+            print(
+                f"{name:>25} {index + 1:>4} {turn['llm_calls']:>5} {turn['input_tokens']:>7} "
+                f"{turn['output_tokens']:>7} {turn['steps']:>5}  {verdict}"
+            )
+    for name in baseline.keys() - results.keys():
+        print(f"{name:>25}    -  scenario in budgets.json no longer runs")
+
+    calls = sum(turn["llm_calls"] for turns in results.values() for turn in turns)
+    print(f"\n{len(results)} scenarios, {calls} model calls, {failures} turns over budget")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Concurrent same-thread /chat requests: serialized and coalesced vs racing
+
+Usage: python -m benchmarks.bursts [bursts] [burst size] [llm latency s]
+
+Each burst sends several messages to one thread within a few milliseconds,
+like a mobile user typing "cancel" and then "the blood test". Three modes:
+
+- sequential: one turn per message, each sent after the previous reply
+- racing: ``run_chat`` called directly, so concurrent turns overwrite each
+  other's checkpoint and messages go missing
+- queued: through /chat and the turn queue, every message is kept and the
+  burst costs at most two turns
+"""
+
+import asyncio
+import sys
+import time
+import httpx
+
+from benchmarks.stubs import install_stub
+
+LOGIN = "I'm John Smith, 555-010-1001, 1985-03-15"
+BURST = ["cancel", "the blood test", "please", "thanks", "the one on monday"]
+
+
+async def burst(client, thread_id: str, size: int, mode: str):
+    import app.api as api
+
+    messages = [f"{BURST[i % len(BURST)]} #{i}" for i in range(size)]
+
+    async def send(i: int, message: str):
+        await asyncio.sleep(i * 0.005)
+        if mode == "queued":
+            response = await client.post(
+                "/chat", json={"message": message, "thread_id": thread_id}
+            )
+            response.raise_for_status()
+        else:
+            await api.run_chat(api.ChatRequest(message=message, thread_id=thread_id))
+
+    if mode == "sequential":
+        for message in messages:
+            await send(0, message)
+    else:
+        await asyncio.gather(*(send(i, m) for i, m in enumerate(messages)))
+    history = api.chatbot.get_state(
+        {"configurable": {"thread_id": thread_id}}
+    ).values["messages"]
+    seen = " ".join(m.content for m in history if m.type == "human")
+    return sum(message in seen for message in messages)
+
+
+async def run(mode: str, bursts: int, size: int):
+    import app.api as api
+    from benchmarks.stubs import StubChatModel
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        login = await client.post("/chat", json={"message": LOGIN})
+        thread_id = login.json()["thread_id"]
+        calls = len(StubChatModel.calls)
+        start = time.perf_counter()
+        kept = 0
+        for _ in range(bursts):
+            kept += await burst(client, thread_id, size, mode)
+        elapsed = time.perf_counter() - start
+    calls = len(StubChatModel.calls) - calls
+    print(
+        f"{mode:>10}: {kept}/{bursts * size} messages kept | "
+        f"{calls / bursts:5.1f} model calls/burst | {elapsed / bursts * 1000:6.0f} ms/burst"
+    )
+
+
+def main():
+    bursts = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+    install_stub(latency)
+
+    for mode in ("sequential", "racing", "queued"):
+        asyncio.run(run(mode, bursts, size))
+
+
+if __name__ == "__main__":
+    main()
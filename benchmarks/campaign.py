@@ -0,0 +1,137 @@
+"""Throughput and crash-resume of the reminder campaign pipeline
+
+Usage: python -m benchmarks.campaign [appointments] [llm_latency_s] [concurrency]
+
+Threads are stored with the SQLite checkpointer the campaign runs with in
+production, in a temporary file. Both reminders and replies crash after three
+chunks and resume from the campaign checkpoint.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import graph.builder
+from app.campaign import CampaignCheckpoint, ReminderCampaign, reminder_thread_id
+from app.database import DB
+from benchmarks.stubs import install_stub
+from graph.checkpoint import SqliteCheckpointSaver
+
+
+class Crash(Exception):
+    pass
+
+
+class CrashingCheckpoint(CampaignCheckpoint):
+    """Simulates the process dying after a number of chunk checkpoints"""
+
+    def __init__(self, path: str, crash_after: int):
+        super().__init__(path)
+        self.crash_after = crash_after
+
+    def save(self, **values):
+        super().save(**values)
+        if "last_appointment" in values or "replies_resolved" in values:
+            self.crash_after -= 1
+            if self.crash_after == 0:
+                raise Crash()
+
+
+def seed(count: int) -> list[int]:
+    """Insert ``count`` patients, each with one appointment in the next 48 hours"""
+    first_patient = (
+        DB.directory.execute("SELECT MAX(patient_id) FROM patient_directory").fetchone()[0]
+        + 1
+    )
+    now = datetime.now()
+    patients, appointments = [], []
+    for i in range(count):
+        patient_id = first_patient + i
+        when = now + timedelta(minutes=30 + (i * 2800 // count))
+        patients.append((patient_id, f"Patient {i}", "555-000-0000", "1980-01-01"))
+        appointments.append(
+            (
+                None,
+                patient_id,
+                when.strftime("%Y-%m-%d"),
+                when.strftime("%H:%M"),
+                f"Dr. Bench{i}",
+                "Checkup",
+                "scheduled",
+            )
+        )
+    DB.add_patients(patients)
+    DB.add_appointments(appointments)
+    return [p[0] for p in patients]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+
+    patient_ids = seed(count)
+    stub = install_stub(latency)
+    directory = tempfile.mkdtemp()
+    graph.builder.create_checkpointer = lambda: SqliteCheckpointSaver(
+        os.path.join(directory, "checkpoints.db")
+    )
+    campaign = ReminderCampaign(
+        graph.builder.create_healthcare_chatbot(),
+        stub(),
+        concurrency=concurrency,
+        chunk_size=1000,
+    )
+    path = os.path.join(directory, "campaign.json")
+
+    start = time.perf_counter()
+    try:
+        campaign.send_reminders(48, CrashingCheckpoint(path, crash_after=3))
+    except Crash:
+        date, time_, appointment_id = CampaignCheckpoint(path).get("last_appointment")
+        print(f"crashed after appointment {appointment_id} ({date} {time_}), resuming")
+    result = campaign.send_reminders(48, CampaignCheckpoint(path))
+    elapsed = time.perf_counter() - start
+    print(
+        f"reminders: {result['sent']:,} sent in {elapsed:.1f}s "
+        f"({result['sent'] / elapsed:,.0f}/s, concurrency {concurrency}, "
+        f"LLM latency {latency * 1000:.0f} ms)"
+    )
+
+    def replies():
+        for p in patient_ids:
+            yield {
+                "thread_id": reminder_thread_id(p),
+                "message": "Yes, confirm my checkup",
+            }
+
+    start = time.perf_counter()
+    try:
+        campaign.resolve_replies(replies(), CrashingCheckpoint(path, crash_after=3))
+    except Crash:
+        crashed_at = CampaignCheckpoint(path).get("replies_resolved")
+        print(f"crashed after {crashed_at:,} replies, resuming")
+    result = campaign.resolve_replies(replies(), CampaignCheckpoint(path))
+    elapsed = time.perf_counter() - start
+    confirmed = sum(
+        shard.conn.execute(
+            "SELECT COUNT(*) FROM appointments WHERE status = 'confirmed'"
+        ).fetchone()[0]
+        for shard in DB.shards
+    )
+    # A fresh saver on the same file sees the threads, as the API process would
+    thread = SqliteCheckpointSaver(os.path.join(directory, "checkpoints.db")).get_tuple(
+        {"configurable": {"thread_id": reminder_thread_id(patient_ids[-1])}}
+    )
+    messages = len(thread.checkpoint["channel_values"]["messages"]) if thread else 0
+    print(
+        f"replies: {result['replies']:,} resolved in {elapsed:.1f}s "
+        f"({result['replies'] / elapsed:,.0f}/s), {confirmed:,} confirmed in DB, "
+        f"last thread has {messages} messages"
+    )
+
+
+if __name__ == "__main__":
+    main()
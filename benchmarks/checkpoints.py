@@ -0,0 +1,118 @@
+"""Checkpoint size and (de)serialization time over long conversations
+
+Usage: python -m benchmarks.checkpoints [turns] [threads]
+"""
+
+import sys
+import time
+import uuid
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+import graph.builder
+from benchmarks.stubs import install_stub
+from graph.checkpoint import CompactCheckpointSaver
+
+SCRIPT = [
+    "Show me my appointments",
+    "I want to confirm the blood test",
+    "What are my appointments again?",
+    "Please confirm my general checkup",
+]
+
+
+class TimedSaver:
+    """Wraps a saver and accumulates time spent in put/get_tuple"""
+
+    def __init__(self, saver):
+        self.saver = saver
+        self.put_time = self.get_time = 0.0
+        self.puts = self.gets = 0
+
+    def put(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._put(*args, **kwargs)
+        finally:
+            self.put_time += time.perf_counter() - start
+            self.puts += 1
+
+    def get_tuple(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._get_tuple(*args, **kwargs)
+        finally:
+            self.get_time += time.perf_counter() - start
+            self.gets += 1
+
+    def install(self):
+        self._put, self._get_tuple = self.saver.put, self.saver.get_tuple
+        self.saver.put, self.saver.get_tuple = self.put, self.get_tuple
+        return self.saver
+
+
+def stored_bytes(saver) -> tuple[int, int]:
+    """Total encoded bytes and number of checkpoints held by a saver"""
+    if isinstance(saver, CompactCheckpointSaver):
+        count = sum(len(records) for records in saver.storage.values())
+        return saver.stored_bytes(), count
+    total = count = 0
+    for namespaces in saver.storage.values():
+        for checkpoints in namespaces.values():
+            for checkpoint, metadata, _ in checkpoints.values():
+                total += len(checkpoint[1]) + len(metadata[1])
+                count += 1
+    total += sum(len(blob[1]) for blob in saver.blobs.values())
+    total += sum(
+        len(write[2][1]) for writes in saver.writes.values() for write in writes.values()
+    )
+    return total, count
+
+
+def run(saver, turns: int, threads: int):
+    timed = TimedSaver(saver)
+    graph.builder.CompactCheckpointSaver = lambda: timed.install()
+    app = graph.builder.create_healthcare_chatbot()
+    last = None
+    for _ in range(threads):
+        config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+        app.invoke(
+            {"messages": [HumanMessage(content="I'm John Smith, 555-010-1001, 1985-03-15")]},
+            config,
+        )
+        for turn in range(turns):
+            app.invoke({"messages": [HumanMessage(content=SCRIPT[turn % 4])]}, config)
+        last = app.get_state(config).values
+    graph.builder.CompactCheckpointSaver = CompactCheckpointSaver
+    return timed, last
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    install_stub()
+
+    results = {}
+    for label, saver in (
+        ("InMemorySaver", InMemorySaver()),
+        ("CompactCheckpointSaver", CompactCheckpointSaver()),
+    ):
+        timed, final_state = run(saver, turns, threads)
+        total, count = stored_bytes(saver)
+        results[label] = final_state
+        print(
+            f"{label:>22}: {total / 1024:9.1f} KiB, {count} checkpoints, "
+            f"{total / count:7.0f} B/checkpoint | "
+            f"put {timed.put_time / timed.puts * 1e6:6.0f} us | "
+            f"get {timed.get_time / timed.gets * 1e6:6.0f} us"
+        )
+
+    plain, compact = results.values()
+    assert [m.content for m in plain["messages"]] == [
+        m.content for m in compact["messages"]
+    ], "compact saver restored a different conversation"
+    print(f"final state identical across savers ({len(plain['messages'])} messages)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Event outbox write throughput and fold consistency, and /stats latency as
+the event history grows
+
+Usage: python -m benchmarks.events [writers] [seconds] [history]
+
+Writers call update_appointment_status on fresh 4-shard database files with
+the default durability (WAL, synchronous=FULL); each update's event is
+written to its shard's outbox in the same transaction. The run is repeated
+with the directory database locked by another connection for half the time,
+so folds fail and are retried. Either way the folded stats must equal a
+recount of the appointments. The stats part grows the history to
+``history`` events and times a one-week /stats query against the
+precomputed aggregates, next to the equivalent scan of the event table.
+"""
+
+import logging
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+import app.tools
+from app.database import directory_connection, open_database
+from app.events import EventLog, rebuild_stats, write_events
+from benchmarks.sharding import seed, write_load
+
+DOCTORS = [f"Dr. Stats{i}" for i in range(50)]
+STATUSES = ["scheduled", "confirmed", "cancelled"]
+
+
+def recount(db) -> Counter:
+    counts = Counter()
+    for shard in db.shards:
+        for day, doctor, status, count in shard.conn.execute(
+            """SELECT appointment_date, doctor_name, status, COUNT(*)
+            FROM appointments GROUP BY appointment_date, doctor_name, status"""
+        ):
+            counts[(day, doctor, status)] += count
+    return counts
+
+
+def write_throughput(
+    writers: int, seconds: float, outage: bool
+) -> tuple[float, EventLog, bool]:
+    """(updates/s, the log, folded stats equal a recount)"""
+    with tempfile.TemporaryDirectory() as directory:
+        app.tools.DB = db = open_database(directory, 4)
+        app.tools.EVENTS = log = EventLog(
+            db, directory_connection(db), retry_delay=0.1
+        )
+        app.tools._shard_name.cache_clear()
+        ids = seed(db, 2000)
+        rebuild_stats(db)
+        if outage:
+            # Another process holding the directory's write lock; folds time out
+            # (and log a warning each, silenced here)
+            logging.getLogger("app.events").setLevel(logging.ERROR)
+            log.conn.execute("PRAGMA busy_timeout = 50")
+            blocker = sqlite3.connect(
+                f"{directory}/directory.db", isolation_level=None, check_same_thread=False
+            )
+            blocker.execute("BEGIN IMMEDIATE")
+            threading.Timer(seconds / 2, blocker.rollback).start()
+        updates = write_load(ids, writers, seconds, {})
+        log.flush()
+        stats = Counter(
+            {
+                tuple(row[:3]): row[3]
+                for row in db.directory.execute("SELECT * FROM appointment_stats")
+                if row[3]
+            }
+        )
+        return updates / seconds, log, stats == recount(db)
+
+
+def scan_stats(db, start: str, end: str) -> dict:
+    """What /stats would cost without aggregates: replay the history"""
+    counts = {}
+    for _, doctor, _, old, new in db.directory.execute(
+        """SELECT appointment_id, doctor_name, appointment_date, old_status, new_status
+        FROM appointment_events WHERE appointment_date BETWEEN ? AND ?""",
+        (start, end),
+    ):
+        row = counts.setdefault(doctor, dict.fromkeys(STATUSES, 0))
+        if old:
+            row[old] -= 1
+        row[new] += 1
+    return counts
+
+
+def main():
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    history = int(sys.argv[3]) if len(sys.argv) > 3 else 1_000_000
+
+    print(
+        f"{'directory':>19} {'updates/s':>10} {'events':>8} "
+        f"{'failed folds':>12} {'stats match':>11}"
+    )
+    for name, outage in (("available", False), ("locked half the run", True)):
+        rate, log, match = write_throughput(writers, seconds, outage)
+        print(
+            f"{name:>19} {rate:>10,.0f} {log.events:>8,} {log.failures:>12} "
+            f"{'yes' if match else 'NO':>11}"
+        )
+
+    # History: two years of appointments, each booked then confirmed or cancelled
+    rng = random.Random(0)
+    first_day = date(2030, 1, 1)
+    week = (first_day.isoformat(), (first_day + timedelta(days=6)).isoformat())
+    print(f"\n{'events':>10} {'stats ms':>9} {'scan ms':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        db = open_database(directory, 1)
+        log = EventLog(db, directory_connection(db))
+        shard = db.shards[0]
+        logged, appointment_id = 0, 0
+        for target in (10_000, 100_000, history):
+            while logged < target:
+                batch = []
+                for _ in range(5_000):
+                    appointment_id += 1
+                    doctor = rng.choice(DOCTORS)
+                    day = (first_day + timedelta(days=rng.randrange(730))).isoformat()
+                    batch.append((appointment_id, doctor, day, None, "scheduled"))
+                    batch.append(
+                        (appointment_id, doctor, day, "scheduled", rng.choice(STATUSES[1:]))
+                    )
+                write_events(shard.conn, batch)
+                shard.conn.commit()
+                log.flush()
+                logged += len(batch)
+
+            start = time.perf_counter()
+            for _ in range(100):
+                stats = log.stats(*week)
+            stats_ms = (time.perf_counter() - start) * 10
+            start = time.perf_counter()
+            scanned = scan_stats(db, *week)
+            scan_ms = (time.perf_counter() - start) * 1000
+            assert all(
+                stats["doctors"][doctor][status] == counts[status]
+                for doctor, counts in scanned.items()
+                for status in STATUSES
+            )
+            print(f"{logged:>10,} {stats_ms:>9.2f} {scan_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Query time and confirm-prompt tokens as a patient's history grows
+
+Usage: python -m benchmarks.history [patients] [upcoming per patient]
+
+For histories of 10 to 5000 appointments per patient (mostly past,
+confirmed or cancelled, plus a few upcoming), compares what a confirm/cancel
+turn used to do against the windowed path:
+
+- full: every appointment the patient ever had, listed one
+  ``ID n: type with doctor on date at time (Status: s)`` line each
+- windowed: upcoming appointments from idx_appointments_patient_date, in the
+  compact table ``encode_appointments`` puts in the prompt (at most
+  PROMPT_APPOINTMENTS rows)
+
+Tokens are estimated at ~4 characters per token, for the whole confirm
+system prompt.
+"""
+
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+import app.tools
+from app.database import open_database
+from app.tools import query_appointments
+from benchmarks.stubs import estimate_tokens
+from graph.nodes import CHAT_APPOINTMENTS, build_confirmation_prompt
+
+HISTORIES = (10, 100, 1000, 5000)
+
+
+def legacy_prompt(appointments: list[dict]) -> str:
+    """The confirm prompt as built before the compact encoding"""
+    apt_info = "\n".join(
+        f"ID {apt['id']}: {apt['type']} with {apt['doctor']} on {apt['date']} at {apt['time']} (Status: {apt['status']})"
+        for apt in appointments
+    )
+    template = build_confirmation_prompt([], [])[0].content
+    return template.replace("Available appointments:\nNone", f"Available appointments:\n{apt_info}")
+
+
+def seed(db, patients: int, history: int, upcoming: int):
+    db.add_patients(
+        [(p, f"Patient {p}", "555-000-0000", "1980-01-01") for p in range(1, patients + 1)]
+    )
+    today = date.today()
+    rows = []
+    for p in range(1, patients + 1):
+        for k in range(history):
+            ahead = k >= history - upcoming
+            day = today + timedelta(days=k - (history - upcoming) + 1 if ahead else k - history)
+            status = "scheduled" if ahead else ("cancelled" if k % 7 == 0 else "confirmed")
+            rows.append(
+                (p * 100_000 + k, p, day.isoformat(), "10:00", f"Dr. History{p}", "Follow-up", status)
+            )
+    db.upsert_appointments(rows)
+
+
+def timed(fn, repeat: int = 20) -> tuple[float, list]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    patients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    upcoming = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    print(
+        f"{'history':>8} | {'full ms':>8} {'rows':>5} {'tokens':>7} | "
+        f"{'windowed ms':>11} {'rows':>5} {'tokens':>7}"
+    )
+    for history in HISTORIES:
+        with tempfile.TemporaryDirectory() as directory:
+            app.tools.DB = db = open_database(directory, 1)
+            seed(db, patients, history, upcoming)
+            patient = patients // 2
+            full_ms, full = timed(lambda: query_appointments(patient))
+            window_ms, window = timed(
+                lambda: query_appointments(patient, upcoming=True, limit=CHAT_APPOINTMENTS)
+            )
+            full_tokens = estimate_tokens(legacy_prompt(full))
+            window_tokens = estimate_tokens(build_confirmation_prompt(window, [])[0].content)
+            print(
+                f"{history:>8} | {full_ms:>8.2f} {len(full):>5} {full_tokens:>7,} | "
+                f"{window_ms:>11.2f} {len(window):>5} {window_tokens:>7,}"
+            )
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = open_database(directory, 1)
+        detail = db.shards[0].conn.execute(
+            """EXPLAIN QUERY PLAN SELECT id FROM appointments
+            WHERE patient_id = ? AND appointment_date >= ?
+            ORDER BY appointment_date, appointment_time, id LIMIT ?""",
+            (1, date.today().isoformat(), CHAT_APPOINTMENTS),
+        ).fetchall()
+        print("\nwindowed plan:", "; ".join(row[-1] for row in detail))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Bulk import throughput and memory on generated EHR-style exports
+
+Usage: python -m benchmarks.importer [rows] [shards] [csv|ndjson]
+
+Writes a patients file (1 row in 5) and an appointments file (the rest)
+with messy phones, dates and times plus a few invalid rows, then imports
+both into fresh shard files and reports rows/s, index rebuild time and peak
+memory. Files are generated and read as streams, so memory stays flat no
+matter the row count.
+"""
+
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from app.database import open_database
+from app.importer import BulkImporter, peak_memory_mb
+
+PHONES = ["555-{:03d}-{:04d}", "(555) {:03d} {:04d}", "555.{:03d}.{:04d}"]
+DOBS = ["{y}-{m:02d}-{d:02d}", "{m}/{d}/{y}", "{d:02d}.{m:02d}.{y}"]
+TIMES = ["{h:02d}:{mi:02d}", "{h12}:{mi:02d} {ampm}"]
+
+
+def patient_records(count: int, rng: random.Random):
+    for i in range(1, count + 1):
+        y, m, d = rng.randint(1930, 2010), rng.randint(1, 12), rng.randint(1, 28)
+        yield {
+            "id": i,
+            "full_name": f"Patient  {i}",
+            "phone_number": rng.choice(PHONES).format(i % 1000, i % 10000),
+            "date_of_birth": rng.choice(DOBS).format(y=y, m=m, d=d)
+            if i % 1000
+            else "unknown",
+        }
+
+
+def appointment_records(count: int, patients: int, rng: random.Random):
+    for i in range(1, count + 1):
+        # 16 slots a day over 336 days per doctor keeps every slot unique
+        h, mi = divmod(540 + 30 * (i % 16), 60)
+        day = date(2031, 1, 1) + timedelta(days=(i // 16) % 336)
+        yield {
+            "id": i,
+            "patient_id": rng.randint(1, patients),
+            "appointment_date": day.isoformat(),
+            "appointment_time": rng.choice(TIMES).format(
+                h=h, mi=mi, h12=(h - 1) % 12 + 1, ampm="PM" if h >= 12 else "AM"
+            ),
+            "doctor_name": f"Dr. Import{i // (16 * 336)}",
+            "appointment_type": "Checkup",
+            "status": "scheduled",
+        }
+
+
+def write(path: str, records, fmt: str):
+    with open(path, "w", newline="") as f:
+        if fmt == "csv":
+            first = next(records)
+            writer = csv.DictWriter(f, fieldnames=list(first))
+            writer.writeheader()
+            writer.writerow(first)
+            writer.writerows(records)
+        else:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    shards = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    fmt = sys.argv[3] if len(sys.argv) > 3 else "csv"
+    patients, appointments = rows // 5, rows - rows // 5
+    rng = random.Random(3)
+
+    with tempfile.TemporaryDirectory() as directory:
+        patients_path = os.path.join(directory, f"patients.{fmt}")
+        appointments_path = os.path.join(directory, f"appointments.{fmt}")
+        write(patients_path, patient_records(patients, rng), fmt)
+        write(appointments_path, appointment_records(appointments, patients, rng), fmt)
+        size = os.path.getsize(patients_path) + os.path.getsize(appointments_path)
+        print(
+            f"{rows:,} rows in {size / 1024 / 1024:.0f} MB of {fmt}, {shards} shards, "
+            f"memory before import {peak_memory_mb():.0f} MB"
+        )
+
+        db = open_database(os.path.join(directory, "db"), shards)
+        importer = BulkImporter(db)
+        for kind, path in (("patients", patients_path), ("appointments", appointments_path)):
+            stats = importer.run(path, kind)
+            print(
+                f"{kind:>12}: {stats['imported']:>10,} imported {stats['rejected']:>6,} rejected | "
+                f"{stats['rows_per_second']:>9,.0f} rows/s | "
+                f"index rebuild {stats['index_seconds']:.1f}s | "
+                f"peak memory {stats['peak_memory_mb']:.0f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
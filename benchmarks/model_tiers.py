@@ -0,0 +1,171 @@
+"""A/B report of latency and accuracy per node: all-large vs fast/large tiers
+
+Usage: python -m benchmarks.model_tiers [--live]
+
+Offline, the fast and large tiers are simulated by the stub model with
+per-tier latency and error rates (see TIER_PROFILES). With --live the same
+cases run against the real models configured in FAST_MODEL/DEFAULT_MODEL.
+"""
+
+import os
+import statistics
+import sys
+import time
+from datetime import date
+from langchain_core.messages import HumanMessage
+
+import graph.llm
+from app.database import DB
+from app.tools import SLOT_INDEX, get_appointments
+from benchmarks.stubs import StubChatModel, install_stub
+from graph.llm import FAST, LARGE, model_for
+from graph.nodes import auth_node, cancel_node, chatbot_node, confirm_node
+
+JOHN = {
+    "full_name": "John Smith",
+    "phone_number": "555-010-1001",
+    "date_of_birth": "1985-03-15",
+    "user_id": 1,
+}
+
+INTENT_CASES = [
+    ("What are my appointments?", "list"),
+    ("show me everything I have booked", "list"),
+    ("list my appointments please", "list"),
+    ("Can you show my schedule?", "list"),
+    ("I'd like to confirm my checkup", "confirm"),
+    ("confirm the blood test", "confirm"),
+    ("Yes, please confirm the one with Dr. Brown", "confirm"),
+    ("I want to cancel an appointment", "cancel"),
+    ("cancel my blood test", "cancel"),
+    ("Please cancel the checkup with Dr. Anderson", "cancel"),
+    ("I need to reschedule my blood test", "reschedule"),
+    ("Can I book an appointment with Dr. Wilson?", "reschedule"),
+    ("move my checkup to next week", "reschedule"),
+    ("thanks, bye", "end"),
+    ("that's all for today", "end"),
+    ("goodbye", "end"),
+]
+
+DECISION_CASES = [
+    ("the blood test", 2),
+    ("the one with Dr. Anderson", 1),
+    ("my general checkup", 1),
+    ("the appointment with Dr. Brown", 2),
+]
+
+# Offline stand-ins for the two tiers
+TIER_PROFILES = {
+    FAST: {"latency": 0.15, "error_rate": 0.15},
+    LARGE: {"latency": 0.6, "error_rate": 0.02},
+}
+
+CONFIGS = {
+    "all-large": "introduction=large,auth=large,chatbot=large,list=large,confirm=large,confirm.phrasing=large,cancel=large,cancel.phrasing=large,reschedule=large",
+    "tiered": "",
+}
+
+
+def reset_appointment(appointment_id: int):
+    """Put a sample appointment back to 'scheduled' after a decision case"""
+    conn = DB.shard_of_appointment(appointment_id).conn
+    row = conn.execute(
+        "SELECT doctor_name, appointment_date, appointment_time, status FROM appointments WHERE id = ?",
+        (appointment_id,),
+    ).fetchone()
+    conn.execute(
+        "UPDATE appointments SET status = 'scheduled' WHERE id = ?", (appointment_id,)
+    )
+    conn.commit()
+    if row[3] == "cancelled" and row[0] in SLOT_INDEX:
+        SLOT_INDEX.reserve(row[0], date.fromisoformat(row[1]), row[2])
+        DB.claim_slot(row[0], row[1], row[2], appointment_id)
+
+
+def run_node(name: str) -> tuple[list[float], int, int]:
+    """Latencies, correct answers and case count for one node"""
+    latencies, correct = [], 0
+    if name == "chatbot":
+        cases = INTENT_CASES
+    elif name == "auth":
+        cases = [(None, None)] * 8
+    else:
+        cases = DECISION_CASES
+
+    for text, expected in cases:
+        appointments = get_appointments.invoke({"patient_id": 1})
+        if name == "auth":
+            state = {"user_data": {k: v for k, v in JOHN.items() if k != "user_id"}}
+        else:
+            state = {
+                "user_verified": True,
+                "user_data": JOHN,
+                "available_appointments": appointments,
+                "messages": [
+                    HumanMessage(content=f"I want to {name} {text}")
+                    if name in ("confirm", "cancel")
+                    else HumanMessage(content=text)
+                ],
+            }
+        node = {
+            "chatbot": chatbot_node,
+            "auth": auth_node,
+            "confirm": confirm_node,
+            "cancel": cancel_node,
+        }[name]
+
+        start = time.perf_counter()
+        result = node(state)
+        latencies.append(time.perf_counter() - start)
+
+        if name == "chatbot":
+            correct += result.get("intent") == expected
+        elif name == "auth":
+            correct += bool(result.get("user_verified"))
+        else:
+            status = "confirmed" if name == "confirm" else "cancelled"
+            changed = [
+                apt["id"]
+                for apt in result.get("available_appointments", [])
+                if apt["status"] == status
+            ]
+            correct += changed == [expected]
+            reset_appointment(expected)
+    return latencies, correct, len(cases)
+
+
+def main():
+    live = "--live" in sys.argv
+    if not live:
+        stub = install_stub()
+        stub.profiles = {
+            model_for(FAST): TIER_PROFILES[FAST],
+            model_for(LARGE): TIER_PROFILES[LARGE],
+        }
+
+    print(f"fast tier: {model_for(FAST)} | large tier: {model_for(LARGE)}")
+    print(f"{'node':>8} {'config':>10} {'p50 ms':>8} {'mean ms':>8} {'accuracy':>9} {'escalated':>10}")
+    for name in ("chatbot", "auth", "confirm", "cancel"):
+        for config, tiers in CONFIGS.items():
+            os.environ["MODEL_TIERS"] = tiers
+            StubChatModel.rng.seed(1)
+            calls_before = len(StubChatModel.calls)
+            latencies, correct, total = run_node(name)
+            large_calls = sum(
+                call["model"] == model_for(LARGE)
+                for call in StubChatModel.calls[calls_before:]
+            )
+            escalated = (
+                f"{large_calls / total:9.0%}"
+                if not live and config == "tiered" and graph.llm.tier_for(name) == FAST
+                else f"{'-':>9}"
+            )
+            print(
+                f"{name:>8} {config:>10} {statistics.median(latencies) * 1000:8.0f} "
+                f"{statistics.mean(latencies) * 1000:8.0f} {correct / total:9.0%} {escalated:>10}"
+            )
+    os.environ.pop("MODEL_TIERS", None)
+
+
+if __name__ == "__main__":
+    main()
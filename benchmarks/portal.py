@@ -0,0 +1,117 @@
+"""Listing a patient's appointments: /chat turn vs the portal REST endpoint
+
+Usage: python -m benchmarks.portal [requests] [llm latency s]
+
+The same logged-in patient asks for their appointments ``requests`` times:
+
+- chat: "show my appointments" through /chat (stub model with the given
+  latency, so model calls are counted but cost no API usage)
+- portal 200: GET /patients/{id}/appointments without a validator
+- portal 304: the same GET revalidated with If-None-Match
+
+Appointment queries (chat turns included) and version-tag lookups are
+counted by wrapping them. A last check changes the appointments through a
+second connection to the database files, as another process would, and
+revalidates.
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+
+from benchmarks.stubs import install_stub
+
+LOGIN = "I'm John Smith, 555-010-1001, 1985-03-15"
+# Run by a separate interpreter sharing the database files
+OTHER_PROCESS_WRITE = (
+    "from app.tools import commit_status_updates; "
+    "commit_status_updates([{'appointment_id': 1, 'status': 'confirmed'}])"
+)
+IDENTITY = {
+    "full_name": "John Smith",
+    "phone_number": "555-010-1001",
+    "date_of_birth": "1985-03-15",
+}
+
+
+async def run(requests: int):
+    import app.api as api
+    import app.tools
+    from benchmarks.stubs import StubChatModel
+
+    reads = lookups = 0
+    query, version = api.query_appointments, api.DB.patient_version
+
+    def counted(*args, **kwargs):
+        nonlocal reads
+        reads += 1
+        return query(*args, **kwargs)
+
+    def counted_version(patient_id):
+        nonlocal lookups
+        lookups += 1
+        return version(patient_id)
+
+    api.query_appointments = app.tools.query_appointments = counted
+    api.DB.patient_version = counted_version
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        thread_id = (await client.post("/chat", json={"message": LOGIN})).json()["thread_id"]
+        login = (await client.post("/patients/login", json=IDENTITY)).json()
+        url = f"/patients/{login['patient_id']}/appointments"
+        auth = {"Authorization": f"Bearer {login['token']}"}
+        etag = (await client.get(url, headers=auth)).headers["etag"]
+
+        async def chat():
+            response = await client.post(
+                "/chat", json={"message": "show my appointments", "thread_id": thread_id}
+            )
+            return response.status_code
+
+        async def portal():
+            return (await client.get(url, headers=auth)).status_code
+
+        async def revalidate():
+            return (await client.get(url, headers={**auth, "If-None-Match": etag})).status_code
+
+        print(
+            f"{'path':>10} {'ms/request':>11} {'model calls':>12} "
+            f"{'queries':>8} {'versions':>9} {'status':>7}"
+        )
+        for name, send in (("chat", chat), ("portal 200", portal), ("portal 304", revalidate)):
+            calls, before, looked_up = len(StubChatModel.calls), reads, lookups
+            start = time.perf_counter()
+            for _ in range(requests):
+                status = await send()
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:>10} {elapsed / requests * 1000:>11.2f} "
+                f"{(len(StubChatModel.calls) - calls) / requests:>12.1f} "
+                f"{(reads - before) / requests:>8.1f} "
+                f"{(lookups - looked_up) / requests:>9.1f} {status:>7}"
+            )
+
+        subprocess.run([sys.executable, "-c", OTHER_PROCESS_WRITE], check=True)
+        status = await revalidate()
+        print(
+            f"revalidated after another process's write: {status} "
+            f"({'fresh' if status == 200 else 'STALE'})"
+        )
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    install_stub(latency)
+    with tempfile.TemporaryDirectory() as directory:
+        # On files, so another process can write to the same database
+        os.environ["DB_DIR"] = directory
+        asyncio.run(run(requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Latency of the login and post-login turns with and without prefetch
+
+Usage: python -m benchmarks.prefetch [llm_latency_s] [db_latency_s] [runs]
+
+The baseline prefetches nothing, so list_node reads the appointments itself
+after the intent call, as before prefetching. The third turn comes after the
+appointments in state went stale, so chatbot_node reads them again while the
+intent is decided.
+"""
+
+import sys
+import time
+import uuid
+from concurrent.futures import Future
+from langchain_core.messages import HumanMessage
+
+import graph.nodes
+from benchmarks.stubs import install_stub
+from graph.builder import create_healthcare_chatbot
+
+LOGIN = "Hi, I'm John Smith, 555-010-1001, 1985-03-15"
+FIRST_TURN = "Show me my appointments"
+
+
+class SlowTool:
+    """Wraps a tool and adds a fixed delay to emulate a remote database"""
+
+    def __init__(self, tool, delay: float):
+        self.tool = tool
+        self.delay = delay
+
+    def invoke(self, args):
+        time.sleep(self.delay)
+        return self.tool.invoke(args)
+
+
+def no_prefetch(patient_id: int) -> Future:
+    """Baseline: nothing is loaded ahead, so list_node reads the appointments"""
+    future = Future()
+    future.set_result([])
+    return future
+
+
+def run(runs: int) -> list[float]:
+    """Average wall time of the login turn, the first post-login turn and a
+    turn after the appointments went stale"""
+    app = create_healthcare_chatbot()
+    totals = [0.0, 0.0, 0.0]
+    for _ in range(runs):
+        config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+        for i, message in enumerate((LOGIN, FIRST_TURN, FIRST_TURN)):
+            max_age = graph.nodes.APPOINTMENTS_MAX_AGE
+            if i == 2:
+                graph.nodes.APPOINTMENTS_MAX_AGE = 0
+            start = time.perf_counter()
+            app.invoke({"messages": [HumanMessage(content=message)]}, config)
+            totals[i] += time.perf_counter() - start
+            graph.nodes.APPOINTMENTS_MAX_AGE = max_age
+    return [total / runs for total in totals]
+
+
+def main():
+    llm_latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+    db_latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    install_stub(llm_latency)
+    graph.nodes.get_appointments = SlowTool(graph.nodes.get_appointments, db_latency)
+
+    concurrent = run(runs)
+    prefetch = graph.nodes.prefetch_appointments
+    graph.nodes.prefetch_appointments = no_prefetch
+    baseline = run(runs)
+    graph.nodes.prefetch_appointments = prefetch
+
+    print(f"LLM latency {llm_latency * 1000:.0f} ms, DB latency {db_latency * 1000:.0f} ms")
+    for label, index in (("login turn", 0), ("first post-login turn", 1), ("stale turn", 2)):
+        saved = baseline[index] - concurrent[index]
+        print(
+            f"{label:>22}: no prefetch {baseline[index] * 1000:7.1f} ms | "
+            f"prefetch {concurrent[index] * 1000:7.1f} ms | saved {saved * 1000:6.1f} ms"
+        )
+
+if __name__ == "__main__":
+    main()
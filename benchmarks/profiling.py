@@ -0,0 +1,68 @@
+"""Overhead of the per-request profiler on graph turns
+
+Usage: python -m benchmarks.profiling [turns] [llm latency s] [interval ms]
+
+Runs the same conversation with and without the request profiler and reports
+wall time and process CPU time per turn.
+"""
+
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from langchain_core.messages import HumanMessage
+
+from app.profiling import RequestProfiler
+from benchmarks.stubs import install_stub
+from graph.builder import create_healthcare_chatbot
+
+SCRIPT = [
+    "Show me my appointments",
+    "I want to confirm the blood test",
+    "What are my appointments again?",
+]
+
+
+def run(app, turns: int, directory: str, interval: float, profile: bool):
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+    app.invoke(
+        {"messages": [HumanMessage(content="I'm John Smith, 555-010-1001, 1985-03-15")]},
+        config,
+    )
+    walls, cpus = [], []
+    for turn in range(turns):
+        graph_input = {"messages": [HumanMessage(content=SCRIPT[turn % len(SCRIPT)])]}
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile:
+            with RequestProfiler(directory, f"bench-{turn}", interval) as profiler:
+                app.invoke(graph_input, {**config, "callbacks": profiler.callbacks})
+        else:
+            app.invoke(graph_input, config)
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    return walls, cpus
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    interval = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.005
+    install_stub(latency)
+    app = create_healthcare_chatbot()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {
+            label: run(app, turns, directory, interval, profile)
+            for label, profile in (("off", False), ("on", True))
+        }
+    print(f"{'profiler':>8} {'wall ms':>8} {'cpu ms':>8}")
+    for label, (walls, cpus) in results.items():
+        print(
+            f"{label:>8} {statistics.mean(walls) * 1000:8.1f} "
+            f"{statistics.mean(cpus) * 1000:8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
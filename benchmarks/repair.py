@@ -0,0 +1,182 @@
+"""Near-miss structured outputs: local repair vs the old failure path
+
+Usage: python -m benchmarks.repair [llm latency s]
+
+Each case makes the stub model's first structured answer a near miss (a
+date of birth as 15/03/1985, intent "Cancel appointment", appointment id
+"#2", ...) and runs the node that asked for it. An ambiguous date of birth
+(03/04/1985) is right when the user is asked which date they meant. Later calls, such as an
+escalation or a re-ask, get the stub's normal answer. Compared:
+
+- legacy: structured output parsed straight into the schema, as before
+  graph/repair.py. Parse failures escalate to the large tier or fall back,
+  and values that parse but are misformatted pass through. The nodes are
+  today's, so the introduction node's old extra error-message call isn't
+  counted.
+- repaired: near misses fixed locally; fields that can't be are re-asked.
+
+Reports model calls, estimated tokens and wall time per case, and whether
+the node ended with the right outcome.
+"""
+
+import sys
+import time
+from langchain_core.messages import HumanMessage
+
+import graph.llm
+import graph.nodes
+from benchmarks.stubs import install_stub
+
+LOGIN = "Hi, I'm John Smith, 555-010-1001, 1985-03-15"
+
+
+def near_miss(schema: str, **fields):
+    """Mangle the first ``schema`` answer of a case, then answer normally"""
+    pending = [True]
+
+    def mangle(name: str, args: dict) -> dict:
+        if name != schema or not pending:
+            return args
+        pending.clear()
+        return {**args, **fields}
+
+    return mangle
+
+
+def introduction(expected_dob: str):
+    def run():
+        result = graph.nodes.introduction_node({"messages": [HumanMessage(content=LOGIN)]})
+        return result.get("user_data", {}).get("date_of_birth") == expected_dob
+
+    return run
+
+
+def asks_which_date():
+    def run():
+        result = graph.nodes.introduction_node({"messages": [HumanMessage(content=LOGIN)]})
+        message = result["messages"][-1].content
+        return "user_data" not in result and "March 4" in message and "April 3" in message
+
+    return run
+
+
+def identity(field: str, expected: str):
+    def run():
+        result = graph.nodes.introduction_node({"messages": [HumanMessage(content=LOGIN)]})
+        return result.get("user_data", {}).get(field) == expected
+
+    return run
+
+
+def intent(text: str, expected: str):
+    def run():
+        result = graph.nodes.chatbot_node(
+            {
+                "messages": [HumanMessage(content=text)],
+                "user_verified": True,
+                "user_data": {"user_id": 1},
+            }
+        )
+        return result.get("intent") == expected
+
+    return run
+
+
+def decision(node: str, expected: int):
+    appointments = [
+        {"id": 1, "date": "2099-01-05", "time": "09:00", "doctor": "Dr. Anderson", "type": "General Checkup", "status": "scheduled"},
+        {"id": 2, "date": "2099-01-07", "time": "14:30", "doctor": "Dr. Brown", "type": "Blood Test", "status": "scheduled"},
+    ]
+    written = []
+
+    class Recorder:
+        @staticmethod
+        def invoke(args):
+            written.append(args["appointment_id"])
+            return {"success": True}
+
+    def run():
+        graph.nodes.update_appointment_status = Recorder
+        # A question is left to the model rather than the resolver
+        getattr(graph.nodes, f"{node}_node")(
+            {
+                "messages": [HumanMessage(content=f"{node} the brown one?")],
+                "user_verified": True,
+                "user_data": {"user_id": 1},
+                "available_appointments": appointments,
+            }
+        )
+        return written[-1:] == [expected]
+
+    return run
+
+
+CASES = [
+    ("dob 15/03/1985", "UserDataExtraction", dict(date_of_birth="15/03/1985"), introduction("1985-03-15")),
+    ("dob 15th March 1985", "UserDataExtraction", dict(date_of_birth="15th March 1985"), introduction("1985-03-15")),
+    ("phone +1 (555) 010-1001", "UserDataExtraction", dict(phone_number="+1 (555) 010-1001"), identity("phone_number", "555-010-1001")),
+    ("name in lower case", "UserDataExtraction", dict(full_name="john smith"), identity("full_name", "John Smith")),
+    ("dob unreadable", "UserDataExtraction", dict(date_of_birth="sometime in March"), introduction("1985-03-15")),
+    ("dob 03/04/1985 (ambiguous)", "UserDataExtraction", dict(date_of_birth="03/04/1985"), asks_which_date()),
+    ("intent 'Cancel appointment'", "IntentDecision", dict(intent="Cancel appointment"), intent("cancel my appointment", "cancel")),
+    ("intent 'LIST'", "IntentDecision", dict(intent="LIST"), intent("show my appointments", "list")),
+    ("confidence '90%'", "IntentDecision", dict(confidence="90%"), intent("confirm my appointment", "confirm")),
+    ("intent 'maybe'", "IntentDecision", dict(intent="maybe"), intent("cancel my appointment", "cancel")),
+    ("confirm id '#2'", "ConfirmationDecision", dict(confirm_appointment=True, appointment_id="#2"), decision("confirm", 2)),
+    ("cancel id 'appointment 2'", "CancellationDecision", dict(cancel_appointment=True, appointment_id="appointment 2"), decision("cancel", 2)),
+    ("confirm id 'the blood test'", "ConfirmationDecision", dict(confirm_appointment=True, appointment_id="the blood test"), decision("confirm", 2)),
+]
+
+
+def legacy(llm, schema, messages, label=None):
+    """Structured call as before graph/repair.py"""
+    return llm.with_structured_output(schema).invoke(messages)
+
+
+def measure(stub, mangle, run) -> tuple[int, int, float, bool]:
+    stub.mangle = mangle
+    before = len(stub.calls)
+    start = time.perf_counter()
+    ok = run()
+    elapsed = time.perf_counter() - start
+    calls = stub.calls[before:]
+    tokens = sum(call["input_tokens"] + call["output_tokens"] for call in calls)
+    return len(calls), tokens, elapsed * 1000, ok
+
+
+def main():
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.2
+    stub = install_stub(latency)
+    repaired = graph.llm.invoke_repaired
+    update = graph.nodes.update_appointment_status
+
+    print(
+        f"{'case':>30} | {'legacy calls':>12} {'tokens':>6} {'ms':>5} {'ok':>3} | "
+        f"{'repaired calls':>14} {'tokens':>6} {'ms':>5} {'ok':>3}"
+    )
+    totals = {"legacy": [0, 0, 0.0, 0], "repaired": [0, 0, 0.0, 0]}
+    for name, schema, fields, run in CASES:
+        row = []
+        for label, invoke in (("legacy", legacy), ("repaired", repaired)):
+            graph.llm.invoke_repaired = invoke
+            result = measure(stub, near_miss(schema, **fields), run)
+            totals[label] = [a + b for a, b in zip(totals[label], result)]
+            row.append(result)
+        (lc, lt, lm, lok), (rc, rt, rm, rok) = row
+        print(
+            f"{name:>30} | {lc:>12} {lt:>6} {lm:>5.0f} {'y' if lok else 'n':>3} | "
+            f"{rc:>14} {rt:>6} {rm:>5.0f} {'y' if rok else 'n':>3}"
+        )
+    graph.llm.invoke_repaired = repaired
+    graph.nodes.update_appointment_status = update
+    stub.mangle = None
+
+    for label, (calls, tokens, ms, ok) in totals.items():
+        print(
+            f"{label:>9}: {calls} model calls, {tokens:,} tokens, {ms:,.0f} ms, "
+            f"{ok}/{len(CASES)} right outcomes"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Local appointment-reference resolution over a phrase corpus
+
+Usage: python -m benchmarks.resolver
+
+A patient with four upcoming appointments (two with the same doctor, two
+"tests") says each phrase of the corpus in a confirm or cancel turn. Phrases
+marked None are ambiguous, negated or otherwise need the model. Reports per
+category how many the resolver settled locally and whether it picked the
+right appointment, then runs the corpus through confirm_node with the stub
+model to count the ConfirmationDecision calls that were actually made. Cancel
+turns use the stricter RESOLVER_CANCEL_MAX_AMBIGUITY and are reported apart.
+"""
+
+from datetime import date, timedelta
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.stubs import install_stub
+from graph.resolver import CANCEL_MAX_AMBIGUITY, resolve_appointment
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def suffixed(n: int) -> str:
+    suffix = "th" if 10 <= n % 100 < 20 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+
+def fixture(today: date) -> list[dict]:
+    def day(offset: int) -> str:
+        return (today + timedelta(days=offset)).isoformat()
+
+    return [
+        {"id": 11, "date": day(1), "time": "09:00", "doctor": "Dr. Anderson", "type": "General Checkup", "status": "scheduled"},
+        {"id": 12, "date": day(2), "time": "10:15", "doctor": "Dr. Wilson", "type": "Follow-up", "status": "confirmed"},
+        {"id": 13, "date": day(3), "time": "14:30", "doctor": "Dr. Brown", "type": "Blood Test", "status": "scheduled"},
+        {"id": 14, "date": day(9), "time": "11:00", "doctor": "Dr. Brown", "type": "Covid Test", "status": "scheduled"},
+    ]
+
+
+def corpus(appointments: list[dict]) -> list[tuple[str, str, object]]:
+    """(category, phrase, expected appointment id or None)"""
+    day = {apt["id"]: date.fromisoformat(apt["date"]) for apt in appointments}
+    weekday = {i: WEEKDAYS[d.weekday()] for i, d in day.items()}
+    month_day = {i: d.strftime("%B %-d").lower() for i, d in day.items()}
+    return [
+        ("type", "the blood test", 13),
+        ("type", "cancel my blood test please", 13),
+        ("type", "confirm the checkup", 11),
+        ("type", "the general check-up", 11),
+        ("type", "my follow up", 12),
+        ("type", "the followup appointment", 12),
+        ("type", "the covid test", 14),
+        ("type", "the covid one", 14),
+        ("type", "the test", None),
+        ("doctor", "the one with Dr. Anderson", 11),
+        ("doctor", "dr wilson", 12),
+        ("doctor", "my appointment with doctor wilson", 12),
+        ("doctor", "the one with Dr. Brown", None),
+        ("doctor", "Dr. Smith's appointment", None),
+        ("doctor", "brown's blood test", 13),
+        ("doctor", "the covid test with dr brown", 14),
+        ("relative date", "tomorrow's one", 11),
+        ("relative date", "the appointment tomorrow", 11),
+        ("relative date", "the day after tomorrow", 12),
+        ("relative date", f"the one on {weekday[13]}", 13),
+        ("relative date", f"{weekday[12]}'s appointment", 12),
+        ("absolute date", f"the one on {day[13].isoformat()}", 13),
+        ("absolute date", f"{month_day[14]}", 14),
+        ("absolute date", f"on the {suffixed(day[12].day)}", 12),
+        ("absolute date", f"{day[11].month}/{day[11].day}", 11),
+        ("time", "the 9am one", 11),
+        ("time", "the one at 2:30", 13),
+        ("time", "the 11am one", 14),
+        ("time", "the morning appointment", None),
+        ("time", "the afternoon one", 13),
+        ("ordinal", "the first one", 11),
+        ("ordinal", "the second one", 12),
+        ("ordinal", "the 3rd one", 13),
+        ("ordinal", "the last one", 14),
+        ("ordinal", "the first brown one", 13),
+        ("ordinal", "the last test", 14),
+        ("ordinal", "the seventh one", None),
+        ("id", "appointment 13", 13),
+        ("id", "#14", 14),
+        ("needs model", "cancel my appointment", None),
+        ("needs model", "don't cancel the blood test", None),
+        ("needs model", "is the blood test still on?", None),
+        ("needs model", "cancel both tests", None),
+        ("needs model", "not the checkup, the other one", None),
+        ("needs model", "the blood test or the covid test", None),
+        ("needs model", "all of them", None),
+        ("needs model", "yes", None),
+        ("needs model", "the one I booked last month", None),
+        ("needs model", "the one with the nurse", None),
+    ]
+
+
+def main():
+    today = date.today()
+    appointments = fixture(today)
+    cases = corpus(appointments)
+
+    per_category: dict[str, list[int]] = {}
+    for category, phrase, expected in cases:
+        resolution = resolve_appointment(phrase, appointments, today)
+        got = resolution.appointment_id
+        counts = per_category.setdefault(category, [0, 0, 0, 0])
+        counts[0] += 1
+        counts[1] += got is not None and got == expected  # resolved correctly
+        counts[2] += got is not None and got != expected  # resolved wrongly
+        counts[3] += got is None and expected is None  # rightly left to the model
+
+    print(f"{'category':>14} {'phrases':>8} {'local ok':>9} {'wrong':>6} {'to model':>9}")
+    totals = [0, 0, 0, 0]
+    for category, counts in per_category.items():
+        totals = [a + b for a, b in zip(totals, counts)]
+        to_model = counts[0] - counts[1] - counts[2]
+        print(f"{category:>14} {counts[0]:>8} {counts[1]:>9} {counts[2]:>6} {to_model:>9}")
+    phrases, local_ok, wrong, deferred_ok = totals
+    resolvable = sum(expected is not None for _, _, expected in cases)
+    print(
+        f"\n{local_ok}/{resolvable} resolvable phrases settled locally, {wrong} wrong, "
+        f"{deferred_ok}/{phrases - resolvable} ambiguous phrases left to the model"
+    )
+
+    # Cancel turns settle only references without a runner-up
+    strict = [
+        (resolve_appointment(phrase, appointments, today, CANCEL_MAX_AMBIGUITY), expected)
+        for _, phrase, expected in cases
+    ]
+    local = [(r.appointment_id, expected) for r, expected in strict if r.appointment_id]
+    print(
+        f"cancel (max ambiguity {CANCEL_MAX_AMBIGUITY:g}): {len(local)}/{resolvable} "
+        f"settled locally, {sum(got != expected for got, expected in local)} wrong"
+    )
+
+    # Same corpus through confirm_node with the stub model
+    stub = install_stub()
+    import graph.nodes
+
+    graph.nodes.update_appointment_status = type(
+        "NoWrite", (), {"invoke": staticmethod(lambda args: {"success": True})}
+    )
+    for _, phrase, _ in cases:
+        graph.nodes.confirm_node(
+            {
+                "messages": [HumanMessage(content=f"confirm {phrase}")],
+                "user_verified": True,
+                "user_data": {"user_id": 1},
+                "available_appointments": appointments,
+            }
+        )
+    decisions = sum(call["schema"] == "ConfirmationDecision" for call in stub.calls)
+    print(
+        f"confirm_node: {decisions} ConfirmationDecision calls for {phrases} turns "
+        f"({1 - decisions / phrases:.0%} of turns skipped the decision model)"
+    )
+
+
+if __name__ == "__main__":
+    main()
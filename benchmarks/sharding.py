@@ -0,0 +1,130 @@
+"""Write throughput vs shard count, and an online rebalance under write load
+
+Usage: python -m benchmarks.sharding [patients] [writers] [seconds]
+
+Each configuration gets fresh database files in a temporary directory with
+the default durability (WAL, synchronous=FULL), and ``writers`` threads
+issuing update_appointment_status for random appointments. The tool's
+function is called directly: LangChain's tool wrapper costs several times
+more CPU than the write itself and would hide the storage layer. The rebalance
+run grows 4 shards to 8 through a separate connection set (as
+``main.py rebalance`` would from another process) while writers keep going,
+then checks that every appointment exists exactly once with its last write.
+"""
+
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import app.tools
+from app.database import directory_connection, open_database
+from app.events import EventLog
+from app.tools import update_appointment_status
+
+STATUSES = ["scheduled", "confirmed"]
+
+
+def seed(db, patients: int) -> list[int]:
+    db.add_patients(
+        [(i, f"Patient {i}", "555-000-0000", "1980-01-01") for i in range(1, patients + 1)]
+    )
+    return db.add_appointments(
+        [
+            (
+                None,
+                patient_id,
+                "2030-01-01",
+                f"{9 + slot:02d}:00",
+                f"Dr. Shard{patient_id}",
+                "Checkup",
+                "scheduled",
+            )
+            for patient_id in range(1, patients + 1)
+            for slot in range(2)
+        ]
+    )
+
+
+def write_load(ids: list[int], writers: int, seconds: float, last: dict) -> int:
+    """Run writers for ``seconds``; writer k owns ids[k::writers] so the last
+    status written to each appointment is known"""
+    stop = time.perf_counter() + seconds
+    counts = [0] * writers
+
+    def writer(k: int):
+        rng = random.Random(k)
+        owned = ids[k::writers]
+        while time.perf_counter() < stop:
+            appointment_id = rng.choice(owned)
+            status = rng.choice(STATUSES)
+            update_appointment_status.func(appointment_id, status)
+            last[appointment_id] = status
+            counts[k] += 1
+
+    threads = [threading.Thread(target=writer, args=(k,)) for k in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts)
+
+
+def main():
+    patients = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    writers = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 3.0
+
+    print(f"{'shards':>6} {'updates/s':>10} {'speedup':>8}")
+    baseline = None
+    for shards in (1, 2, 4, 8):
+        with tempfile.TemporaryDirectory() as directory:
+            app.tools.DB = db = open_database(directory, shards)
+            app.tools.EVENTS = EventLog(db, directory_connection(db))
+            app.tools._shard_name.cache_clear()
+            ids = seed(db, patients)
+            rate = write_load(ids, writers, seconds, {}) / seconds
+            baseline = baseline or rate
+            print(f"{shards:>6} {rate:>10,.0f} {rate / baseline:>7.1f}x")
+
+    with tempfile.TemporaryDirectory() as directory:
+        app.tools.DB = db = open_database(directory, 4)
+        app.tools.EVENTS = EventLog(db, directory_connection(db))
+        app.tools._shard_name.cache_clear()
+        ids = seed(db, patients)
+        last: dict[int, str] = {}
+        moved = []
+        rebalancer = threading.Thread(
+            target=lambda: moved.append(open_database(directory, 8).rebalance())
+        )
+        start = time.perf_counter()
+        rebalancer.start()
+        updates = write_load(ids, writers, seconds, last)
+        rebalancer.join()
+        elapsed = time.perf_counter() - start
+
+        db.reload()
+        rows = {}
+        duplicates = 0
+        for shard in db.shards:
+            for appointment_id, status in shard.conn.execute(
+                "SELECT id, status FROM appointments"
+            ):
+                duplicates += appointment_id in rows
+                rows[appointment_id] = status
+        missing = len(set(ids) - set(rows))
+        lost = sum(rows.get(i) != status for i, status in last.items())
+        per_shard = [
+            shard.conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+            for shard in db.shards
+        ]
+        print(
+            f"rebalance 4 -> 8 shards: {moved[0]:,} of {patients:,} patients moved in "
+            f"{elapsed:.1f}s alongside {updates:,} updates | patients per shard {per_shard} | "
+            f"missing {missing}, duplicated {duplicates}, lost writes {lost}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Soak test: memory of the bounded checkpointer over many short sessions
+
+Usage: python -m benchmarks.soak [sessions] [budget MiB]
+
+A few real conversations are run through the graph (stub model) to capture
+realistic checkpoints and pending writes; the soak then writes the final
+checkpoint of one of them into the saver for each simulated session and
+reads it back like the next turn would. RSS and the saver's gauges are sampled along the way: with a byte
+budget smaller than the working set both should plateau.
+"""
+
+import random
+import sys
+import time
+import uuid
+from langchain_core.messages import HumanMessage
+
+import graph.builder
+from benchmarks.stubs import install_stub
+from graph.checkpoint import BoundedCheckpointSaver
+
+SCRIPT = [
+    "I'm John Smith, 555-010-1001, 1985-03-15",
+    "Show me my appointments",
+    "I want to confirm the blood test",
+    "Please cancel my general checkup",
+]
+
+
+def rss_mib() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * 4096 / 1024 / 1024
+
+
+class Recorder(BoundedCheckpointSaver):
+    """Bounded saver that also records every put/put_writes it receives"""
+
+    def __init__(self):
+        super().__init__(max_bytes=1 << 40)
+        self.log = []
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        self.log.append(("put", config, checkpoint, metadata, new_versions))
+        return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        self.log.append(("put_writes", config, writes, task_id, task_path))
+        super().put_writes(config, writes, task_id, task_path)
+
+
+def record_sessions(count: int) -> list[list[tuple]]:
+    """Final checkpoint and writes of ``count`` real conversations"""
+    recorder = Recorder()
+    graph.builder.create_checkpointer = lambda: recorder
+    app = graph.builder.create_healthcare_chatbot()
+    sessions = []
+    for i in range(count):
+        recorder.log = []
+        config = {"configurable": {"thread_id": f"recorded-{i}"}}
+        for text in SCRIPT[: 2 + i % 3]:
+            app.invoke({"messages": [HumanMessage(content=text)]}, config)
+        last_put = max(i for i, call in enumerate(recorder.log) if call[0] == "put")
+        sessions.append(recorder.log[last_put:])
+    return sessions
+
+
+def rebind(config: dict, thread_id: str) -> dict:
+    return {"configurable": {**config["configurable"], "thread_id": thread_id}}
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    budget_mib = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    install_stub()
+    sessions = record_sessions(12)
+
+    saver = BoundedCheckpointSaver(max_bytes=budget_mib * 1024 * 1024, ttl_seconds=600)
+    rng = random.Random(7)
+    live: list[str] = []
+    resumed = 0
+    start = time.perf_counter()
+    print(f"{'sessions':>10} {'rss MiB':>8} {'held':>8} {'bytes MiB':>10} {'evicted':>9} {'ops/s':>8}")
+    for n in range(1, total + 1):
+        # One in five sessions is a returning user picking up an older thread
+        if live and rng.random() < 0.2:
+            thread_id = live[rng.randrange(len(live))]
+            resumed += saver.get_tuple({"configurable": {"thread_id": thread_id}}) is not None
+        else:
+            thread_id = str(uuid.uuid4())
+            if len(live) < 10_000:
+                live.append(thread_id)
+            else:
+                live[rng.randrange(len(live))] = thread_id
+
+        for call in sessions[n % len(sessions)]:
+            if call[0] == "put":
+                _, config, checkpoint, metadata, new_versions = call
+                saver.put(rebind(config, thread_id), checkpoint, metadata, new_versions)
+            else:
+                _, config, writes, task_id, task_path = call
+                saver.put_writes(rebind(config, thread_id), writes, task_id, task_path)
+        saver.get_tuple({"configurable": {"thread_id": thread_id}})
+
+        if n % (total // 10 or 1) == 0:
+            gauges = saver.gauges()
+            print(
+                f"{n:>10} {rss_mib():8.1f} {gauges['sessions']:>8} "
+                f"{gauges['bytes'] / 1024 / 1024:10.1f} "
+                f"{gauges['evicted_ttl'] + gauges['evicted_memory']:>9} "
+                f"{n / (time.perf_counter() - start):8.0f}"
+            )
+    print(f"returning sessions found their checkpoint: {resumed}")
+
+
+if __name__ == "__main__":
+    main()
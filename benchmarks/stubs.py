@@ -0,0 +1,246 @@
+"""Stub chat model used to drive the graph offline"""
+
+import random
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from pydantic import ValidationError
+
+from graph.models import *
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def _last_human(messages: list) -> str:
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return message.content
+    return ""
+
+
+def _system(messages: list) -> str:
+    return "\n".join(m.content for m in messages if isinstance(m, SystemMessage))
+
+
+def _match_appointment(system_prompt: str, text: str) -> Optional[int]:
+    """Pick the single appointment from the prompt whose type/doctor is mentioned"""
+    text = text.lower()
+    matches = []
+    # Rows of the id|date|time|doctor|type|status table (encode_appointments)
+    for apt_id, doctor, apt_type in re.findall(
+        r"^(\d+)\|[^|]*\|[^|]*\|([^|]*)\|([^|]*)\|", system_prompt, re.M
+    ):
+        surname = doctor.replace("Dr.", "").strip().lower()
+        if apt_type.lower() in text or (surname and surname in text):
+            matches.append(int(apt_id))
+    return matches[0] if len(matches) == 1 else None
+
+
+def respond(schema: Optional[type], messages: list) -> Any:
+    """Heuristic stand-in for the model: keyword rules per output schema"""
+    text = _last_human(messages)
+    lowered = text.lower()
+
+    if schema is UserDataExtraction:
+        human = " ".join(m.content for m in messages if isinstance(m, HumanMessage))
+        phone = re.search(r"\d{3}[-. ]?\d{3}[-. ]?\d{4}", human)
+        dob = re.search(r"\d{4}-\d{2}-\d{2}", human)
+        name = re.search(r"([A-Z][a-z]+(?: [A-Z][a-z]+)+)", human)
+        complete = bool(phone and dob and name)
+        return UserDataExtraction(
+            data_complete=complete,
+            full_name=name.group(1) if name else None,
+            phone_number=phone.group(0) if phone else None,
+            date_of_birth=dob.group(0) if dob else None,
+            message="Thanks!" if complete else "Please share your details.",
+        )
+    if schema is IntentDecision:
+        intent = "end"
+        if any(word in lowered for word in ("reschedule", "book", "move", "slot")):
+            intent = "reschedule"
+        elif "cancel" in lowered:
+            intent = "cancel"
+        elif "confirm" in lowered:
+            intent = "confirm"
+        elif any(word in lowered for word in ("list", "show", "appointments")):
+            intent = "list"
+        return IntentDecision(intent=intent, message="Sure.")
+    if schema in (ConfirmationDecision, CancellationDecision):
+        apt_id = _match_appointment(_system(messages), text)
+        field = (
+            "confirm_appointment"
+            if schema is ConfirmationDecision
+            else "cancel_appointment"
+        )
+        return schema(
+            **{field: apt_id is not None},
+            appointment_id=apt_id,
+            message="Done." if apt_id else "Which appointment do you mean?",
+        )
+    if schema is RescheduleDecision:
+        system_prompt = _system(messages)
+        recent = " ".join(m.content for m in messages if isinstance(m, HumanMessage))
+        apt_id = _match_appointment(system_prompt, recent)
+        doctor = re.search(r"(?:dr\.?|doctor) ([a-z]+)", lowered)
+        slot = None
+        if "first" in lowered:
+            slot = re.search(r"^1\. .+? on (\S+) at (\S+)$", system_prompt, re.M)
+        return RescheduleDecision(
+            appointment_id=apt_id,
+            doctor_name=doctor.group(1) if doctor else None,
+            slot_date=slot.group(1) if slot else None,
+            slot_time=slot.group(2) if slot else None,
+            message="Which doctor would you like to see?",
+        )
+    if schema is not None:
+        return schema(message="OK.")
+    return "Here you go."
+
+
+def degrade(result: Any, rng: random.Random) -> Any:
+    """A plausible model mistake: unsure or wrong intent, nonexistent appointment"""
+    if isinstance(result, IntentDecision):
+        wrong = rng.choice(["list", "confirm", "cancel", "reschedule", "end"])
+        # Mostly the mistake is flagged with low confidence, sometimes not
+        confidence = 0.3 if rng.random() < 0.7 else 0.9
+        return result.model_copy(update={"intent": wrong, "confidence": confidence})
+    if isinstance(result, (ConfirmationDecision, CancellationDecision)):
+        return result.model_copy(update={"appointment_id": 9999})
+    return result
+
+
+class StubChatModel:
+    """Drop-in replacement for ChatAnthropic with a fixed per-call latency.
+
+    ``profiles`` maps model names to ``{"latency", "error_rate"}`` overrides so
+    a fast and a large tier can be simulated side by side. ``mangle``, if set,
+    rewrites structured outputs' arguments (schema name, args) -> args before
+    they are parsed, to produce near-miss outputs.
+    """
+
+    latency: float = 0.0
+    calls: list[dict] = []
+    profiles: dict[str, dict] = {}
+    mangle: Optional[Callable[[str, dict], dict]] = None
+    rng = random.Random(0)
+
+    def __init__(self, model: str = "stub", **kwargs):
+        self.model = model
+        self.schema = None
+        self.include_raw = False
+
+    def with_structured_output(self, schema, include_raw: bool = False):
+        structured = StubChatModel(self.model)
+        structured.schema = schema
+        structured.include_raw = include_raw
+        return structured
+
+    def invoke(self, messages: list):
+        profile = self.profiles.get(self.model, {})
+        time.sleep(profile.get("latency", self.latency))
+        repairs = getattr(self.schema, "repairs", None)
+        if repairs is not None:
+            # Re-ask for some fields (graph/repair.py): answer the original
+            # question, without the re-ask message, and keep those fields
+            full = respond(repairs, messages[:-1])
+            result = self.schema(**{f: getattr(full, f) for f in self.schema.model_fields})
+        else:
+            result = respond(self.schema, messages)
+        if self.rng.random() < profile.get("error_rate", 0.0):
+            result = degrade(result, self.rng)
+        parsing_error = None
+        if self.schema is not None and StubChatModel.mangle and repairs is None:
+            args = StubChatModel.mangle(self.schema.__name__, result.model_dump())
+            try:
+                result = self.schema.model_validate(args)
+            except ValidationError as e:
+                result, parsing_error = args, e
+        text = (
+            result
+            if isinstance(result, str)
+            else str(result) if isinstance(result, dict) else result.model_dump_json()
+        )
+        input_tokens = sum(estimate_tokens(str(m.content)) for m in messages)
+        output_tokens = estimate_tokens(text)
+        StubChatModel.calls.append(
+            {
+                "model": self.model,
+                "schema": self.schema.__name__ if self.schema else None,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+            }
+        )
+        if self.schema is not None and self.include_raw:
+            args = result if isinstance(result, dict) else result.model_dump()
+            return {
+                "raw": AIMessage(
+                    content="",
+                    tool_calls=[
+                        {"name": self.schema.__name__, "args": args, "id": f"toolu_{uuid.uuid4().hex}"}
+                    ],
+                ),
+                "parsed": None if parsing_error else result,
+                "parsing_error": parsing_error,
+            }
+        if parsing_error:
+            raise parsing_error
+        if self.schema is not None:
+            return result
+        return AIMessage(
+            content=text,
+            # Same shape as the metadata ChatAnthropic attaches to every reply
+            response_metadata={
+                "id": f"msg_{uuid.uuid4().hex}",
+                "model": self.model,
+                "model_name": self.model,
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens,
+                    "cache_creation_input_tokens": 0,
+                    "cache_read_input_tokens": 0,
+                    "server_tool_use": None,
+                    "service_tier": "standard",
+                },
+            },
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+    def batch(
+        self, inputs: list, config: Optional[dict] = None, return_exceptions=False
+    ) -> list:
+        """Run invoke over inputs with at most ``max_concurrency`` in flight"""
+        workers = (config or {}).get("max_concurrency") or 8
+
+        def run(messages):
+            try:
+                return self.invoke(messages)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(run, inputs))
+
+
+def install_stub(latency: float = 0.0) -> type[StubChatModel]:
+    """Route every node's model construction to StubChatModel"""
+    import graph.llm
+
+    StubChatModel.latency = latency
+    StubChatModel.calls = []
+    StubChatModel.mangle = None
+    graph.llm.ChatAnthropic = StubChatModel
+    return StubChatModel
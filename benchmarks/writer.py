@@ -0,0 +1,105 @@
+"""Status-update throughput and request-path latency: a commit per update vs
+the write-behind group-commit writer
+
+Usage: python -m benchmarks.writer [writers] [seconds] [patients]
+
+Each run gets fresh 4-shard database files with the default durability (WAL,
+synchronous=FULL), and 1 up to ``writers`` threads updating random
+appointments for ``seconds``:
+
+- per-update: update_appointment_status commits each update in its own
+  transaction before returning
+- write-behind: update_appointment_status(wait=False) returns once queued;
+  the writer is flushed before the clock stops
+
+Latency is measured per update call, on the caller's thread.
+"""
+
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import app.tools
+from app.database import directory_connection, open_database
+from app.events import EventLog
+from app.tools import STATUS_WRITER, update_appointment_status
+from benchmarks.sharding import STATUSES, seed
+
+
+def per_update(appointment_id: int, status: str):
+    update_appointment_status.func(appointment_id, status)
+
+
+def write_behind(appointment_id: int, status: str):
+    update_appointment_status.func(appointment_id, status, wait=False)
+
+
+def run(update, writers: int, seconds: float, patients: int) -> tuple[float, float, float, bool]:
+    """(updates/s, p50 ms, p99 ms, every last write stored)"""
+    with tempfile.TemporaryDirectory() as directory:
+        app.tools.DB = db = open_database(directory, 4)
+        app.tools.EVENTS = EventLog(db, directory_connection(db))
+        app.tools._shard_name.cache_clear()
+        ids = seed(db, patients)
+        stop = time.perf_counter() + seconds
+        latencies: list[list[float]] = [[] for _ in range(writers)]
+        last: dict[int, str] = {}
+
+        def writer(k: int):
+            rng = random.Random(k)
+            owned = ids[k::writers]
+            while time.perf_counter() < stop:
+                appointment_id, status = rng.choice(owned), rng.choice(STATUSES)
+                start = time.perf_counter()
+                update(appointment_id, status)
+                latencies[k].append(time.perf_counter() - start)
+                last[appointment_id] = status
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=writer, args=(k,)) for k in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        STATUS_WRITER.flush()
+        elapsed = time.perf_counter() - start
+
+        stored = {}
+        for shard in db.shards:
+            stored.update(shard.conn.execute("SELECT id, status FROM appointments"))
+        intact = all(stored.get(i) == status for i, status in last.items())
+        samples = sorted(x for per_writer in latencies for x in per_writer)
+        p50 = samples[len(samples) // 2] * 1000
+        p99 = samples[int(len(samples) * 0.99)] * 1000
+        return len(samples) / elapsed, p50, p99, intact
+
+
+def main():
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    patients = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+
+    modes = (
+        ("per-update", per_update),
+        ("write-behind", write_behind),
+    )
+    print(
+        f"commit delay bound {STATUS_WRITER.max_delay * 1000:.1f} ms, "
+        f"queue bound {STATUS_WRITER.max_pending}"
+    )
+    print(f"{'writers':>7} {'mode':>12} {'updates/s':>10} {'p50 ms':>7} {'p99 ms':>7} {'intact':>7}")
+    counts = sorted({1, min(8, writers), writers})
+    for count in counts:
+        for name, update in modes:
+            rate, p50, p99, intact = run(update, count, seconds, patients)
+            print(
+                f"{count:>7} {name:>12} {rate:>10,.0f} {p50:>7.2f} {p99:>7.2f} "
+                f"{'yes' if intact else 'NO':>7}"
+            )
+    print(f"writer: {STATUS_WRITER.updates:,} updates in {STATUS_WRITER.batches:,} batches")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,35 @@
 """Graph construction and workflow definition"""
 
+import os
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import InMemorySaver
+from graph.checkpoint import (
+    BoundedCheckpointSaver,
+    CompactCheckpointSaver,
+    SqliteCheckpointSaver,
+)
 from graph.models import ChatbotState
 from graph.nodes import *
 from graph.routing import *
 
 
+def create_checkpointer():
+    """Checkpointer selected by ``CHECKPOINTER``: ``compact`` (default) keeps
+    every checkpoint as deltas; ``bounded`` keeps only the latest per thread
+    and evicts idle/least recently used threads to stay within a byte budget;
+    ``sqlite`` keeps the latest per thread in ``CHECKPOINT_DB``, shared by the
+    API and batch jobs such as ``main.py campaign``.
+    """
+    kind = os.getenv("CHECKPOINTER", "compact")
+    if kind == "sqlite":
+        return SqliteCheckpointSaver(os.getenv("CHECKPOINT_DB", "checkpoints.db"))
+    if kind == "bounded":
+        return BoundedCheckpointSaver(
+            max_bytes=int(os.getenv("CHECKPOINT_MAX_MB", "256")) * 1024 * 1024,
+            ttl_seconds=float(os.getenv("CHECKPOINT_TTL_SECONDS", "3600")),
+        )
+    return CompactCheckpointSaver()
+
+
 def create_healthcare_chatbot():
     """Create the healthcare chatbot following the diagram"""
 
@@ -19,6 +42,7 @@ def create_healthcare_chatbot():
     workflow.add_node("list", list_node)
     workflow.add_node("confirm", confirm_node)
     workflow.add_node("cancel", cancel_node)
+    workflow.add_node("reschedule", reschedule_node)
 
     # MODIFICATION: Smart entry with auth bypass
     # Instead of: workflow.add_edge(START, "introduction")
@@ -26,7 +50,14 @@ def create_healthcare_chatbot():
     workflow.add_conditional_edges(
         START,
         entry_point_routing,  # Use new routing function
-        {"chatbot": "chatbot", "introduction": "introduction"},
+        {
+            "chatbot": "chatbot",
+            "introduction": "introduction",
+            # Follow-ups to a node's clarifying question go straight back to it
+            "confirm": "confirm",
+            "cancel": "cancel",
+            "reschedule": "reschedule",
+        },
     )
 
     # Following the diagram exactly:
@@ -40,18 +71,25 @@ def create_healthcare_chatbot():
         "auth", route_from_auth, {"chatbot": "chatbot", END: END}
     )
 
-    # Chatbot -> List/Confirm/Cancel/End (conditional: based on intent)
+    # Chatbot -> List/Confirm/Cancel/Reschedule/End (conditional: based on intent)
     workflow.add_conditional_edges(
         "chatbot",
         route_from_chatbot,
-        {"list": "list", "confirm": "confirm", "cancel": "cancel", END: END},
+        {
+            "list": "list",
+            "confirm": "confirm",
+            "cancel": "cancel",
+            "reschedule": "reschedule",
+            END: END,
+        },
     )
 
     # All feature nodes -> End (simple edges)
     workflow.add_edge("list", END)
     workflow.add_edge("confirm", END)
     workflow.add_edge("cancel", END)
+    workflow.add_edge("reschedule", END)
 
-    # Compile with memory for thread persistence
-    memory = InMemorySaver()
+    # Compile with memory for thread persistence; see create_checkpointer
+    memory = create_checkpointer()
     return workflow.compile(checkpointer=memory)
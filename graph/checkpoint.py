@@ -0,0 +1,820 @@
+"""Compact checkpoint storage: stripped messages, binary encoding, per-turn deltas,
+a bounded latest-only saver for deployments without durability needs, and a
+SQLite-backed saver shared between processes"""
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from typing import Any, Iterator, Optional, Sequence
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+MESSAGES_CHANNEL = "messages"
+
+
+def strip_metadata(value: Any) -> Any:
+    """Drop provider metadata (ids, stop reasons, usage) from any nested messages"""
+    if isinstance(value, BaseMessage):
+        update = {"response_metadata": {}}
+        if isinstance(value, AIMessage):
+            update["usage_metadata"] = None
+        return value.model_copy(update=update)
+    if isinstance(value, list):
+        return [strip_metadata(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(strip_metadata(item) for item in value)
+    if isinstance(value, dict):
+        return {key: strip_metadata(item) for key, item in value.items()}
+    return value
+
+
+class CompactSerializer:
+    """msgpack encoding of metadata-stripped values, zlib-compressed when large"""
+
+    def __init__(self, compress_over: int = 512, level: int = 6):
+        self.compress_over = compress_over
+        self.level = level
+        self._inner = JsonPlusSerializer()
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        type_, data = self._inner.dumps_typed(strip_metadata(obj))
+        if len(data) > self.compress_over:
+            return f"z{type_}", zlib.compress(data, self.level)
+        return type_, data
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.startswith("z"):
+            type_, payload = type_[1:], zlib.decompress(payload)
+        return self._inner.loads_typed((type_, payload))
+
+
+def _common_prefix(old: list, new: list) -> int:
+    """Number of leading messages unchanged between two message lists"""
+    size = 0
+    for before, after in zip(old, new):
+        if before is not after and (before.id != after.id or before != after):
+            break
+        size += 1
+    return size
+
+
+class SyncSaverMixin:
+    """Async checkpointer API served by the in-memory sync implementation"""
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        self.delete_thread(thread_id)
+
+
+def _checkpoint_config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> dict:
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint_id,
+        }
+    }
+
+
+def _store_writes(stored: dict, serde, writes, task_id: str, task_path: str):
+    """Add pending writes keyed like InMemorySaver: (task ID, write index)"""
+    for idx, (channel, value) in enumerate(writes):
+        inner_key = (task_id, WRITES_IDX_MAP.get(channel, idx))
+        if inner_key[1] >= 0 and inner_key in stored:
+            continue
+        stored[inner_key] = (task_id, channel, serde.dumps_typed(value), task_path)
+
+
+def _load_writes(stored: dict, serde) -> list:
+    """Pending writes in the order the graph applied them"""
+    ordered = sorted(stored.items(), key=lambda item: (item[1][3], *item[0]))
+    return [
+        (task_id, channel, serde.loads_typed(value))
+        for _, (task_id, channel, value, _) in ordered
+    ]
+
+
+class CompactCheckpointSaver(SyncSaverMixin, BaseCheckpointSaver[int]):
+    """In-memory checkpointer that stores per-turn deltas against full snapshots.
+
+    Every ``snapshot_every``-th checkpoint of a thread is stored in full. The
+    ones in between only hold the channels that changed and, for the message
+    history, the messages appended since the parent checkpoint. Loading
+    replays at most ``snapshot_every - 1`` deltas on top of the last snapshot.
+    """
+
+    def __init__(self, snapshot_every: int = 8, serde=None):
+        super().__init__(serde=serde or CompactSerializer())
+        self.snapshot_every = snapshot_every
+        # (thread ID, checkpoint NS) -> checkpoint ID -> (payload, parent ID, is full)
+        self.storage: defaultdict[tuple[str, str], dict[str, tuple]] = defaultdict(
+            dict
+        )
+        # (thread ID, checkpoint NS, checkpoint ID) -> (task ID, idx) -> write
+        self.writes: defaultdict[tuple[str, str, str], dict] = defaultdict(dict)
+        # (thread ID, checkpoint NS) -> (checkpoint ID, channel values, chain length)
+        self._heads: dict[tuple[str, str], tuple[str, dict, int]] = {}
+        self._lock = threading.RLock()
+
+    # -------------------------------------------------------------------------
+    # Encoding
+    # -------------------------------------------------------------------------
+
+    def _encode_delta(self, parent_values: dict, values: dict, changed: set) -> dict:
+        delta: dict[str, Any] = {
+            "values": {
+                k: v
+                for k, v in values.items()
+                if k in changed and k != MESSAGES_CHANNEL
+            },
+            "removed": [k for k in parent_values if k not in values],
+        }
+        if MESSAGES_CHANNEL in changed and MESSAGES_CHANNEL in values:
+            old = parent_values.get(MESSAGES_CHANNEL, [])
+            new = values[MESSAGES_CHANNEL]
+            keep = _common_prefix(old, new)
+            delta["messages"] = (keep, new[keep:])
+        return delta
+
+    def _load(self, key: tuple[str, str], checkpoint_id: str):
+        """Rebuild (checkpoint, metadata, channel values) by replaying deltas"""
+        records = self.storage[key]
+        chain = []
+        cursor = checkpoint_id
+        while True:
+            payload, parent_id, is_full = records[cursor]
+            chain.append(self.serde.loads_typed(payload))
+            if is_full:
+                break
+            cursor = parent_id
+
+        values = dict(chain[-1]["values"])
+        for record in reversed(chain[:-1]):
+            for channel in record["removed"]:
+                values.pop(channel, None)
+            values.update(record["values"])
+            if "messages" in record:
+                keep, tail = record["messages"]
+                values[MESSAGES_CHANNEL] = values.get(MESSAGES_CHANNEL, [])[:keep] + tail
+        head = chain[0]
+        return head["checkpoint"], head["metadata"], values
+
+    # -------------------------------------------------------------------------
+    # BaseCheckpointSaver API
+    # -------------------------------------------------------------------------
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        key = (thread_id, checkpoint_ns)
+
+        c = checkpoint.copy()
+        values = dict(c.pop("channel_values"))
+        # Channels whose values weren't passed keep the parent's value
+        changed = set(new_versions)
+
+        with self._lock:
+            head = self._heads.get(key)
+            if parent_id and parent_id in self.storage[key]:
+                if head and head[0] == parent_id:
+                    parent_values, chain = head[1], head[2]
+                else:
+                    parent_values = self._load(key, parent_id)[2]
+                    chain = self.snapshot_every  # forks start a fresh snapshot
+                for channel, value in parent_values.items():
+                    if channel not in changed and channel in c["channel_versions"]:
+                        values.setdefault(channel, value)
+            else:
+                parent_values, chain = {}, self.snapshot_every
+
+            full = chain + 1 >= self.snapshot_every
+            body = (
+                {"values": values}
+                if full
+                else self._encode_delta(parent_values, values, changed)
+            )
+            body["checkpoint"] = c
+            body["metadata"] = metadata
+            self.storage[key][checkpoint["id"]] = (
+                self.serde.dumps_typed(body),
+                parent_id,
+                full,
+            )
+            self._heads[key] = (checkpoint["id"], values, 0 if full else chain + 1)
+
+        return _checkpoint_config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        with self._lock:
+            stored = self.writes[(thread_id, checkpoint_ns, checkpoint_id)]
+            _store_writes(stored, self.serde, writes, task_id, task_path)
+
+    def _tuple(self, key: tuple[str, str], checkpoint_id: str) -> CheckpointTuple:
+        thread_id, checkpoint_ns = key
+        checkpoint, metadata, values = self._load(key, checkpoint_id)
+        parent_id = self.storage[key][checkpoint_id][1]
+        stored = self.writes.get((thread_id, checkpoint_ns, checkpoint_id), {})
+        return CheckpointTuple(
+            config=_checkpoint_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint={**checkpoint, "channel_values": values},
+            metadata=metadata,
+            parent_config=(
+                _checkpoint_config(thread_id, checkpoint_ns, parent_id)
+                if parent_id
+                else None
+            ),
+            pending_writes=_load_writes(stored, self.serde),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        key = (
+            config["configurable"]["thread_id"],
+            config["configurable"].get("checkpoint_ns", ""),
+        )
+        with self._lock:
+            records = self.storage.get(key)
+            if not records:
+                return None
+            checkpoint_id = get_checkpoint_id(config) or max(records)
+            if checkpoint_id not in records:
+                return None
+            return self._tuple(key, checkpoint_id)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            keys = [
+                key
+                for key in self.storage
+                if config is None
+                or (
+                    key[0] == config["configurable"]["thread_id"]
+                    and config["configurable"].get("checkpoint_ns") in (None, key[1])
+                )
+            ]
+            wanted_id = get_checkpoint_id(config) if config else None
+            before_id = get_checkpoint_id(before) if before else None
+            results = []
+            for key in keys:
+                for checkpoint_id in sorted(self.storage[key], reverse=True):
+                    if wanted_id and checkpoint_id != wanted_id:
+                        continue
+                    if before_id and checkpoint_id >= before_id:
+                        continue
+                    item = self._tuple(key, checkpoint_id)
+                    if filter and not all(
+                        item.metadata.get(k) == v for k, v in filter.items()
+                    ):
+                        continue
+                    if limit is not None and len(results) >= limit:
+                        break
+                    results.append(item)
+        yield from results
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self.storage if k[0] == thread_id]:
+                del self.storage[key]
+                self._heads.pop(key, None)
+            for key in [k for k in self.writes if k[0] == thread_id]:
+                del self.writes[key]
+
+    # -------------------------------------------------------------------------
+    # Accounting
+    # -------------------------------------------------------------------------
+
+    def stored_bytes(self, thread_id: Optional[str] = None) -> int:
+        """Encoded size of checkpoints and pending writes"""
+        with self._lock:
+            total = sum(
+                len(payload[1])
+                for key, records in self.storage.items()
+                if thread_id is None or key[0] == thread_id
+                for payload, _, _ in records.values()
+            )
+            total += sum(
+                len(write[2][1])
+                for key, stored in self.writes.items()
+                if thread_id is None or key[0] == thread_id
+                for write in stored.values()
+            )
+        return total
+
+
+class BoundedCheckpointSaver(SyncSaverMixin, BaseCheckpointSaver[int]):
+    """In-memory checkpointer for deployments that don't need durability.
+
+    Only the latest checkpoint of each thread is kept (no history, so no time
+    travel). Threads idle for longer than ``ttl_seconds`` are dropped, and when
+    the encoded size of all threads exceeds ``max_bytes`` the least recently
+    used threads are evicted. An evicted thread simply starts over.
+    """
+
+    # Rough per-thread bookkeeping cost on top of the encoded payloads
+    ENTRY_OVERHEAD = 400
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024 * 1024,
+        ttl_seconds: float = 3600,
+        serde=None,
+    ):
+        super().__init__(serde=serde or CompactSerializer())
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # (thread ID, checkpoint NS) -> entry, least recently used first
+        self._threads: OrderedDict[tuple[str, str], dict] = OrderedDict()
+        self._bytes = 0
+        self.evictions = {"ttl": 0, "memory": 0}
+        self._lock = threading.RLock()
+
+    # -------------------------------------------------------------------------
+    # Accounting and eviction
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _size(entry: dict) -> int:
+        return (
+            BoundedCheckpointSaver.ENTRY_OVERHEAD
+            + len(entry["payload"][1])
+            + sum(len(write[2][1]) for write in entry["writes"].values())
+        )
+
+    def _resize(self, entry: dict):
+        size = self._size(entry)
+        self._bytes += size - entry["size"]
+        entry["size"] = size
+
+    def _drop(self, key: tuple[str, str], reason: str):
+        entry = self._threads.pop(key)
+        self._bytes -= entry["size"]
+        self.evictions[reason] += 1
+
+    def _evict(self, now: float):
+        # Least recently used first, so expired threads are all at the front
+        while self._threads:
+            key, entry = next(iter(self._threads.items()))
+            if now - entry["touched"] <= self.ttl_seconds:
+                break
+            self._drop(key, "ttl")
+        while self._bytes > self.max_bytes and len(self._threads) > 1:
+            self._drop(next(iter(self._threads)), "memory")
+
+    @property
+    def session_count(self) -> int:
+        return len(self._threads)
+
+    def stored_bytes(self, thread_id: Optional[str] = None) -> int:
+        """Approximate memory held for one thread, or for all of them"""
+        with self._lock:
+            if thread_id is None:
+                return self._bytes
+            return sum(
+                entry["size"]
+                for (tid, _), entry in self._threads.items()
+                if tid == thread_id
+            )
+
+    def gauges(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._threads),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evicted_ttl": self.evictions["ttl"],
+                "evicted_memory": self.evictions["memory"],
+            }
+
+    # -------------------------------------------------------------------------
+    # BaseCheckpointSaver API
+    # -------------------------------------------------------------------------
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = (thread_id, checkpoint_ns)
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+
+        with self._lock:
+            previous = self._threads.get(key)
+            parent_id = config["configurable"].get("checkpoint_id")
+            missing = [
+                channel
+                for channel in c["channel_versions"]
+                if channel not in values and channel not in new_versions
+            ]
+            if missing and previous is not None and previous["id"] == parent_id:
+                # Channels that didn't change this step keep the parent's value
+                parent_values = self.serde.loads_typed(previous["payload"])["values"]
+                for channel in missing:
+                    if channel in parent_values:
+                        values[channel] = parent_values[channel]
+
+            entry = {
+                "id": checkpoint["id"],
+                "parent_id": parent_id,
+                "payload": self.serde.dumps_typed(
+                    {"checkpoint": c, "metadata": metadata, "values": values}
+                ),
+                "writes": {},
+                "touched": time.monotonic(),
+                "size": 0,
+            }
+            if previous is not None:
+                self._bytes -= previous["size"]
+            self._threads[key] = entry
+            self._threads.move_to_end(key)
+            self._resize(entry)
+            self._evict(entry["touched"])
+
+        return _checkpoint_config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        key = (
+            config["configurable"]["thread_id"],
+            config["configurable"].get("checkpoint_ns", ""),
+        )
+        with self._lock:
+            entry = self._threads.get(key)
+            # Writes for anything but the latest checkpoint have nowhere to live
+            if entry is None or entry["id"] != config["configurable"]["checkpoint_id"]:
+                return
+            _store_writes(entry["writes"], self.serde, writes, task_id, task_path)
+            self._resize(entry)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = (thread_id, checkpoint_ns)
+        with self._lock:
+            now = time.monotonic()
+            self._evict(now)
+            entry = self._threads.get(key)
+            checkpoint_id = get_checkpoint_id(config)
+            if entry is None or (checkpoint_id and checkpoint_id != entry["id"]):
+                return None
+            entry["touched"] = now
+            self._threads.move_to_end(key)
+            payload = entry["payload"]
+            writes = dict(entry["writes"])
+
+        body = self.serde.loads_typed(payload)
+        return CheckpointTuple(
+            config=_checkpoint_config(thread_id, checkpoint_ns, entry["id"]),
+            checkpoint={**body["checkpoint"], "channel_values": body["values"]},
+            metadata=body["metadata"],
+            parent_config=(
+                _checkpoint_config(thread_id, checkpoint_ns, entry["parent_id"])
+                if entry["parent_id"]
+                else None
+            ),
+            pending_writes=_load_writes(writes, self.serde),
+        )
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            keys = [
+                key
+                for key in self._threads
+                if config is None or key[0] == config["configurable"]["thread_id"]
+            ]
+        before_id = get_checkpoint_id(before) if before else None
+        count = 0
+        for thread_id, checkpoint_ns in keys:
+            item = self.get_tuple(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}}
+            )
+            if item is None:
+                continue
+            if before_id and item.config["configurable"]["checkpoint_id"] >= before_id:
+                continue
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None and count >= limit:
+                return
+            count += 1
+            yield item
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            for key in [k for k in self._threads if k[0] == thread_id]:
+                entry = self._threads.pop(key)
+                self._bytes -= entry["size"]
+
+
+class SqliteCheckpointSaver(SyncSaverMixin, BaseCheckpointSaver[int]):
+    """Checkpointer persisted in a SQLite file that several processes share.
+
+    Like BoundedCheckpointSaver it keeps only the latest checkpoint of each
+    thread, encoded with CompactSerializer, but nothing is evicted and every
+    write is committed to ``path``. The API server and batch jobs such as
+    ``main.py campaign`` open the same file, so threads written by one are
+    read by the other.
+    """
+
+    def __init__(self, path: str, serde=None):
+        super().__init__(serde=serde or CompactSerializer())
+        self.path = path
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, timeout=30, isolation_level=None
+        )
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                f"PRAGMA synchronous={os.getenv('DB_SYNCHRONOUS', 'FULL')}"
+            )
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                parent_id TEXT,
+                type TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns)
+            );
+            CREATE TABLE IF NOT EXISTS checkpoint_writes (
+                thread_id TEXT NOT NULL,
+                checkpoint_ns TEXT NOT NULL,
+                checkpoint_id TEXT NOT NULL,
+                task_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                type TEXT NOT NULL,
+                value BLOB NOT NULL,
+                task_path TEXT NOT NULL,
+                PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+            );
+            """
+        )
+        self._lock = threading.RLock()
+
+    def _transaction(self):
+        """BEGIN IMMEDIATE, so a read-modify-write can't interleave with
+        another process writing the same thread"""
+        self.conn.execute("BEGIN IMMEDIATE")
+
+    # -------------------------------------------------------------------------
+    # BaseCheckpointSaver API
+    # -------------------------------------------------------------------------
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+        missing = [
+            channel
+            for channel in c["channel_versions"]
+            if channel not in values and channel not in new_versions
+        ]
+
+        with self._lock:
+            self._transaction()
+            try:
+                previous = self.conn.execute(
+                    """SELECT checkpoint_id, type, payload FROM checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ?""",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+                if missing and previous is not None and previous[0] == parent_id:
+                    # Channels that didn't change this step keep the parent's value
+                    parent_values = self.serde.loads_typed(previous[1:])["values"]
+                    for channel in missing:
+                        if channel in parent_values:
+                            values[channel] = parent_values[channel]
+                type_, payload = self.serde.dumps_typed(
+                    {"checkpoint": c, "metadata": metadata, "values": values}
+                )
+                self.conn.execute(
+                    """INSERT OR REPLACE INTO checkpoints
+                    (thread_id, checkpoint_ns, checkpoint_id, parent_id, type, payload)
+                    VALUES (?, ?, ?, ?, ?, ?)""",
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint["id"],
+                        parent_id,
+                        type_,
+                        payload,
+                    ),
+                )
+                # Only the latest checkpoint is kept, and its writes with it
+                self.conn.execute(
+                    """DELETE FROM checkpoint_writes
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id != ?""",
+                    (thread_id, checkpoint_ns, checkpoint["id"]),
+                )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        return _checkpoint_config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = [
+            (WRITES_IDX_MAP.get(channel, idx), channel, *self.serde.dumps_typed(value))
+            for idx, (channel, value) in enumerate(writes)
+        ]
+
+        with self._lock:
+            self._transaction()
+            try:
+                latest = self.conn.execute(
+                    """SELECT 1 FROM checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?""",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+                # Writes for anything but the latest checkpoint have nowhere to live
+                for idx, channel, type_, value in rows if latest else ():
+                    # Regular writes keep the first value, special ones the last
+                    # (as InMemorySaver does)
+                    verb = "INSERT OR IGNORE" if idx >= 0 else "INSERT OR REPLACE"
+                    self.conn.execute(
+                        f"""{verb} INTO checkpoint_writes
+                        (thread_id, checkpoint_ns, checkpoint_id, task_id, idx,
+                         channel, type, value, task_path)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (
+                            thread_id,
+                            checkpoint_ns,
+                            checkpoint_id,
+                            task_id,
+                            idx,
+                            channel,
+                            type_,
+                            value,
+                            task_path,
+                        ),
+                    )
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        with self._lock:
+            row = self.conn.execute(
+                """SELECT checkpoint_id, parent_id, type, payload FROM checkpoints
+                WHERE thread_id = ? AND checkpoint_ns = ?""",
+                (thread_id, checkpoint_ns),
+            ).fetchone()
+            if row is None:
+                return None
+            checkpoint_id, parent_id = row[0], row[1]
+            if get_checkpoint_id(config) not in (None, checkpoint_id):
+                return None
+            writes = self.conn.execute(
+                """SELECT task_id, channel, type, value FROM checkpoint_writes
+                WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+                ORDER BY task_path, task_id, idx""",
+                (thread_id, checkpoint_ns, checkpoint_id),
+            ).fetchall()
+
+        body = self.serde.loads_typed((row[2], row[3]))
+        return CheckpointTuple(
+            config=_checkpoint_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint={**body["checkpoint"], "channel_values": body["values"]},
+            metadata=body["metadata"],
+            parent_config=(
+                _checkpoint_config(thread_id, checkpoint_ns, parent_id)
+                if parent_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((type_, value)))
+                for task_id, channel, type_, value in writes
+            ],
+        )
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config is None:
+                keys = self.conn.execute(
+                    "SELECT thread_id, checkpoint_ns FROM checkpoints"
+                ).fetchall()
+            else:
+                keys = self.conn.execute(
+                    "SELECT thread_id, checkpoint_ns FROM checkpoints WHERE thread_id = ?",
+                    (config["configurable"]["thread_id"],),
+                ).fetchall()
+        before_id = get_checkpoint_id(before) if before else None
+        count = 0
+        for thread_id, checkpoint_ns in keys:
+            item = self.get_tuple(
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}}
+            )
+            if item is None:
+                continue
+            if before_id and item.config["configurable"]["checkpoint_id"] >= before_id:
+                continue
+            if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None and count >= limit:
+                return
+            count += 1
+            yield item
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._transaction()
+            self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self.conn.execute(
+                "DELETE FROM checkpoint_writes WHERE thread_id = ?", (thread_id,)
+            )
+            self.conn.execute("COMMIT")
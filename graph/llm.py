@@ -0,0 +1,89 @@
+"""Model tiers: per-node model selection with escalation to the large tier"""
+
+import logging
+import os
+from typing import Any, Callable, Optional
+from langchain_anthropic import ChatAnthropic
+from dotenv import load_dotenv
+from graph.repair import invoke_repaired
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+FAST = "fast"
+LARGE = "large"
+
+# Routing, greetings and fixed-outcome phrasing go to the fast tier; decisions
+# that touch the database or extract identity data stay on the large tier.
+DEFAULT_TIERS = {
+    "introduction": LARGE,
+    "auth": FAST,
+    "chatbot": FAST,
+    "list": FAST,
+    "confirm": LARGE,
+    "confirm.phrasing": FAST,
+    "cancel": LARGE,
+    "cancel.phrasing": FAST,
+    "reschedule": LARGE,
+    "campaign": FAST,
+}
+
+
+def tier_for(key: str) -> str:
+    """Tier for a node (``"chatbot"``) or node step (``"confirm.phrasing"``).
+
+    ``MODEL_TIERS`` overrides the defaults, e.g. ``MODEL_TIERS=chatbot=large,auth=fast``.
+    """
+    tiers = dict(DEFAULT_TIERS)
+    for item in os.getenv("MODEL_TIERS", "").split(","):
+        if "=" in item:
+            name, tier = item.split("=", 1)
+            tiers[name.strip()] = tier.strip()
+    return tiers.get(key) or tiers.get(key.split(".")[0]) or LARGE
+
+
+def model_for(tier: str) -> str:
+    if tier == FAST:
+        return os.getenv("FAST_MODEL", "claude-3-5-haiku-latest")
+    return os.getenv("DEFAULT_MODEL", "claude-3-7-sonnet-latest")
+
+
+def get_llm(key: str, temperature: float, tier: Optional[str] = None, **kwargs):
+    """Chat model configured for a node's tier"""
+    return ChatAnthropic(
+        model=model_for(tier or tier_for(key)),
+        temperature=temperature,
+        api_key=os.getenv("ANTHROPIC_API_KEY"),
+        **kwargs,
+    )
+
+
+def invoke_structured(
+    key: str,
+    schema: type,
+    messages: list,
+    temperature: float,
+    accept: Optional[Callable[[Any], bool]] = None,
+):
+    """Structured call on the node's tier, escalating fast-tier failures.
+
+    Near-miss outputs are repaired locally, and fields that can't be are
+    re-asked on the same tier (see graph/repair.py). If the fast model's
+    output still fails to validate, or ``accept`` rejects it (invalid choice,
+    low confidence), the same prompt is re-run on the large tier. Large-tier
+    errors propagate to the node's own fallback.
+    """
+    tier = tier_for(key)
+    if tier == LARGE:
+        return invoke_repaired(get_llm(key, temperature), schema, messages, key)
+
+    try:
+        result = invoke_repaired(get_llm(key, temperature), schema, messages, key)
+        if accept is None or accept(result):
+            return result
+        reason = "rejected by validation"
+    except Exception as e:
+        reason = e
+    logger.info("escalating %s to the large tier: %s", key, reason)
+    return invoke_repaired(get_llm(key, temperature, tier=LARGE), schema, messages, key)
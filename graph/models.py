@@ -1,10 +1,75 @@
 """Data models and state definitions"""
 
-from typing import TypedDict, Annotated, Optional
+from typing import Any, TypedDict, Annotated, Optional
 from pydantic import BaseModel, field_validator, Field
 from langchain_core.messages import BaseMessage
 from langgraph.graph.message import add_messages
-from datetime import datetime
+import os
+import re
+from datetime import date, datetime
+
+
+# Numeric date spellings: (pattern, the year/month/day group indexes it may
+# be read with). Slashed and dashed dates can be month- or day-first.
+NUMERIC_DATES = [
+    (re.compile(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})"), [(1, 2, 3)]),  # 1985-03-15
+    (re.compile(r"(\d{1,2})([/-])(\d{1,2})\2(\d{4})"), [(4, 1, 3), (4, 3, 1)]),  # 03/15/1985, 15/03/1985
+    (re.compile(r"(\d{1,2})\.(\d{1,2})\.(\d{4})"), [(3, 2, 1)]),  # 15.03.1985
+]
+# How to read a numeric date whose day and month could be swapped
+# (03/04/1985): "MDY" or "DMY". Unset, such dates aren't guessed.
+DATE_ORDER = os.getenv("DATE_ORDER", "").upper()
+NAMED_DATE_FORMATS = ("%B %d, %Y", "%b %d, %Y", "%d %B %Y", "%d %b %Y")
+
+INTENTS = {"list", "confirm", "cancel", "reschedule", "end"}
+
+
+def normalize_phone(v: str) -> str:
+    """Format 10-digit phone numbers as XXX-XXX-XXXX"""
+    digits = "".join(filter(str.isdigit, v))
+    if len(digits) == 10:
+        return f"{digits[:3]}-{digits[3:6]}-{digits[6:]}"
+    return v  # Return as-is if not 10 digits
+
+
+def date_readings(v: str) -> list[str]:
+    """The YYYY-MM-DD dates a numeric spelling can stand for: none, one, or
+    month-first and day-first when both are valid (03/04/1985)"""
+    v = v.strip()
+    for pattern, orders in NUMERIC_DATES:
+        match = pattern.fullmatch(v)
+        if not match:
+            continue
+        readings = []
+        for y, m, d in orders:
+            try:
+                day = date(int(match.group(y)), int(match.group(m)), int(match.group(d)))
+            except ValueError:
+                continue  # Out-of-range day or month
+            if day.isoformat() not in readings:
+                readings.append(day.isoformat())
+        return readings
+    return []
+
+
+def normalize_date(v: str, order: str = DATE_ORDER) -> str:
+    """Format common date spellings as YYYY-MM-DD. A numeric date with two
+    readings is read in ``order`` ("MDY" or "DMY"); without one it is left
+    as-is, like an unknown format."""
+    v = v.strip()
+    readings = date_readings(v)
+    if len(readings) == 1:
+        return readings[0]
+    if readings:
+        if order in ("MDY", "DMY"):
+            return readings[order == "DMY"]
+        return v
+    for fmt in NAMED_DATE_FORMATS:
+        try:
+            return datetime.strptime(v, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return v  # Return as-is if not a known format
 
 
 class UserData(BaseModel):
@@ -17,10 +82,16 @@ class UserData(BaseModel):
 
     @field_validator("phone_number")
     def format_phone(cls, v):
-        digits = "".join(filter(str.isdigit, v))
-        if len(digits) == 10:
-            return f"{digits[:3]}-{digits[3:6]}-{digits[6:]}"
-        return v  # Return as-is if not 10 digits
+        return normalize_phone(v)
+
+    @field_validator("date_of_birth")
+    def format_date_of_birth(cls, v):
+        normalized = normalize_date(v)
+        try:
+            date.fromisoformat(normalized)
+        except ValueError:
+            raise ValueError(f"unreadable or ambiguous date of birth {v!r}")
+        return normalized
 
 
 class UserDataExtraction(BaseModel):
@@ -36,7 +107,10 @@ class UserDataExtraction(BaseModel):
 class IntentDecision(BaseModel):
     """Structured output for intent detection"""
 
-    intent: str  # list, confirm, cancel, end
+    intent: str  # list, confirm, cancel, reschedule, end
+    confidence: float = Field(
+        default=1.0, ge=0, le=1, description="Confidence in the chosen intent, 0-1"
+    )
     message: str  # Natural response to user
 
 
@@ -56,6 +130,36 @@ class ConfirmationDecision(BaseModel):
     message: str  # Natural response to user
 
 
+class AppointmentResolution(BaseModel):
+    """Appointment reference resolved without the LLM (see graph/resolver.py)"""
+
+    appointment_id: Optional[int] = None  # Set only when one match is clear
+    ambiguity: float  # Runner-up's score relative to the winner's, 0-1
+    matched: list[str] = []  # Kinds of reference the winner satisfied
+
+
+class FieldError(BaseModel):
+    """A structured-output field the local repair couldn't fix (see graph/repair.py)"""
+
+    field: str
+    value: Any = None
+    reason: str
+    # Readings of an ambiguous value; only the user can pick one
+    choices: Optional[list[str]] = None
+
+
+class RescheduleDecision(BaseModel):
+    """Structured output for booking and rescheduling decisions"""
+
+    appointment_id: Optional[int] = None  # Existing appointment to move, if any
+    doctor_name: Optional[str] = None
+    appointment_type: Optional[str] = None
+    after_date: Optional[str] = None  # YYYY-MM-DD, earliest day to search
+    slot_date: Optional[str] = None  # YYYY-MM-DD of the chosen open slot
+    slot_time: Optional[str] = None  # HH:MM of the chosen open slot
+    message: str  # Natural response to user
+
+
 class GeneralResponse(BaseModel):
     """Structured output for general conversational responses"""
 
@@ -69,4 +173,9 @@ class ChatbotState(TypedDict):
     user_verified: bool
     user_data: dict
     available_appointments: list[dict]
+    appointments_fetched_at: float  # time.time() of the last database read
+    offered_slots: list[dict]
     intent: str
+    # Node waiting for the user's answer to its clarifying question:
+    # {"node", "reply_at" (message count of the answer), "expires_at", "attempts"}
+    pending_action: Optional[dict]
@@ -1,28 +1,189 @@
 """Graph nodes for chatbot workflow"""
 
+import logging
 import os
-from typing import Dict, Any
-from langchain_anthropic import ChatAnthropic
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Dict, Any, Optional
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from pydantic import ValidationError
+from graph.llm import get_llm, invoke_structured
 from graph.models import *
+from graph.repair import RepairError
+from graph.resolver import CANCEL_MAX_AMBIGUITY, MAX_AMBIGUITY, resolve_appointment
 from app.tools import *
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Fast-tier intent decisions below this confidence are re-run on the large tier
+ESCALATION_CONFIDENCE = float(os.getenv("ESCALATION_CONFIDENCE", "0.7"))
+
+# Background pool for database I/O that overlaps with LLM calls
+IO_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chatbot-io")
+
+# The chat works with a patient's upcoming appointments only, and prompts list
+# at most PROMPT_APPOINTMENTS live ones, so query cost and tokens per turn stay
+# flat however long the patient's history is
+CHAT_APPOINTMENTS = 50
+PROMPT_APPOINTMENTS = int(os.getenv("PROMPT_APPOINTMENTS", "20"))
+LIVE_STATUSES = ("scheduled", "confirmed")
+
+# Intents whose node works on the patient's appointments, and how long
+# appointments already in the state are reused instead of read again
+APPOINTMENT_INTENTS = {"list", "confirm", "cancel", "reschedule"}
+APPOINTMENTS_MAX_AGE = float(os.getenv("APPOINTMENTS_MAX_AGE_SECONDS", "30"))
+
+
+# How long, and how many times in a row, a node's clarifying question keeps
+# the follow-up turn routed straight back to it
+PENDING_ACTION_TTL = float(os.getenv("PENDING_ACTION_TTL_SECONDS", "600"))
+PENDING_ACTION_ATTEMPTS = 2
+
+
+def await_reply(state: ChatbotState, node: str) -> Optional[dict]:
+    """Pending action for a node that just asked the user a clarifying question"""
+    messages = state.get("messages", [])
+    pending = state.get("pending_action") or {}
+    # Asking again while answering its own question counts as another attempt
+    attempts = (
+        pending.get("attempts", 0) + 1
+        if pending.get("node") == node and pending.get("reply_at") == len(messages)
+        else 1
+    )
+    if attempts > PENDING_ACTION_ATTEMPTS:
+        return None
+    return {
+        "node": node,
+        # The question is appended after the current messages, then the answer
+        "reply_at": len(messages) + 2,
+        "expires_at": time.time() + PENDING_ACTION_TTL,
+        "attempts": attempts,
+    }
+
+
+def fetch_appointments(patient_id: int) -> list[dict]:
+    """A patient's upcoming appointments, soonest first"""
+    return get_appointments.invoke(
+        {"patient_id": patient_id, "upcoming": True, "limit": CHAT_APPOINTMENTS}
+    )
+
+
+def prefetch_appointments(patient_id: int):
+    """Start loading a patient's appointments in the background"""
+    return IO_POOL.submit(fetch_appointments, patient_id)
+
+
+def loaded_appointments(appointments: list[dict]) -> dict:
+    """State update for appointments just read from the database"""
+    return {"available_appointments": appointments, "appointments_fetched_at": time.time()}
+
+
+def prefetched_appointments(future) -> dict:
+    """State update for a ``prefetch_appointments`` read; empty if it failed,
+    so the next turn that needs them reads them again"""
+    try:
+        return loaded_appointments(future.result())
+    except Exception as e:
+        logger.warning("appointment prefetch failed: %s", e)
+        return {}
+
+
+def appointments_are_fresh(state: ChatbotState) -> bool:
+    return time.time() - (state.get("appointments_fetched_at") or 0) < APPOINTMENTS_MAX_AGE
+
+
+def submit_status(state: ChatbotState, appointment_id: int, status: str) -> dict:
+    """Hand a status update to the write-behind writer, so it commits while
+    the node phrases its reply; the patient's reads see it meanwhile"""
+    return update_appointment_status.invoke(
+        {
+            "appointment_id": appointment_id,
+            "status": status,
+            "patient_id": state.get("user_data", {}).get("user_id"),
+            "wait": False,
+        }
+    )
+
+
+def is_durable(update: dict) -> bool:
+    """Wait for a ``submit_status`` update's durable ack; False if its commit
+    failed"""
+    ack = update.get("ack")
+    if ack is None:
+        return update.get("success", False)
+    try:
+        return ack.result()
+    except Exception as e:
+        logger.warning(
+            "status update of appointment %s failed: %s", update["appointment_id"], e
+        )
+        return False
+
+
+def resolved_reference(
+    messages: list, appointments: list[dict], max_ambiguity: float = MAX_AMBIGUITY
+) -> Optional[dict]:
+    """The appointment the latest user message clearly refers to, if the
+    local resolver can tell without the model"""
+    text = next(
+        (m.content for m in reversed(messages) if isinstance(m, HumanMessage)), ""
+    )
+    resolution = resolve_appointment(text, appointments, max_ambiguity=max_ambiguity)
+    return next(
+        (apt for apt in appointments if apt["id"] == resolution.appointment_id), None
+    )
+
+
+def encode_appointments(appointments: list[dict]) -> str:
+    """Compact prompt table of the live upcoming appointments, soonest first"""
+    today = datetime.now().date().isoformat()
+    live = sorted(
+        (apt for apt in appointments if apt["status"] in LIVE_STATUSES and apt["date"] >= today),
+        key=lambda apt: (apt["date"], apt["time"], apt["id"]),
+    )
+    if not live:
+        return "None"
+    rows = [
+        f"{apt['id']}|{apt['date']}|{apt['time']}|{apt['doctor']}|{apt['type']}|{apt['status']}"
+        for apt in live[:PROMPT_APPOINTMENTS]
+    ]
+    if len(live) > PROMPT_APPOINTMENTS:
+        rows.append(f"(+{len(live) - PROMPT_APPOINTMENTS} later appointments not shown)")
+    return "id|date|time|doctor|type|status\n" + "\n".join(rows)
+
+
+# How to ask again for identity fields the model's extraction got wrong
+IDENTITY_FIELDS = {
+    "full_name": "your full name",
+    "phone_number": "your 10-digit phone number",
+    "date_of_birth": "your date of birth (YYYY-MM-DD)",
+}
+
+
+def ask_again(fields: list[str]) -> str:
+    """Ask for the identity fields that couldn't be read, without the LLM"""
+    wanted = [IDENTITY_FIELDS[f] for f in IDENTITY_FIELDS if f in fields]
+    wanted = wanted or list(IDENTITY_FIELDS.values())
+    listed = wanted[0] if len(wanted) == 1 else ", ".join(wanted[:-1]) + f" and {wanted[-1]}"
+    return f"Sorry, I couldn't read {listed}. Could you please send it again?"
+
+
+def ask_which_date(choices: list[str]) -> str:
+    """Ask which reading of an ambiguous date of birth the user meant"""
+    days = [date.fromisoformat(choice) for choice in choices]
+    spelled = " or ".join(f"{day:%B} {day.day}, {day.year}" for day in days)
+    return f"Just to be sure: is your date of birth {spelled}?"
+
 
 def introduction_node(state: ChatbotState) -> Dict[str, Any]:
     """Introduction node - LLM naturally greets and collects data using structured output"""
 
     messages = state["messages"]
-    llm = ChatAnthropic(
-        model=os.getenv("DEFAULT_MODEL", "claude-3-7-sonnet-latest"),
-        temperature=0.3,
-        api_key=os.getenv("ANTHROPIC_API_KEY"),
-    )
-
-    # Configure LLM with structured output
-    llm_with_structured_output = llm.with_structured_output(UserDataExtraction)
+    llm = get_llm("introduction", temperature=0.3)
 
     system_prompt = """You are a friendly healthcare appointment assistant. Your role is to:
 1. Greet users warmly and professionally
@@ -44,7 +205,9 @@ If information is missing:
 
     try:
         conversation = [SystemMessage(content=system_prompt)] + messages
-        extraction_result = llm_with_structured_output.invoke(conversation)
+        extraction_result = invoke_structured(
+            "introduction", UserDataExtraction, conversation, temperature=0.3
+        )
 
         if extraction_result.data_complete:
             # Validate and create UserData
@@ -58,23 +221,22 @@ If information is missing:
                     "user_data": user_data.model_dump(),
                     "messages": [AIMessage(content=extraction_result.message)],
                 }
-            except Exception as e:
-                print(f"DEBUG: Validation error: {e}")
-                # Generate error response using LLM
-                error_llm = llm.with_structured_output(GeneralResponse)
-                error_response = error_llm.invoke(
-                    [
-                        SystemMessage(
-                            content="You are a healthcare assistant. The user provided information but it's not in the correct format. Ask them politely to provide their full name, a 10-digit phone number, and date of birth in YYYY-MM-DD format."
-                        )
-                    ]
-                )
-                return {"messages": [AIMessage(content=error_response.message)]}
+            except ValidationError as e:
+                logger.info("validation error: %s", e)
+                fields = [str(error["loc"][0]) for error in e.errors() if error["loc"]]
+                return {"messages": [AIMessage(content=ask_again(fields))]}
         else:
             return {"messages": [AIMessage(content=extraction_result.message)]}
 
+    except RepairError as e:
+        # Fields still unreadable after the targeted re-ask, or ambiguous: ask the user
+        logger.info("unrepaired extraction in introduction_node: %s", e)
+        ambiguous = next((error for error in e.errors if error.choices), None)
+        if ambiguous and ambiguous.field == "date_of_birth":
+            return {"messages": [AIMessage(content=ask_which_date(ambiguous.choices))]}
+        return {"messages": [AIMessage(content=ask_again([error.field for error in e.errors]))]}
     except Exception as e:
-        print(f"DEBUG: LLM error in introduction_node: {e}")
+        logger.warning("LLM error in introduction_node: %s", e)
         # Generate fallback response using LLM
         fallback_llm = llm.with_structured_output(GeneralResponse)
         try:
@@ -102,11 +264,7 @@ def auth_node(state: ChatbotState) -> Dict[str, Any]:
     user_data = state.get("user_data", {})
     if not user_data:
         # Generate response using LLM
-        llm = ChatAnthropic(
-            model=os.getenv("DEFAULT_MODEL", "claude-3-7-sonnet-latest"),
-            temperature=0.3,
-            api_key=os.getenv("ANTHROPIC_API_KEY"),
-        )
+        llm = get_llm("auth", temperature=0.3)
         response_llm = llm.with_structured_output(GeneralResponse)
         response = response_llm.invoke(
             [
@@ -120,13 +278,13 @@ def auth_node(state: ChatbotState) -> Dict[str, Any]:
     # Verify against database
     verification_result = verify_patient.invoke(user_data)
 
-    llm = ChatAnthropic(
-        model=os.getenv("DEFAULT_MODEL", "claude-3-7-sonnet-latest"),
-        temperature=0.3,
-        api_key=os.getenv("ANTHROPIC_API_KEY"),
-    )
+    llm = get_llm("auth", temperature=0.3)
 
     if verification_result["verified"]:
+        # Speculatively load appointments while the welcome message is generated;
+        # the next turn almost always lists, confirms or cancels.
+        appointments_future = prefetch_appointments(verification_result["user_id"])
+
         system_prompt = f"""You are a healthcare assistant. The user {verification_result['name']} has been successfully verified in our system. Welcome them back warmly and ask how you can help them with their appointments today."""
 
         try:
@@ -138,13 +296,8 @@ def auth_node(state: ChatbotState) -> Dict[str, Any]:
                     ),
                 ]
             )
-            return {
-                "user_verified": True,
-                "user_data": {**user_data, "user_id": verification_result["user_id"]},
-                "messages": [response],
-            }
         except Exception as e:
-            print(f"DEBUG: LLM error in auth_node: {e}")
+            logger.warning("LLM error in auth_node: %s", e)
             # Generate fallback welcome using LLM
             fallback_llm = llm.with_structured_output(GeneralResponse)
             try:
@@ -155,27 +308,18 @@ def auth_node(state: ChatbotState) -> Dict[str, Any]:
                         )
                     ]
                 )
-                return {
-                    "user_verified": True,
-                    "user_data": {
-                        **user_data,
-                        "user_id": verification_result["user_id"],
-                    },
-                    "messages": [AIMessage(content=welcome_response.message)],
-                }
+                response = AIMessage(content=welcome_response.message)
             except:
-                return {
-                    "user_verified": True,
-                    "user_data": {
-                        **user_data,
-                        "user_id": verification_result["user_id"],
-                    },
-                    "messages": [
-                        AIMessage(
-                            content="Welcome back! How can I help you with your appointments today?"
-                        )
-                    ],
-                }
+                response = AIMessage(
+                    content="Welcome back! How can I help you with your appointments today?"
+                )
+        # A failed prefetch doesn't fail the login, nor call the model again
+        return {
+            "user_verified": True,
+            "user_data": {**user_data, "user_id": verification_result["user_id"]},
+            **prefetched_appointments(appointments_future),
+            "messages": [response],
+        }
     else:
         system_prompt = """You are a healthcare assistant. The user's information could not be verified in our system. Politely let them know that you couldn't find their information and suggest they contact the office for assistance."""
 
@@ -190,7 +334,7 @@ def auth_node(state: ChatbotState) -> Dict[str, Any]:
             )
             return {"user_verified": False, "messages": [response]}
         except Exception as e:
-            print(f"DEBUG: LLM error in auth_node: {e}")
+            logger.warning("LLM error in auth_node: %s", e)
             # Generate fallback using LLM
             fallback_llm = llm.with_structured_output(GeneralResponse)
             try:
@@ -221,11 +365,7 @@ def chatbot_node(state: ChatbotState) -> Dict[str, Any]:
 
     if not state.get("user_verified"):
         # Generate response using LLM
-        llm = ChatAnthropic(
-            model=os.getenv("DEFAULT_MODEL", "claude-3-7-sonnet-latest"),
-            temperature=0.1,
-            api_key=os.getenv("ANTHROPIC_API_KEY"),
-        )
+        llm = get_llm("chatbot", temperature=0.1)
         response_llm = llm.with_structured_output(GeneralResponse)
         response = response_llm.invoke(
             [
@@ -237,14 +377,7 @@ def chatbot_node(state: ChatbotState) -> Dict[str, Any]:
         return {"messages": [AIMessage(content=response.message)]}
 
     messages = state["messages"]
-    llm = ChatAnthropic(
-        model=os.getenv("DEFAULT_MODEL", "claude-3-7-sonnet-latest"),
-        temperature=0.1,
-        api_key=os.getenv("ANTHROPIC_API_KEY"),
-    )
-
-    # Configure LLM with structured output
-    llm_with_structured_output = llm.with_structured_output(IntentDecision)
+    llm = get_llm("chatbot", temperature=0.1)
 
     system_prompt = """You are a healthcare appointment assistant. Based on the user's message and conversation context, determine their intent and provide a natural response.
 
@@ -252,25 +385,44 @@ Available intents:
 - "list" - if they want to see/list their appointments
 - "confirm" - if they want to confirm an appointment  
 - "cancel" - if they want to cancel an appointment
+- "reschedule" - if they want to reschedule an appointment, book a new one, or pick one of the open slots offered
 - "end" - if they want to end the conversation or say goodbye
 
 If their intent is unclear, use "end" and ask for clarification in your message.
 
+Set confidence to how sure you are about the intent, from 0 to 1.
+
 Provide a natural, helpful response in the message field."""
 
+    # Appointments prefetched at login, or read by a recent turn, are reused;
+    # stale ones are read again while the intent is decided, and kept if the
+    # intent needs them
+    refresh = (
+        None
+        if appointments_are_fresh(state)
+        else prefetch_appointments(state["user_data"]["user_id"])
+    )
+
     try:
         conversation = [SystemMessage(content=system_prompt)] + messages[
             -4:
         ]  # Recent context
-        decision = llm_with_structured_output.invoke(conversation)
+        decision = invoke_structured(
+            "chatbot",
+            IntentDecision,
+            conversation,
+            temperature=0.1,
+            accept=lambda d: d.intent in INTENTS
+            and d.confidence >= ESCALATION_CONFIDENCE,
+        )
 
-        return {
-            "intent": decision.intent,
-            "messages": [AIMessage(content=decision.message)],
-        }
+        result = {"intent": decision.intent, "messages": [AIMessage(content=decision.message)]}
+        if decision.intent in APPOINTMENT_INTENTS and refresh is not None:
+            result.update(prefetched_appointments(refresh))
+        return result
 
     except Exception as e:
-        print(f"DEBUG: LLM error in chatbot_node: {e}")
+        logger.warning("LLM error in chatbot_node: %s", e)
         # Generate fallback using LLM
         fallback_llm = llm.with_structured_output(GeneralResponse)
         try:
@@ -296,74 +448,152 @@ Provide a natural, helpful response in the message field."""
             }
 
 
-def list_node(state: ChatbotState) -> Dict[str, Any]:
-    """List appointments with LLM response"""
+def render_appointments(appointments: list[dict]) -> str:
+    """Deterministic, chat-friendly rendering of an appointment list"""
+    return "\n\n".join(
+        f"📅 {apt['type']} with {apt['doctor']}\n"
+        f"   📍 {apt['date']} at {apt['time']}\n"
+        f"   📊 Status: {apt['status'].title()}"
+        for apt in appointments
+    )
 
-    user_data = state["user_data"]
-    appointments = get_appointments.invoke({"patient_id": user_data["user_id"]})
 
-    llm = ChatAnthropic(
-        model=os.getenv("DEFAULT_MODEL", "claude-3-7-sonnet-latest"),
-        temperature=0.3,
-        api_key=os.getenv("ANTHROPIC_API_KEY"),
+def list_node(state: ChatbotState) -> Dict[str, Any]:
+    """List appointments - rendered locally, with an optional LLM preamble"""
+
+    # Loaded at login, or refreshed by chatbot_node when stale
+    appointments = state.get("available_appointments") or fetch_appointments(
+        state["user_data"]["user_id"]
     )
 
     if not appointments:
-        system_prompt = "You are a healthcare assistant. The user has no scheduled appointments. Let them know this in a friendly way."
-    else:
-        apt_info = "\\n".join(
-            [
-                f"📅 {apt['type']} with Dr. {apt['doctor']}\\n   📍 {apt['date']} at {apt['time']}\\n   📊 Status: {apt['status'].title()}\\n"
-                for apt in appointments
+        return {
+            "messages": [
+                AIMessage(
+                    content="You don't have any appointments scheduled. I can help you book one - just tell me which doctor you'd like to see."
+                )
             ]
-        )
-        system_prompt = f"""You are a healthcare assistant. Present appointments clearly and professionally.
+        }
+
+    preamble = "Here are your appointments:"
+    if os.getenv("LIST_LLM_PREAMBLE", "false").lower() == "true":
+        # One short call whose prompt doesn't grow with the list
+        llm = get_llm("list", temperature=0.3, max_tokens=60)
+        try:
+            preamble = llm.invoke(
+                [
+                    SystemMessage(
+                        content=f"You are a healthcare assistant. The user has {len(appointments)} appointment(s), which are shown right after your reply. Write one short, friendly sentence introducing the list. Do not list or describe the appointments."
+                    ),
+                    HumanMessage(content="Please show me my appointments."),
+                ]
+            ).content
+        except Exception as e:
+            logger.warning("LLM error in list_node: %s", e)
+
+    content = (
+        f"{preamble}\n\n{render_appointments(appointments)}\n\n"
+        "Would you like to confirm, cancel or reschedule any of these? "
+        "You can refer to them by doctor name or appointment type."
+    )
+    return {
+        "available_appointments": appointments,
+        # Structured copy for clients that render cards (see ChatResponse)
+        "messages": [
+            AIMessage(content=content, additional_kwargs={"appointments": appointments})
+        ],
+    }
+
+
+def build_confirmation_prompt(appointments: list[dict], messages: list) -> list:
+    """System prompt plus recent conversation for the ConfirmationDecision call"""
+
+    # Provide appointments context to Claude
+    apt_info = encode_appointments(appointments)
 
-IMPORTANT formatting instructions:
-- Use clear visual separation between each appointment
-- Display ALL details: type, doctor, date, time, and status
-- Keep formatting consistent throughout your response
-- Make the list easy to read and understand
+    system_prompt = f"""You are a healthcare appointment confirmation assistant. Based on the conversation history, determine if the user wants to confirm a specific appointment and which one.
 
-Appointment data to present:
+Available appointments:
 {apt_info}
 
-After listing the appointments, ask if they would like to confirm or cancel any specific appointment, mentioning they can reference by doctor name or appointment type."""
+Your task:
+1. Analyze the conversation to understand which appointment they want to confirm
+2. If you can identify a specific appointment, set confirm_appointment to true and provide the appointment_id
+3. If unclear, set confirm_appointment to false and ask for clarification in the message
 
-    try:
-        response = llm.invoke(
-            [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content="Please show me my appointments."),
-            ]
+Provide a natural, helpful message in all cases."""
+
+    # Include recent conversation
+    return [SystemMessage(content=system_prompt)] + messages[-6:]
+
+
+def confirmation_decision(
+    appointments: list[dict], messages: list
+) -> ConfirmationDecision:
+    """Which appointment the conversation asks to confirm: the resolver's
+    reading when it is unambiguous, otherwise the model's on the confirm tier"""
+    resolved = resolved_reference(messages, appointments)
+    if resolved:
+        # Unambiguous reference: no decision call needed
+        return ConfirmationDecision(
+            confirm_appointment=True,
+            appointment_id=resolved["id"],
+            message=f"I found your {resolved['type']} with {resolved['doctor']} on {resolved['date']} at {resolved['time']}.",
         )
-        return {"available_appointments": appointments, "messages": [response]}
-    except Exception as e:
-        print(f"DEBUG: LLM error in list_node: {e}")
-        if appointments:
-            apt_text = "\\n".join(
-                [
-                    f"📅 {apt['type']} with Dr. {apt['doctor']}\\n   📍 {apt['date']} at {apt['time']}\\n   📊 Status: {apt['status'].title()}\\n"
-                    for apt in appointments
-                ]
-            )
-            return {
-                "available_appointments": appointments,
-                "messages": [
-                    AIMessage(content=f"Here are your appointments:\\n{apt_text}")
-                ],
-            }
-        else:
-            # Generate "no appointments" response using LLM
-            no_apt_llm = llm.with_structured_output(GeneralResponse)
-            no_apt_response = no_apt_llm.invoke(
-                [
-                    SystemMessage(
-                        content="You are a healthcare assistant. The user has no scheduled appointments. Let them know this in a friendly way and offer to help them schedule one."
-                    )
-                ]
-            )
-            return {"messages": [AIMessage(content=no_apt_response.message)]}
+    # Pass full conversation context so Claude can understand the request in context
+    return invoke_structured(
+        "confirm",
+        ConfirmationDecision,
+        build_confirmation_prompt(appointments, messages),
+        temperature=0.1,
+        accept=lambda d: not d.confirm_appointment
+        or any(apt["id"] == d.appointment_id for apt in appointments),
+    )
+
+
+def confirmation_outcome(
+    decision: ConfirmationDecision, appointments: list[dict]
+) -> tuple[str, Optional[dict]]:
+    """What ``decision`` means for ``appointments``: ``("confirm", apt)``,
+    ``("already_confirmed", apt)``, ``("not_found", None)`` or
+    ``("unclear", None)``"""
+    if not (decision.confirm_appointment and decision.appointment_id):
+        return "unclear", None
+    apt = next((a for a in appointments if a["id"] == decision.appointment_id), None)
+    if apt is None:
+        return "not_found", None
+    if apt["status"] == "confirmed":
+        return "already_confirmed", apt
+    return "confirm", apt
+
+
+def confirmation_reply(
+    outcome: str,
+    decision: Optional[ConfirmationDecision] = None,
+    apt: Optional[dict] = None,
+) -> str:
+    """Templated reply for a ``confirmation_outcome``, for ``"not_saved"``
+    when the confirmation failed to commit, or for ``"error"`` when no
+    decision could be made"""
+    if outcome == "confirm":
+        return f"✅ Confirmed: {apt['type']} with {apt['doctor']} on {apt['date']}"
+    if outcome == "already_confirmed":
+        return decision.message + " This appointment is already confirmed."
+    if outcome == "not_found":
+        return "Sorry, I couldn't find that appointment to confirm."
+    if outcome == "unclear":
+        return decision.message
+    if outcome == "not_saved":
+        return "Sorry, I couldn't save your confirmation just now. Please try again in a moment."
+    return "I'm having trouble processing your confirmation request. Could you please specify which appointment you'd like to confirm?"
+
+
+def confirmed_in(appointments: list[dict], appointment_id: int) -> list[dict]:
+    """``appointments`` with one of them marked confirmed"""
+    return [
+        {**apt, "status": "confirmed"} if apt["id"] == appointment_id else apt
+        for apt in appointments
+    ]
 
 
 def confirm_node(state: ChatbotState) -> Dict[str, Any]:
@@ -375,15 +605,11 @@ def confirm_node(state: ChatbotState) -> Dict[str, Any]:
         # If not in state, get from database using user data from shared state
         user_data = state.get("user_data", {})
         if user_data.get("user_id"):
-            appointments = get_appointments.invoke({"patient_id": user_data["user_id"]})
+            appointments = fetch_appointments(user_data["user_id"])
 
     if not appointments:
         # Generate "no appointments to confirm" response using LLM
-        llm = ChatAnthropic(
-            model=os.getenv("DEFAULT_MODEL", "claude-3-7-sonnet-latest"),
-            temperature=0.1,
-            api_key=os.getenv("ANTHROPIC_API_KEY"),
-        )
+        llm = get_llm("confirm.phrasing", temperature=0.1)
         no_confirm_llm = llm.with_structured_output(GeneralResponse)
         no_confirm_response = no_confirm_llm.invoke(
             [
@@ -397,122 +623,109 @@ def confirm_node(state: ChatbotState) -> Dict[str, Any]:
     # Use full conversation history from shared state
     messages = state.get("messages", [])
 
-    llm = ChatAnthropic(
-        model=os.getenv("DEFAULT_MODEL", "claude-3-7-sonnet-latest"),
-        temperature=0.1,
-        api_key=os.getenv("ANTHROPIC_API_KEY"),
-    )
-
-    # Configure LLM with structured output
-    llm_with_structured_output = llm.with_structured_output(ConfirmationDecision)
-
-    # Provide appointments context to Claude
-    apt_info = "\\n".join(
-        [
-            f"ID {apt['id']}: {apt['type']} with {apt['doctor']} on {apt['date']} at {apt['time']} (Status: {apt['status']})"
-            for apt in appointments
-        ]
-    )
-
-    system_prompt = f"""You are a healthcare appointment confirmation assistant. Based on the conversation history, determine if the user wants to confirm a specific appointment and which one.
-
-Available appointments:
-{apt_info}
-
-Your task:
-1. Analyze the conversation to understand which appointment they want to confirm
-2. If you can identify a specific appointment, set confirm_appointment to true and provide the appointment_id
-3. If unclear, set confirm_appointment to false and ask for clarification in the message
-
-Provide a natural, helpful message in all cases."""
+    llm = get_llm("confirm.phrasing", temperature=0.1)
 
     try:
-        # Pass full conversation context so Claude can understand the request in context
-        conversation = [SystemMessage(content=system_prompt)] + messages[
-            -6:
-        ]  # Include recent conversation
-        decision = llm_with_structured_output.invoke(conversation)
+        decision = confirmation_decision(appointments, messages)
+        outcome, apt_to_confirm = confirmation_outcome(decision, appointments)
 
-        if decision.confirm_appointment and decision.appointment_id:
-            # Find the appointment in shared state
-            apt_to_confirm = next(
-                (apt for apt in appointments if apt["id"] == decision.appointment_id),
-                None,
-            )
+        if outcome == "confirm":
+            # Actually confirm the appointment in database, while the reply is phrased
+            update = submit_status(state, decision.appointment_id, "confirmed")
 
-            if apt_to_confirm and apt_to_confirm["status"] != "confirmed":
-                # Actually confirm the appointment in database
-                update_appointment_status.invoke(
-                    {"appointment_id": decision.appointment_id, "status": "confirmed"}
-                )
+            # Update the appointment in shared state for future nodes
+            updated_appointments = confirmed_in(appointments, apt_to_confirm["id"])
 
-                # Update the appointment in shared state for future nodes
-                updated_appointments = []
-                for apt in appointments:
-                    if apt["id"] == decision.appointment_id:
-                        apt_copy = apt.copy()
-                        apt_copy["status"] = "confirmed"
-                        updated_appointments.append(apt_copy)
-                    else:
-                        updated_appointments.append(apt)
-
-                # Generate confirmation using Claude with conversation context
-                confirm_prompt = f"""You are a healthcare assistant. You have successfully confirmed the user's {apt_to_confirm['type']} appointment with {apt_to_confirm['doctor']} on {apt_to_confirm['date']} at {apt_to_confirm['time']}. 
+            # Generate confirmation using Claude with conversation context
+            confirm_prompt = f"""You are a healthcare assistant. You have successfully confirmed the user's {apt_to_confirm['type']} appointment with {apt_to_confirm['doctor']} on {apt_to_confirm['date']} at {apt_to_confirm['time']}. 
                 
 Provide a friendly confirmation message."""
 
-                try:
-                    confirm_response = llm.invoke(
-                        [
-                            SystemMessage(content=confirm_prompt),
-                            HumanMessage(content="Please confirm the confirmation."),
-                        ]
-                    )
-                    return {
-                        "messages": [confirm_response],
-                        "available_appointments": updated_appointments,  # Update shared state
-                    }
-                except Exception:
-                    return {
-                        "messages": [
-                            AIMessage(
-                                content=f"✅ Confirmed: {apt_to_confirm['type']} with {apt_to_confirm['doctor']} on {apt_to_confirm['date']}"
-                            )
-                        ],
-                        "available_appointments": updated_appointments,
-                    }
-            elif apt_to_confirm and apt_to_confirm["status"] == "confirmed":
-                return {
-                    "messages": [
-                        AIMessage(
-                            content=decision.message
-                            + " This appointment is already confirmed."
-                        )
-                    ]
-                }
-            else:
-                return {
-                    "messages": [
-                        AIMessage(
-                            content="Sorry, I couldn't find that appointment to confirm."
-                        )
+            try:
+                confirm_response = llm.invoke(
+                    [
+                        SystemMessage(content=confirm_prompt),
+                        HumanMessage(content="Please confirm the confirmation."),
                     ]
-                }
-        else:
+                )
+            except Exception:
+                confirm_response = AIMessage(
+                    content=confirmation_reply(outcome, decision, apt_to_confirm)
+                )
+            if not is_durable(update):
+                return {"messages": [AIMessage(content=confirmation_reply("not_saved"))]}
+            return {
+                "messages": [confirm_response],
+                "available_appointments": updated_appointments,  # Update shared state
+            }
+        elif outcome == "unclear":
             # Claude couldn't identify which appointment to confirm
-            return {"messages": [AIMessage(content=decision.message)]}
+            return {
+                "messages": [AIMessage(content=decision.message)],
+                "pending_action": await_reply(state, "confirm"),
+            }
+        else:
+            return {
+                "messages": [
+                    AIMessage(content=confirmation_reply(outcome, decision, apt_to_confirm))
+                ]
+            }
 
     except Exception as e:
-        print(f"DEBUG: LLM error in confirm_node: {e}")
+        logger.warning("LLM error in confirm_node: %s", e)
         return {
-            "messages": [
-                AIMessage(
-                    content="I'm having trouble processing your confirmation request. Could you please specify which appointment you'd like to confirm?"
-                )
-            ]
+            "messages": [AIMessage(content=confirmation_reply("error"))],
+            "pending_action": await_reply(state, "confirm"),
         }
 
 
+def build_cancellation_prompt(appointments: list[dict], messages: list) -> list:
+    """System prompt plus recent conversation for the CancellationDecision call"""
+
+    # Provide appointments context to Claude
+    apt_info = encode_appointments(appointments)
+
+    system_prompt = f"""You are a healthcare appointment cancellation assistant. Based on the conversation history, determine if the user wants to cancel a specific appointment and which one.
+
+Available appointments:
+{apt_info}
+
+Your task:
+1. Analyze the conversation to understand which appointment they want to cancel
+2. If you can identify a specific appointment, set cancel_appointment to true and provide the appointment_id
+3. If unclear, set cancel_appointment to false and ask for clarification in the message
+
+Provide a natural, helpful message in all cases."""
+
+    # Include recent conversation
+    return [SystemMessage(content=system_prompt)] + messages[-6:]
+
+
+def cancellation_decision(
+    appointments: list[dict], messages: list
+) -> CancellationDecision:
+    """Which appointment the conversation asks to cancel: the resolver's
+    reading only when no other appointment matches at all (cancelling can't
+    be undone), otherwise the model's on the cancel tier"""
+    resolved = resolved_reference(messages, appointments, CANCEL_MAX_AMBIGUITY)
+    if resolved:
+        # Unique reference: no decision call needed
+        return CancellationDecision(
+            cancel_appointment=True,
+            appointment_id=resolved["id"],
+            message=f"I found your {resolved['type']} with {resolved['doctor']} on {resolved['date']} at {resolved['time']}.",
+        )
+    # Pass full conversation context so Claude can understand the request in context
+    return invoke_structured(
+        "cancel",
+        CancellationDecision,
+        build_cancellation_prompt(appointments, messages),
+        temperature=0.1,
+        accept=lambda d: not d.cancel_appointment
+        or any(apt["id"] == d.appointment_id for apt in appointments),
+    )
+
+
 def cancel_node(state: ChatbotState) -> Dict[str, Any]:
     """Cancel appointments - uses shared memory and conversation context"""
 
@@ -522,15 +735,11 @@ def cancel_node(state: ChatbotState) -> Dict[str, Any]:
         # If not in state, get from database using user data from shared state
         user_data = state.get("user_data", {})
         if user_data.get("user_id"):
-            appointments = get_appointments.invoke({"patient_id": user_data["user_id"]})
+            appointments = fetch_appointments(user_data["user_id"])
 
     if not appointments:
         # Generate "no appointments to cancel" response using LLM
-        llm = ChatAnthropic(
-            model=os.getenv("DEFAULT_MODEL", "claude-3-7-sonnet-latest"),
-            temperature=0.1,
-            api_key=os.getenv("ANTHROPIC_API_KEY"),
-        )
+        llm = get_llm("cancel.phrasing", temperature=0.1)
         no_cancel_llm = llm.with_structured_output(GeneralResponse)
         no_cancel_response = no_cancel_llm.invoke(
             [
@@ -544,41 +753,10 @@ def cancel_node(state: ChatbotState) -> Dict[str, Any]:
     # Use full conversation history from shared state
     messages = state.get("messages", [])
 
-    llm = ChatAnthropic(
-        model=os.getenv("DEFAULT_MODEL", "claude-3-7-sonnet-latest"),
-        temperature=0.1,
-        api_key=os.getenv("ANTHROPIC_API_KEY"),
-    )
-
-    # Configure LLM with structured output
-    llm_with_structured_output = llm.with_structured_output(CancellationDecision)
-
-    # Provide appointments context to Claude
-    apt_info = "\\n".join(
-        [
-            f"ID {apt['id']}: {apt['type']} with {apt['doctor']} on {apt['date']} at {apt['time']} (Status: {apt['status']})"
-            for apt in appointments
-        ]
-    )
-
-    system_prompt = f"""You are a healthcare appointment cancellation assistant. Based on the conversation history, determine if the user wants to cancel a specific appointment and which one.
-
-Available appointments:
-{apt_info}
-
-Your task:
-1. Analyze the conversation to understand which appointment they want to cancel
-2. If you can identify a specific appointment, set cancel_appointment to true and provide the appointment_id
-3. If unclear, set cancel_appointment to false and ask for clarification in the message
-
-Provide a natural, helpful message in all cases."""
+    llm = get_llm("cancel.phrasing", temperature=0.1)
 
     try:
-        # Pass full conversation context so Claude can understand the request in context
-        conversation = [SystemMessage(content=system_prompt)] + messages[
-            -6:
-        ]  # Include recent conversation
-        decision = llm_with_structured_output.invoke(conversation)
+        decision = cancellation_decision(appointments, messages)
 
         if decision.cancel_appointment and decision.appointment_id:
             # Find the appointment in shared state
@@ -588,10 +766,8 @@ Provide a natural, helpful message in all cases."""
             )
 
             if apt_to_cancel and apt_to_cancel["status"] != "cancelled":
-                # Actually cancel the appointment in database
-                update_appointment_status.invoke(
-                    {"appointment_id": decision.appointment_id, "status": "cancelled"}
-                )
+                # Actually cancel the appointment in database, while the reply is phrased
+                update = submit_status(state, decision.appointment_id, "cancelled")
 
                 # Update the appointment in shared state for future nodes
                 updated_appointments = []
@@ -615,19 +791,22 @@ Provide a friendly confirmation message."""
                             HumanMessage(content="Please confirm the cancellation."),
                         ]
                     )
-                    return {
-                        "messages": [confirm_response],
-                        "available_appointments": updated_appointments,  # Update shared state
-                    }
                 except Exception:
+                    confirm_response = AIMessage(
+                        content=f"✅ Your {apt_to_cancel['type']} appointment with {apt_to_cancel['doctor']} on {apt_to_cancel['date']} has been successfully cancelled."
+                    )
+                if not is_durable(update):
                     return {
                         "messages": [
                             AIMessage(
-                                content=f"✅ Your {apt_to_cancel['type']} appointment with {apt_to_cancel['doctor']} on {apt_to_cancel['date']} has been successfully cancelled."
+                                content="Sorry, I couldn't save your cancellation just now. Please try again in a moment."
                             )
-                        ],
-                        "available_appointments": updated_appointments,  # Update shared state
+                        ]
                     }
+                return {
+                    "messages": [confirm_response],
+                    "available_appointments": updated_appointments,  # Update shared state
+                }
             elif apt_to_cancel and apt_to_cancel["status"] == "cancelled":
                 # Generate "already cancelled" response using LLM
                 already_cancelled_llm = llm.with_structured_output(GeneralResponse)
@@ -654,10 +833,13 @@ Provide a friendly confirmation message."""
                 return {"messages": [AIMessage(content=not_found_response.message)]}
         else:
             # No specific cancellation identified, return Claude's response asking for clarification
-            return {"messages": [AIMessage(content=decision.message)]}
+            return {
+                "messages": [AIMessage(content=decision.message)],
+                "pending_action": await_reply(state, "cancel"),
+            }
 
     except Exception as e:
-        print(f"DEBUG: LLM error in cancel_node: {e}")
+        logger.warning("LLM error in cancel_node: %s", e)
         # Generate fallback using LLM
         try:
             fallback_llm = llm.with_structured_output(GeneralResponse)
@@ -668,12 +850,164 @@ Provide a friendly confirmation message."""
                     )
                 ]
             )
-            return {"messages": [AIMessage(content=fallback_response.message)]}
+            return {
+                "messages": [AIMessage(content=fallback_response.message)],
+                "pending_action": await_reply(state, "cancel"),
+            }
         except:
             return {
                 "messages": [
                     AIMessage(
                         content="I can help you cancel an appointment. Which one would you like to cancel?"
                     )
-                ]
+                ],
+                "pending_action": await_reply(state, "cancel"),
             }
+
+
+def reschedule_node(state: ChatbotState) -> Dict[str, Any]:
+    """Book or reschedule appointments using the free-slot index"""
+
+    user_data = state.get("user_data", {})
+    appointments = state.get("available_appointments", [])
+    if not appointments and user_data.get("user_id"):
+        appointments = fetch_appointments(user_data["user_id"])
+    offered_slots = state.get("offered_slots", [])
+    messages = state.get("messages", [])
+
+    apt_info = encode_appointments(appointments)
+    # Only the patient's own doctors: any other one the user names is matched
+    # by resolve_doctor, so the prompt doesn't grow with the clinic
+    doctor_info = ", ".join(sorted({apt["doctor"] for apt in appointments}))
+    slot_info = "\n".join(
+        [
+            f"{i}. {slot['doctor']} on {slot['date']} at {slot['time']}"
+            for i, slot in enumerate(offered_slots, start=1)
+        ]
+    )
+
+    system_prompt = f"""You are a healthcare appointment scheduling assistant. Based on the conversation history, work out whether the user wants to book a new appointment or move an existing one, and with which doctor.
+
+Today is {datetime.now().strftime("%A %Y-%m-%d")}.
+
+The patient's doctors: {doctor_info or "None yet"}
+
+Patient's appointments:
+{apt_info}
+
+Open slots already offered to the user:
+{slot_info or "None"}
+
+Your task:
+1. If they want to move an existing appointment, set appointment_id (the doctor and type default to that appointment's)
+2. Set doctor_name and appointment_type for new bookings, and after_date (YYYY-MM-DD) if they asked for a time frame
+3. Only if they picked one of the offered slots, set slot_date and slot_time to exactly that slot
+4. If it's unclear what they want, leave the fields empty and ask in the message
+
+Provide a natural, helpful message in all cases."""
+
+    try:
+        conversation = [SystemMessage(content=system_prompt)] + messages[-6:]
+        decision = invoke_structured(
+            "reschedule", RescheduleDecision, conversation, temperature=0.1
+        )
+    except Exception as e:
+        logger.warning("LLM error in reschedule_node: %s", e)
+        return {
+            "messages": [
+                AIMessage(
+                    content="I can help you book or reschedule an appointment. Which doctor would you like to see?"
+                )
+            ]
+        }
+
+    existing = next(
+        (apt for apt in appointments if apt["id"] == decision.appointment_id), None
+    )
+    picked = next(
+        (
+            slot
+            for slot in offered_slots
+            if (slot["date"], slot["time"]) == (decision.slot_date, decision.slot_time)
+        ),
+        None,
+    )
+    doctor = (
+        decision.doctor_name
+        or (picked["doctor"] if picked else None)
+        or (existing["doctor"] if existing else None)
+    )
+    doctor = SLOT_INDEX.resolve_doctor(doctor) if doctor else None
+    if not doctor:
+        return {"messages": [AIMessage(content=decision.message)]}
+
+    # Only a slot we offered is booked: it came from the index, so it is on the
+    # doctor's grid and within the booking horizon. Anything else the model
+    # put in slot_date/slot_time gets fresh slots offered instead.
+    if picked is not None:
+        if existing:
+            result = reschedule_appointment.invoke(
+                {
+                    "patient_id": user_data["user_id"],
+                    "appointment_id": existing["id"],
+                    "doctor": picked["doctor"],
+                    "date": picked["date"],
+                    "time": picked["time"],
+                }
+            )
+        else:
+            result = book_appointment.invoke(
+                {
+                    "patient_id": user_data["user_id"],
+                    "doctor": picked["doctor"],
+                    "date": picked["date"],
+                    "time": picked["time"],
+                    "appointment_type": decision.appointment_type or "Consultation",
+                }
+            )
+
+        if result["success"]:
+            verb = "moved" if existing else "booked"
+            return {
+                "messages": [
+                    AIMessage(
+                        content=f"✅ Your {result['type']} with {result['doctor']} is {verb} to {result['date']} at {result['time']}."
+                    )
+                ],
+                **loaded_appointments(fetch_appointments(user_data["user_id"])),
+                "offered_slots": [],
+            }
+        if result["reason"] not in ("slot_unavailable", "outside_horizon"):
+            return {
+                "messages": [
+                    AIMessage(
+                        content="Sorry, I couldn't find that appointment to reschedule."
+                    )
+                ],
+                "offered_slots": [],
+            }
+        # Someone else took the slot, or it went stale; offer fresh ones below
+
+    slots = find_open_slots.invoke({"doctor": doctor, "after": decision.after_date})
+    if not slots:
+        return {
+            "messages": [
+                AIMessage(
+                    content=f"Sorry, {doctor} has no open slots in the coming months. Please contact our office."
+                )
+            ],
+            "offered_slots": [],
+        }
+
+    slot_text = "\n".join(
+        f"{i}. {slot['date']} at {slot['time']}" for i, slot in enumerate(slots, 1)
+    )
+    return {
+        "messages": [
+            AIMessage(
+                content=f"Here are the next open slots with {doctor}:\n{slot_text}\nWhich one would you like?"
+            )
+        ],
+        "offered_slots": slots,
+        "pending_action": await_reply(state, "reschedule"),
+    }
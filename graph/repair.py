@@ -0,0 +1,236 @@
+"""Local repair of near-miss structured outputs
+
+Models often get a value right but spell it wrong for the schema: a date of
+birth as 15/03/1985, a phone number with +1 in front, intent "Cancel", an
+appointment id "#2", confidence 85. ``repair`` coerces such values field by
+field and reports the fields it can't fix as ``FieldError``s;
+``invoke_repaired`` then re-asks the model for those fields only, instead of
+the node falling back to another full call. A value with several valid
+readings, such as the date of birth 03/04/1985, is left to the user to pick.
+"""
+
+import logging
+import re
+from datetime import date
+from typing import Any, Callable, Optional
+from langchain_core.messages import HumanMessage
+from pydantic import ValidationError, create_model
+
+from graph.models import *
+
+logger = logging.getLogger(__name__)
+
+SHORT_YEAR_DATE = re.compile(r"(\d{1,2})([/.-])(\d{1,2})\2(\d{2})")
+ORDINAL_SUFFIX = re.compile(r"(\d)(?:st|nd|rd|th)\b", re.I)
+APPOINTMENT_ID = re.compile(r"(?:#|id\s*:?\s*|appointment\s*(?:id\s*)?#?\s*)?(\d+)", re.I)
+
+# Words that give an intent away when the model didn't use its exact name
+INTENT_WORDS = {
+    "list": ("list", "show", "view", "see"),
+    "confirm": ("confirm",),
+    "cancel": ("cancel",),
+    "reschedule": ("reschedule", "book", "move", "change"),
+    "end": ("end", "goodbye", "bye", "exit", "quit", "unclear"),
+}
+
+
+class AmbiguousValue(ValueError):
+    """A value with several valid readings, which only the user can pick from"""
+
+    def __init__(self, reason: str, choices: list):
+        self.choices = choices
+        super().__init__(reason)
+
+
+class RepairError(ValueError):
+    """Fields still invalid after local repair and the targeted re-ask"""
+
+    def __init__(self, errors: list[FieldError]):
+        self.errors = errors
+        super().__init__(
+            "; ".join(f"{e.field}={e.value!r}: {e.reason}" for e in errors)
+        )
+
+
+def repair_phone(value: Any) -> str:
+    digits = "".join(filter(str.isdigit, str(value)))
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]  # +1 country code
+    elif len(digits) == 13 and digits.startswith("001"):
+        digits = digits[3:]
+    if len(digits) != 10:
+        raise ValueError("not a 10-digit phone number")
+    return normalize_phone(digits)
+
+
+def repair_date_of_birth(value: Any) -> str:
+    text = ORDINAL_SUFFIX.sub(r"\1", str(value).strip())  # "15th March 1985"
+    match = SHORT_YEAR_DATE.fullmatch(text)
+    if match:
+        # A birth year "85" is in the past century unless that's in the future
+        year = int(match.group(4))
+        year += 1900 if year > date.today().year % 100 else 2000
+        text = f"{match.group(1)}{match.group(2)}{match.group(3)}{match.group(2)}{year}"
+    readings = date_readings(text)
+    if len(readings) > 1 and DATE_ORDER not in ("MDY", "DMY"):
+        # 03/04/1985: March 4 or April 3, depending on where the patient is from
+        raise AmbiguousValue(f"could be {' or '.join(readings)}", readings)
+    try:
+        day = date.fromisoformat(normalize_date(text))
+    except ValueError:
+        raise ValueError("not a date")
+    if not date(1900, 1, 1) <= day <= date.today():
+        raise ValueError("not a plausible date of birth")
+    return day.isoformat()
+
+
+def repair_full_name(value: Any) -> str:
+    name = " ".join(str(value).split())
+    if not name:
+        raise ValueError("empty name")
+    return name.title() if name.islower() or name.isupper() else name
+
+
+def repair_intent(value: Any) -> str:
+    text = str(value).strip().lower()
+    if text in INTENTS:
+        return text
+    words = set(re.findall(r"[a-z]+", text))
+    found = [intent for intent, hints in INTENT_WORDS.items() if words & set(hints)]
+    if len(found) != 1:
+        raise ValueError(f"not one of {', '.join(sorted(INTENTS))}")
+    return found[0]
+
+
+def repair_confidence(value: Any) -> float:
+    try:
+        confidence = float(str(value).strip().rstrip("%"))
+    except ValueError:
+        raise ValueError("not a number")
+    if 1 < confidence <= 100:
+        confidence /= 100  # A percentage
+    if not 0 <= confidence <= 1:
+        raise ValueError("not between 0 and 1")
+    return confidence
+
+
+def repair_appointment_id(value: Any) -> int:
+    if isinstance(value, bool):
+        raise ValueError("not an appointment id")
+    if isinstance(value, (int, float)) and value == int(value):
+        return int(value)
+    match = APPOINTMENT_ID.fullmatch(str(value).strip())
+    if not match:
+        raise ValueError("not an appointment id")
+    return int(match.group(1))
+
+
+# Per schema, the fields with a local repair. Each repair returns the fixed
+# value or raises ValueError with the reason it can't.
+REPAIRS: dict[type, dict[str, Callable[[Any], Any]]] = {
+    UserDataExtraction: {
+        "full_name": repair_full_name,
+        "phone_number": repair_phone,
+        "date_of_birth": repair_date_of_birth,
+    },
+    IntentDecision: {"intent": repair_intent, "confidence": repair_confidence},
+    ConfirmationDecision: {"appointment_id": repair_appointment_id},
+    CancellationDecision: {"appointment_id": repair_appointment_id},
+}
+
+
+def repair(schema: type, data: dict) -> tuple[dict, list[FieldError]]:
+    """``data`` with near-miss fields fixed, and the fields that can't be"""
+    data = dict(data)
+    errors = []
+    for field, fix in REPAIRS.get(schema, {}).items():
+        if data.get(field) is None:
+            continue
+        try:
+            data[field] = fix(data[field])
+        except ValueError as e:
+            errors.append(
+                FieldError(
+                    field=field,
+                    value=data[field],
+                    reason=str(e),
+                    choices=getattr(e, "choices", None),
+                )
+            )
+
+    if schema is UserDataExtraction and data.get("data_complete"):
+        # "Complete" with a field missing would only fail later in UserData
+        for field in ("full_name", "phone_number", "date_of_birth"):
+            if not data.get(field):
+                errors.append(FieldError(field=field, reason="missing"))
+
+    try:
+        schema.model_validate(data)
+    except ValidationError as e:
+        failed = {error.field for error in errors}
+        for detail in e.errors():
+            field = str(detail["loc"][0]) if detail["loc"] else ""
+            if field and field not in failed:
+                failed.add(field)
+                errors.append(
+                    FieldError(field=field, value=data.get(field), reason=detail["msg"])
+                )
+    return data, errors
+
+
+def output_arguments(output: dict) -> dict:
+    """Field values from a ``with_structured_output(..., include_raw=True)``
+    result, whether or not they parsed into the schema"""
+    if output.get("parsed") is not None:
+        return output["parsed"].model_dump()
+    raw = output.get("raw")
+    if raw is not None and getattr(raw, "tool_calls", None):
+        return dict(raw.tool_calls[0]["args"])
+    raise output.get("parsing_error") or ValueError("no structured output")
+
+
+def partial_schema(schema: type, fields: list[str]) -> type:
+    """A schema asking for just ``fields`` of ``schema``, all required"""
+    partial = create_model(
+        f"{schema.__name__}Fields",
+        **{field: (schema.model_fields[field].annotation, ...) for field in fields},
+    )
+    partial.__doc__ = f"Corrected fields of {schema.__name__}"
+    partial.repairs = schema
+    return partial
+
+
+def reask_message(errors: list[FieldError]) -> HumanMessage:
+    lines = "\n".join(
+        f"- {e.field}" + (f" = {e.value!r}" if e.value is not None else "") + f": {e.reason}"
+        for e in errors
+    )
+    return HumanMessage(
+        content=f"Some fields of your last answer could not be used:\n{lines}\n"
+        "Reply with corrected values for only these fields, in the formats asked for above."
+    )
+
+
+def invoke_repaired(llm, schema: type, messages: list, label: Optional[str] = None):
+    """Structured call whose near misses are repaired locally; only fields
+    the repair can't fix are asked for again, once. Raises RepairError if
+    they are still invalid."""
+    output = llm.with_structured_output(schema, include_raw=True).invoke(messages)
+    data, errors = repair(schema, output_arguments(output))
+    if not errors:
+        return schema.model_validate(data)
+
+    if any(error.choices for error in errors):
+        raise RepairError(errors)  # The model can't tell which reading was meant
+
+    fields = [error.field for error in errors if error.field in schema.model_fields]
+    if not fields:
+        raise RepairError(errors)
+    logger.info("re-asking %s for %s", label or schema.__name__, ", ".join(fields))
+    answer = llm.with_structured_output(
+        partial_schema(schema, fields), include_raw=True
+    ).invoke(messages + [reask_message(errors)])
+    data, errors = repair(schema, {**data, **output_arguments(answer)})
+    if errors:
+        raise RepairError(errors)
+    return schema.model_validate(data)
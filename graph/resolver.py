@@ -0,0 +1,272 @@
+"""Deterministic appointment-reference resolution ahead of the LLM
+
+Maps phrases like "the blood test", "Dr. Brown", "tomorrow's one", "the 9am"
+or "the second one" onto one of the patient's appointments. Each kind of
+reference found in the text is a constraint every candidate must satisfy;
+candidates that satisfy them all score 1, or the share of the type's words
+mentioned for partial type matches ("the test" is half of "Blood Test").
+The ambiguity is the runner-up's score relative to the winner's (0 =
+unique, 1 = tie). Text the rules can't safely interpret (negations,
+questions, several appointments at once, unknown doctors) resolves to
+nothing, so the caller asks the model.
+"""
+
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from graph.models import AppointmentResolution
+
+# Highest ambiguity still resolved locally
+MAX_AMBIGUITY = float(os.getenv("RESOLVER_MAX_AMBIGUITY", "0.5"))
+# Cancelling can't be undone: by default any runner-up sends it to the model
+CANCEL_MAX_AMBIGUITY = float(os.getenv("RESOLVER_CANCEL_MAX_AMBIGUITY", "0"))
+
+LIVE_STATUSES = ("scheduled", "confirmed")
+
+# Phrasings the rules shouldn't act on: the model reads these
+DEFER_PATTERN = re.compile(
+    r"\?|\b(?:not|don'?t|do not|no|never ?mind|wait|instead|but|except|keep|"
+    r"all|both|every|each|and the|or the|rather)\b"
+)
+ID_PATTERN = re.compile(r"(?:#|\bid\s*|\bappointment\s+(?:number\s+)?)(\d+)\b(?![-/:])")
+DOCTOR_PATTERN = re.compile(r"\b(?:dr\.?|doctor)\s+([a-z]+)")
+ISO_DATE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+SLASH_DATE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+TIME_PATTERN = re.compile(
+    r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)|\b(\d{1,2}):(\d{2})\b|\bat (\d{1,2})\b(?!:)"
+)
+
+MONTHS = {
+    name: number
+    for number, names in enumerate(
+        [
+            ("january", "jan"), ("february", "feb"), ("march", "mar"),
+            ("april", "apr"), ("may",), ("june", "jun"), ("july", "jul"),
+            ("august", "aug"), ("september", "sep", "sept"), ("october", "oct"),
+            ("november", "nov"), ("december", "dec"),
+        ],
+        start=1,
+    )
+    for name in names
+}
+MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+MONTH_DAY = re.compile(rf"\b({MONTH_NAMES})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?\b")
+DAY_MONTH = re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?({MONTH_NAMES})\b")
+# "on the 20th" is a day of the month, "the 2nd one" an ordinal
+DAY_OF_MONTH = re.compile(r"\b(on )?the (\d{1,2})(?:st|nd|rd|th)\b(?! one)")
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+WEEKDAY_PATTERN = re.compile(rf"\b(next\s+)?({'|'.join(WEEKDAYS)})\b")
+
+ORDINALS = {
+    "first": 0, "1st": 0, "earliest": 0, "soonest": 0,
+    "second": 1, "2nd": 1, "third": 2, "3rd": 2, "fourth": 3, "4th": 3,
+    "fifth": 4, "5th": 4, "last": -1, "latest": -1,
+}
+ORDINAL_PATTERN = re.compile(
+    rf"\b({'|'.join(ORDINALS)})\b(?! (?:time|week|month|year|night)\b)"
+)
+
+# Words after "doctor" that aren't a name ("my doctor appointment")
+NOT_NAMES = {"appointment", "appointments", "visit", "on", "at", "in", "for", "the", "my"}
+
+# Words too generic to tell appointment types apart
+TYPE_STOPWORDS = {"the", "and", "with", "for", "appointment", "visit", "one", "my"}
+
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") else word
+
+
+def _surname(doctor: str) -> str:
+    return doctor.lower().replace("dr.", "").split()[-1] if doctor.strip() else ""
+
+
+def _dates(text: str, today: date) -> Optional[set]:
+    """Dates (or a (start, end) range / weekday) referred to, or None"""
+    found: set = set()
+
+    def add(year: int, month: int, day: int):
+        try:
+            found.add(date(year, month, day))
+        except ValueError:
+            pass
+
+    if "day after tomorrow" in text:
+        found.add(today + timedelta(days=2))
+    elif "tomorrow" in text:
+        found.add(today + timedelta(days=1))
+    if re.search(r"\btoday\b|\btonight\b", text):
+        found.add(today)
+    for match in ISO_DATE.finditer(text):
+        add(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    for match in SLASH_DATE.finditer(text):
+        year = int(match.group(3)) if match.group(3) else today.year
+        add(year + 2000 if year < 100 else year, int(match.group(1)), int(match.group(2)))
+    for match in MONTH_DAY.finditer(text):
+        add(today.year, MONTHS[match.group(1)], int(match.group(2)))
+    for match in DAY_MONTH.finditer(text):
+        add(today.year, MONTHS[match.group(2)], int(match.group(1)))
+    for match in DAY_OF_MONTH.finditer(text):
+        if match.group(1) or int(match.group(2)) > len(ORDINALS):
+            found.add(("day", int(match.group(2))))
+    for match in WEEKDAY_PATTERN.finditer(text):
+        weekday = WEEKDAYS.index(match.group(2))
+        if match.group(1):
+            # "next friday" may mean this coming one or the one after
+            found.add(("weekday", weekday))
+        else:
+            found.add(today + timedelta(days=(weekday - today.weekday()) % 7))
+    if "next week" in text:
+        start = today + timedelta(days=7 - today.weekday())
+        found.add(("range", start, start + timedelta(days=6)))
+    elif "this week" in text:
+        found.add(("range", today, today + timedelta(days=6 - today.weekday())))
+    return found or None
+
+
+def _date_matches(day: date, refs: set) -> bool:
+    for ref in refs:
+        if isinstance(ref, date) and ref == day:
+            return True
+        if isinstance(ref, tuple) and ref[0] == "day" and day.day == ref[1]:
+            return True
+        if isinstance(ref, tuple) and ref[0] == "weekday" and day.weekday() == ref[1]:
+            return True
+        if isinstance(ref, tuple) and ref[0] == "range" and ref[1] <= day <= ref[2]:
+            return True
+    return False
+
+
+def _times(text: str) -> Optional[list]:
+    """(hour, minute or None, exact 24h?) per time referred to, or None"""
+    found = []
+    for match in TIME_PATTERN.finditer(text):
+        if match.group(1):
+            hour = int(match.group(1)) % 12 + (12 if match.group(3).startswith("p") else 0)
+            found.append((hour, int(match.group(2) or 0), True))
+        elif match.group(4):
+            found.append((int(match.group(4)), int(match.group(5)), False))
+        else:
+            found.append((int(match.group(6)), None, False))
+    for part, hours in (("morning", (0, 12)), ("afternoon", (12, 17)), ("evening", (17, 24))):
+        if part in text:
+            found.append(("part", *hours))
+    return found or None
+
+
+def _time_matches(hhmm: str, refs: list) -> bool:
+    hour, minute = (int(x) for x in hhmm.split(":"))
+    for ref in refs:
+        if ref[0] == "part":
+            if ref[1] <= hour < ref[2]:
+                return True
+            continue
+        ref_hour, ref_minute, exact = ref
+        same_hour = ref_hour == hour if exact else ref_hour % 12 == hour % 12
+        if same_hour and (ref_minute is None or ref_minute == minute):
+            return True
+    return False
+
+
+def _type_overlap(appointment_type: str, words: set, squashed: str) -> float:
+    tokens = [
+        _stem(token)
+        for token in re.findall(r"[a-z]+", appointment_type.lower())
+        if token not in TYPE_STOPWORDS and len(token) > 2
+    ]
+    if not tokens:
+        return 0.0
+    hits = sum(token in words or (len(token) > 4 and token in squashed) for token in tokens)
+    return hits / len(tokens)
+
+
+def resolve_appointment(
+    text: str,
+    appointments: list[dict],
+    today: Optional[date] = None,
+    max_ambiguity: float = MAX_AMBIGUITY,
+) -> AppointmentResolution:
+    """Match ``text`` against ``appointments`` (in the order the user saw
+    them); the match is only returned up to ``max_ambiguity``"""
+    today = today or datetime.now().date()
+    text = " ".join(text.lower().replace("’", "'").split())
+    unresolved = AppointmentResolution(appointment_id=None, ambiguity=1.0)
+    if not appointments or DEFER_PATTERN.search(text):
+        return unresolved
+
+    doctors = {_surname(apt["doctor"]) for apt in appointments}
+    if any(
+        name not in doctors and name not in NOT_NAMES
+        for name in DOCTOR_PATTERN.findall(text)
+    ):
+        return unresolved  # A doctor the patient has no appointment with
+
+    raw_words = set(re.findall(r"[a-z]+", text))
+    words = {_stem(word) for word in raw_words}
+    squashed = re.sub(r"[^a-z]", "", text)
+    ids = {int(x) for x in ID_PATTERN.findall(text)}
+    mentioned = {name for name in doctors if name and name in raw_words}
+    overlaps = [_type_overlap(apt["type"], words, squashed) for apt in appointments]
+    # Dates and times are read with the digits of ids removed
+    date_text = ID_PATTERN.sub(" ", text)
+    dates = _dates(date_text, today)
+    times = _times(ISO_DATE.sub(" ", SLASH_DATE.sub(" ", date_text)))
+    ordinal_text = DAY_OF_MONTH.sub(
+        lambda m: " " if m.group(1) or int(m.group(2)) > len(ORDINALS) else m.group(0),
+        text,
+    )
+    ordinals = [ORDINALS[word] for word in ORDINAL_PATTERN.findall(ordinal_text)]
+    if len(set(ordinals)) > 1:
+        return unresolved
+
+    matched = []
+    for apt, overlap in zip(appointments, overlaps):
+        reasons = []
+        if ids:
+            if apt["id"] not in ids:
+                continue
+            reasons.append("id")
+        if mentioned:
+            if _surname(apt["doctor"]) not in mentioned:
+                continue
+            reasons.append("doctor")
+        if any(overlaps):
+            if not overlap:
+                continue
+            reasons.append("type")
+        if dates:
+            if not _date_matches(date.fromisoformat(apt["date"]), dates):
+                continue
+            reasons.append("date")
+        if times:
+            if not _time_matches(apt["time"], times):
+                continue
+            reasons.append("time")
+        live = apt["status"] in LIVE_STATUSES and apt["date"] >= today.isoformat()
+        # Every constraint is met; only a partial type match makes it weaker
+        score = overlap if "type" in reasons else 1.0
+        matched.append((score, live, apt["id"], reasons))
+
+    if ordinals:
+        # "the second one", "the last blood test": position among the matches
+        if not -len(matched) <= ordinals[0] < len(matched):
+            return unresolved
+        score, live, appointment_id, reasons = matched[ordinals[0]]
+        matched = [(1.0, live, appointment_id, reasons + ["ordinal"])]
+
+    # Nothing referred to: only "cancel my appointment" with a single one is clear
+    if matched and not matched[0][3] and len(appointments) > 1:
+        return unresolved
+    matched.sort(key=lambda m: -m[0])
+    if not matched or not matched[0][1]:
+        return unresolved  # No match, or the best one is past or cancelled
+    runner_up = matched[1][0] if len(matched) > 1 else 0.0
+    ambiguity = round(runner_up / matched[0][0], 3)
+    return AppointmentResolution(
+        appointment_id=matched[0][2] if ambiguity <= max_ambiguity else None,
+        ambiguity=ambiguity,
+        matched=matched[0][3],
+    )
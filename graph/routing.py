@@ -1,8 +1,24 @@
 """Routing logic for graph transitions"""
 
+import re
+import time
+from typing import Optional
 from graph.models import ChatbotState
 from langgraph.graph import END
 
+# A follow-up that matches one of these is a new request, not an answer to the
+# pending question, and goes back through intent detection
+ESCAPE_PATTERN = re.compile(
+    r"\b(never ?mind|forget (it|that)|stop|bye|goodbye|that'?s all|no thanks"
+    r"|list|show|what are)\b",
+    re.IGNORECASE,
+)
+ACTION_WORDS = {
+    "confirm": {"confirm"},
+    "cancel": {"cancel"},
+    "reschedule": {"reschedule", "move", "book"},
+}
+
 
 def route_from_introduction(state: ChatbotState) -> str:
     """Route from introduction based on whether user data was collected"""
@@ -17,13 +33,34 @@ def route_from_auth(state: ChatbotState) -> str:
 def route_from_chatbot(state: ChatbotState) -> str:
     """Route from chatbot based on detected intent"""
     intent = state.get("intent", END)
-    if intent in ["list", "confirm", "cancel"]:
+    if intent in ["list", "confirm", "cancel", "reschedule"]:
         return intent
     return END
 
 
+def pending_route(state: ChatbotState) -> Optional[str]:
+    """Node waiting for this message as the answer to its question, if any"""
+    pending = state.get("pending_action")
+    messages = state.get("messages", [])
+    if not pending or not messages:
+        return None
+    # Only the message right after the question, and only while fresh
+    if pending["reply_at"] != len(messages) or time.time() > pending["expires_at"]:
+        return None
+
+    text = messages[-1].content
+    other_actions = set().union(
+        *(words for node, words in ACTION_WORDS.items() if node != pending["node"])
+    )
+    words = set(re.findall(r"[a-z]+", text.lower()))
+    if ESCAPE_PATTERN.search(text) or words & other_actions:
+        return None
+    return pending["node"]
+
+
 def entry_point_routing(state: ChatbotState) -> str:
     """Smart entry: skip intro/auth if user already verified"""
     if state.get("user_verified") and state.get("user_data", {}).get("user_id"):
-        return "chatbot"  # Skip to chatbot if already authenticated
+        # Answers to a clarifying question skip intent detection
+        return pending_route(state) or "chatbot"
     return "introduction"  # Normal flow for new users
@@ -2,6 +2,9 @@
 
 from graph.builder import create_healthcare_chatbot
 from langchain_core.messages import HumanMessage
+import argparse
+import json
+import os
 import uuid
 import sys
 
@@ -48,8 +51,119 @@ def start_chat():
             print(f"Bot: {response['messages'][-1].content}")
 
 
+def run_campaign(argv: list[str]):
+    """Send reminders for upcoming appointments and resolve collected replies"""
+    from langchain_anthropic import ChatAnthropic
+    from app.campaign import CampaignCheckpoint, ReminderCampaign
+    from graph.checkpoint import SqliteCheckpointSaver
+    from graph.llm import model_for, tier_for
+
+    parser = argparse.ArgumentParser(prog="main.py campaign")
+    parser.add_argument("--hours", type=int, default=48)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--checkpoint", help="JSON file used to resume after a crash")
+    parser.add_argument("--replies", help="NDJSON file of {thread_id, message}")
+    args = parser.parse_args(argv)
+
+    chatbot = create_healthcare_chatbot()
+    if not isinstance(chatbot.checkpointer, SqliteCheckpointSaver):
+        parser.error(
+            "reminder threads must be stored where the API reads them: "
+            "set CHECKPOINTER=sqlite and the API's CHECKPOINT_DB"
+        )
+
+    llm = ChatAnthropic(
+        model=model_for(tier_for("campaign")),
+        temperature=0.3,
+        api_key=os.getenv("ANTHROPIC_API_KEY"),
+    )
+    campaign = ReminderCampaign(
+        chatbot,
+        llm,
+        concurrency=args.concurrency,
+        chunk_size=args.chunk_size,
+    )
+    checkpoint = CampaignCheckpoint(args.checkpoint)
+
+    print(f"📨 Sending reminders for the next {args.hours} hours...")
+    result = campaign.send_reminders(args.hours, checkpoint)
+    print(f"✅ Sent {result['sent']} reminders ({result['failed']} from template)")
+
+    if args.replies:
+        with open(args.replies) as f:
+            replies = (json.loads(line) for line in f if line.strip())
+            result = campaign.resolve_replies(replies, checkpoint)
+        print(f"✅ Resolved {result['replies']} replies, {result['confirmed']} confirmed")
+
+
+def run_rebalance(argv: list[str]):
+    """Grow the shard set and move patients to their new shards, online"""
+    from app.database import open_database
+
+    parser = argparse.ArgumentParser(prog="main.py rebalance")
+    parser.add_argument("--shards", type=int, required=True, help="New shard count")
+    parser.add_argument("--dir", default=os.getenv("DB_DIR"), help="Database directory")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error("a database directory is required (--dir or DB_DIR)")
+
+    db = open_database(args.dir, args.shards)
+    print(f"🔀 Rebalancing {len(db.names)} shards in {args.dir}...")
+    moved = db.rebalance(
+        args.batch_size, on_progress=lambda n: print(f"   {n} patients moved", end="\r")
+    )
+    print(f"\n✅ Moved {moved} patients")
+    for shard in db.shards:
+        count = shard.conn.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+        print(f"   {shard.name}: {count} patients")
+
+
+def run_import(argv: list[str]):
+    """Stream a CSV/NDJSON export of patients or appointments into the database"""
+    from app.database import open_database
+    from app.importer import BulkImporter
+
+    parser = argparse.ArgumentParser(prog="main.py import")
+    parser.add_argument("kind", choices=["patients", "appointments"])
+    parser.add_argument("path", help=".csv (with header) or .ndjson/.jsonl file")
+    parser.add_argument("--dir", default=os.getenv("DB_DIR"), help="Database directory")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument(
+        "--keep-indexes",
+        action="store_true",
+        help="Maintain indexes during the load (slower; for live databases)",
+    )
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error("a database directory is required (--dir or DB_DIR)")
+
+    db = open_database(args.dir, int(os.getenv("DB_SHARDS", "1")))
+    importer = BulkImporter(db, args.chunk_size, defer_indexes=not args.keep_indexes)
+    print(f"📥 Importing {args.kind} from {args.path} into {len(db.names)} shards...")
+    stats = importer.run(
+        args.path,
+        args.kind,
+        on_progress=lambda rows, elapsed: print(
+            f"   {rows:,} rows ({rows / elapsed:,.0f}/s)", end="\r"
+        ),
+    )
+    print(
+        f"\n✅ {stats['imported']:,} imported, {stats['rejected']:,} rejected in "
+        f"{stats['seconds']:.1f}s ({stats['rows_per_second']:,.0f} rows/s, "
+        f"peak memory {stats['peak_memory_mb']:.0f} MB)"
+    )
+
+
 if __name__ == "__main__":
     if len(sys.argv) > 1 and sys.argv[1] == "diagram":
         generate_diagram()
+    elif len(sys.argv) > 1 and sys.argv[1] == "campaign":
+        run_campaign(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "rebalance":
+        run_rebalance(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == "import":
+        run_import(sys.argv[2:])
     else:
         start_chat()
@@ -0,0 +1,118 @@
+"""Booking offered slots, and the directory claims that keep a slot from being
+booked twice across shards and processes"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from app.availability import FreeSlotIndex, book_slot
+from app.database import open_database
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = open_database(str(tmp_path), 2)
+    db.add_patients(
+        [
+            (1, "John Smith", "555-010-1001", "1985-03-15"),
+            (2, "Jane Doe", "555-010-1002", "1990-07-22"),
+        ]
+    )
+    if db.shard_of_patient(1) is db.shard_of_patient(2):
+        db.move_patient(2, next(s.name for s in db.shards if s is not db.shard_of_patient(1)))
+    db.directory.execute("INSERT INTO doctors VALUES (1, 'Dr. Anderson')")
+    db.directory.executemany(
+        "INSERT INTO doctor_schedules VALUES (1, ?, '09:00', '17:00', 30)",
+        [(weekday,) for weekday in range(7)],
+    )
+    db.directory.commit()
+    return db
+
+
+def book(db, index: FreeSlotIndex, patient_id: int, day: str, time: str, **kwargs) -> dict:
+    shard = db.shard_of_patient(patient_id)
+    appointment_id = db.allocate_appointment_id(patient_id)
+    return book_slot(
+        shard.conn,
+        shard.lock,
+        index,
+        patient_id,
+        "anderson",
+        day,
+        time,
+        "General Checkup",
+        appointment_id=appointment_id,
+        claims=db,
+        **kwargs,
+    )
+
+
+def slot_index(db, **kwargs) -> FreeSlotIndex:
+    return FreeSlotIndex.from_database(
+        db.directory, appointment_conns=[shard.conn for shard in db.shards], **kwargs
+    )
+
+
+def tomorrow() -> str:
+    return (date.today() + timedelta(days=1)).isoformat()
+
+
+def test_a_slot_is_booked_once_within_a_process(db):
+    index = slot_index(db)
+    assert book(db, index, 1, tomorrow(), "09:00")["success"]
+    assert book(db, index, 2, tomorrow(), "09:00")["reason"] == "slot_unavailable"
+    assert book(db, index, 2, tomorrow(), "09:10")["reason"] == "slot_unavailable"
+    assert not index.is_free("Dr. Anderson", date.fromisoformat(tomorrow()), "09:00")
+
+
+def test_processes_with_their_own_index_cant_book_one_slot_on_two_shards(db):
+    # Each process builds its index before the other books
+    first = slot_index(db)
+    second = slot_index(db)
+
+    assert book(db, first, 1, tomorrow(), "10:00")["success"]
+    assert book(db, second, 2, tomorrow(), "10:00")["reason"] == "slot_unavailable"
+    live = sum(
+        shard.conn.execute(
+            "SELECT COUNT(*) FROM appointments WHERE status != 'cancelled'"
+        ).fetchone()[0]
+        for shard in db.shards
+    )
+    assert live == 1
+
+
+def test_rescheduling_frees_the_old_slot_for_every_process(db):
+    first = slot_index(db)
+    second = slot_index(db)
+    booked = book(db, first, 1, tomorrow(), "11:00")
+
+    assert book(db, first, 1, tomorrow(), "11:30", replaces=booked["appointment_id"])["success"]
+    assert book(db, second, 2, tomorrow(), "11:00")["success"]
+
+
+def test_days_outside_the_horizon_are_rejected(db):
+    index = slot_index(db, horizon_days=7)
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    too_far = (date.today() + timedelta(days=8)).isoformat()
+    assert book(db, index, 1, yesterday, "09:00")["reason"] == "outside_horizon"
+    assert book(db, index, 1, too_far, "09:00")["reason"] == "outside_horizon"
+
+
+def test_only_scheduled_doctors_are_bookable(db):
+    index = slot_index(db)
+    assert "Dr. Anderson" in index
+    assert "Dr. Brown" not in index
+    shard = db.shard_of_patient(1)
+    result = book_slot(
+        shard.conn,
+        shard.lock,
+        index,
+        1,
+        "brown",
+        tomorrow(),
+        "09:00",
+        "General Checkup",
+        appointment_id=db.allocate_appointment_id(1),
+        claims=db,
+    )
+    assert result["reason"] == "unknown_doctor"
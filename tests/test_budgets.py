@@ -0,0 +1,39 @@
+"""The scripted conversations of benchmarks/budgets.py stay within the model
+call, token and graph step budgets committed in benchmarks/budgets.json"""
+
+import json
+
+import pytest
+
+import app.tools
+from app.database import setup_database
+from app.events import EventLog
+from benchmarks.budgets import BASELINE, over_budget, run_scenarios
+
+
+@pytest.fixture
+def sample_database(monkeypatch):
+    # The scenarios change appointments: run them on fresh sample data
+    monkeypatch.delenv("DB_DIR", raising=False)
+    monkeypatch.delenv("DB_SHARDS", raising=False)
+    db = setup_database()
+    monkeypatch.setattr(app.tools, "DB", db)
+    monkeypatch.setattr(app.tools, "EVENTS", EventLog(db, fold_delay=0))
+    app.tools._shard_name.cache_clear()
+    yield db
+    app.tools._shard_name.cache_clear()
+
+
+def test_scenarios_stay_within_their_budgets(sample_database):
+    results = run_scenarios()
+    budgets = json.loads(BASELINE.read_text())
+    assert results.keys() == budgets.keys()
+
+    exceeded = {}
+    for name, turns in results.items():
+        assert len(turns) == len(budgets[name]), name
+        for index, turn in enumerate(turns):
+            over = over_budget(turn, budgets[name][index])
+            if over:
+                exceeded[f"{name} turn {index + 1}"] = over
+    assert not exceeded
@@ -0,0 +1,34 @@
+"""Paging scheduled appointments in a campaign window across shards"""
+
+from app.campaign import iter_upcoming_appointments
+from app.database import open_database
+
+
+def test_window_is_paged_in_time_order_and_resumes_after_the_cursor(tmp_path):
+    db = open_database(str(tmp_path), 2)
+    db.add_patients([(p, f"Patient {p}", "555-000-0000", "1980-01-01") for p in range(1, 9)])
+    slots = [
+        ("2099-01-04", "23:30"),  # Before the window
+        ("2099-01-05", "10:00"),
+        ("2099-01-05", "09:00"),
+        ("2099-01-05", "09:00"),
+        ("2099-01-06", "08:00"),
+        ("2099-01-07", "00:00"),  # The window's end is exclusive
+    ]
+    db.add_appointments(
+        [
+            (i, i, day, time, f"Dr. {i}", "Checkup", "scheduled")
+            for i, (day, time) in enumerate(slots, start=1)
+        ]
+        + [(7, 7, "2099-01-05", "11:00", "Dr. 7", "Checkup", "confirmed")]
+    )
+    window = ("2099-01-05 00:00", "2099-01-07 00:00")
+
+    chunks = list(iter_upcoming_appointments(db, *window, chunk_size=2))
+    assert [[apt["id"] for apt in chunk] for chunk in chunks] == [[3, 4], [2, 5]]
+
+    last = chunks[0][-1]
+    resumed = iter_upcoming_appointments(
+        db, *window, (last["date"], last["time"], last["id"]), chunk_size=2
+    )
+    assert [apt["id"] for chunk in resumed for apt in chunk] == [2, 5]
@@ -0,0 +1,85 @@
+"""Eviction of idle and least recently used threads from the bounded
+checkpointer"""
+
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+
+import graph.checkpoint
+from graph.checkpoint import BoundedCheckpointSaver
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=0.0)
+    monotonic = SimpleNamespace(monotonic=lambda: clock.now)
+    monkeypatch.setattr(graph.checkpoint, "time", monotonic)
+    return clock
+
+
+def save(saver: BoundedCheckpointSaver, thread_id: str, text: str = "hi") -> dict:
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": [HumanMessage(content=text)]}
+    checkpoint["channel_versions"] = {"messages": 1}
+    return saver.put(
+        {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}},
+        checkpoint,
+        {"step": 1},
+        {"messages": 1},
+    )
+
+
+def load(saver: BoundedCheckpointSaver, thread_id: str):
+    return saver.get_tuple({"configurable": {"thread_id": thread_id}})
+
+
+def test_only_the_latest_checkpoint_is_kept(clock):
+    saver = BoundedCheckpointSaver()
+    save(saver, "t1", "first")
+    latest = save(saver, "t1", "second")
+
+    item = load(saver, "t1")
+    assert item.config == latest
+    assert item.checkpoint["channel_values"]["messages"][0].content == "second"
+    assert saver.session_count == 1
+    assert saver.stored_bytes() == saver.stored_bytes("t1")
+
+
+def test_idle_threads_expire(clock):
+    saver = BoundedCheckpointSaver(ttl_seconds=60)
+    save(saver, "t1")
+    clock.now = 30
+    save(saver, "t2")
+
+    clock.now = 61
+    assert load(saver, "t1") is None
+    assert load(saver, "t2") is not None
+    # Reading t2 counts as use, so it outlives its first TTL
+    clock.now = 120
+    assert load(saver, "t2") is not None
+    assert saver.gauges()["evicted_ttl"] == 1
+
+
+def test_least_recently_used_threads_go_first_over_the_byte_budget(clock):
+    saver = BoundedCheckpointSaver()
+    save(saver, "t1")
+    saver.max_bytes = saver.stored_bytes() * 2
+    save(saver, "t2")
+    load(saver, "t1")  # t2 is now the least recently used
+
+    save(saver, "t3")
+    assert load(saver, "t2") is None
+    assert load(saver, "t1") is not None and load(saver, "t3") is not None
+    assert saver.stored_bytes() <= saver.max_bytes
+    assert saver.gauges()["evicted_memory"] == 1
+
+
+def test_a_deleted_thread_frees_its_bytes(clock):
+    saver = BoundedCheckpointSaver()
+    save(saver, "t1")
+    save(saver, "t2")
+    saver.delete_thread("t1")
+    assert load(saver, "t1") is None
+    assert saver.stored_bytes() == saver.stored_bytes("t2") > 0
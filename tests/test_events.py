@@ -0,0 +1,67 @@
+"""Appointment events folded into the /stats counters"""
+
+import time
+
+import pytest
+
+import app.tools
+from app.database import open_database
+from app.events import EventLog, rebuild_stats
+
+DAY = "2099-01-05"
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db = open_database(str(tmp_path), 2)
+    db.add_patients(
+        [
+            (1, "John Smith", "555-010-1001", "1985-03-15"),
+            (2, "Jane Doe", "555-010-1002", "1990-07-22"),
+        ]
+    )
+    db.add_appointments(
+        [
+            (1, 1, DAY, "09:00", "Dr. Anderson", "General Checkup", "scheduled"),
+            (2, 2, DAY, "10:00", "Dr. Anderson", "General Checkup", "scheduled"),
+        ]
+    )
+    rebuild_stats(db)
+    monkeypatch.setattr(app.tools, "DB", db)
+    app.tools._shard_name.cache_clear()
+    return db
+
+
+def counts(log: EventLog) -> dict:
+    return log.stats(DAY, DAY)["doctors"]["Dr. Anderson"]
+
+
+def test_stats_serve_the_folded_counters_until_a_fold(db, monkeypatch):
+    # Long enough that the background folder stays out of the way
+    log = EventLog(db, fold_delay=60)
+    monkeypatch.setattr(app.tools, "EVENTS", log)
+    app.tools.commit_status_updates(
+        [
+            {"appointment_id": 1, "status": "confirmed"},
+            {"appointment_id": 2, "status": "cancelled"},
+        ]
+    )
+    assert counts(log)["scheduled"] == 2
+
+    log.flush()
+    log.flush()  # Nothing is folded twice
+    folded = counts(log)
+    assert (folded["scheduled"], folded["confirmed"], folded["cancelled"]) == (0, 1, 1)
+    assert folded["cancellation_rate"] == 0.5
+
+
+def test_notified_commits_are_folded_in_the_background(db, monkeypatch):
+    log = EventLog(db, fold_delay=0)
+    monkeypatch.setattr(app.tools, "EVENTS", log)
+    app.tools.commit_status_updates([{"appointment_id": 1, "status": "cancelled"}])
+
+    deadline = time.monotonic() + 5
+    while counts(log)["cancelled"] != 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert counts(log)["cancelled"] == 1
+    assert counts(log)["scheduled"] == 1
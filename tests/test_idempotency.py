@@ -0,0 +1,78 @@
+"""Deduplicating retried /chat requests"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from app.idempotency import IdempotencyConflict, IdempotencyStore
+from benchmarks.stubs import install_stub
+
+
+def test_a_retry_gets_the_first_result_and_a_different_message_conflicts():
+    store = IdempotencyStore()
+    runs = []
+
+    async def factory():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return f"reply {len(runs)}"
+
+    async def scenario():
+        first, retry = await asyncio.gather(
+            store.run(("t1", "r1"), "hi", factory), store.run(("t1", "r1"), "hi", factory)
+        )
+        late = await store.run(("t1", "r1"), "hi", factory)
+        other_thread = await store.run(("t2", "r1"), "hi", factory)
+        with pytest.raises(IdempotencyConflict):
+            await store.run(("t1", "r1"), "bye", factory)
+        return first, retry, late, other_thread
+
+    assert asyncio.run(scenario()) == ("reply 1", "reply 1", "reply 1", "reply 2")
+    assert store.hits == 2
+
+
+def test_completed_entries_expire_and_overflow_oldest_first(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr("app.idempotency.time.monotonic", lambda: clock[0])
+    store = IdempotencyStore(max_entries=2, ttl_seconds=10)
+
+    async def reply():
+        return "ok"
+
+    async def complete(key):
+        await store.run(key, None, reply)
+
+    for key in ("a", "b", "c"):
+        asyncio.run(complete(key))
+        clock[0] += 1
+    asyncio.run(complete("d"))
+    assert set(store._entries) == {"c", "d"}
+
+    clock[0] += 9.5
+    asyncio.run(complete("e"))
+    assert set(store._entries) == {"d", "e"}
+
+
+def test_request_ids_are_scoped_to_their_thread():
+    install_stub()
+    import app.api as api
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # Two new conversations whose clients picked the same request id
+            first = await client.post("/chat", json={"message": "hi", "request_id": "1"})
+            second = await client.post("/chat", json={"message": "hi", "request_id": "1"})
+            thread_id = first.json()["thread_id"]
+            retried = [
+                await client.post(
+                    "/chat", json={"message": "show my appointments", "thread_id": thread_id, "request_id": "2"}
+                )
+                for _ in range(2)
+            ]
+            return first.json(), second.json(), [r.json() for r in retried]
+
+    first, second, retried = asyncio.run(scenario())
+    assert first["thread_id"] != second["thread_id"]
+    assert retried[0] == retried[1]
@@ -0,0 +1,109 @@
+"""Streaming bulk import of patient and appointment exports"""
+
+import json
+
+import pytest
+
+from app.database import open_database
+from app.importer import BulkImporter
+
+PATIENTS = """id,full_name,phone_number,date_of_birth
+1,John  Smith,(555) 010-1001,03/15/1985
+2,Maria Garcia,555.010.2001,1990-07-22
+3,No Birthday,555-010-4001,someday
+"""
+
+X_RAY = {
+    "patient_id": 1,
+    "appointment_date": "2099-01-07",
+    "appointment_time": "9:00",
+    "doctor_name": "Dr. Brown",
+    "appointment_type": "X-Ray",
+}
+APPOINTMENTS = [
+    {
+        "id": 1,
+        "patient_id": 1,
+        "appointment_date": "2099-01-05",
+        "appointment_time": "9:00",
+        "doctor_name": "Dr. Anderson",
+        "appointment_type": "General Checkup",
+        "status": "Scheduled",
+    },
+    {
+        "id": 2,
+        "patient_id": 2,
+        "appointment_date": "01/06/2099",
+        "appointment_time": "2:30 PM",
+        "doctor_name": "Dr. Brown",
+        "appointment_type": "Blood Test",
+    },
+    # Unknown status, unreadable time, unknown patient
+    {**X_RAY, "id": 3, "status": "lost"},
+    {**X_RAY, "id": 4, "appointment_time": "noon"},
+    {**X_RAY, "id": 5, "patient_id": 99},
+]
+
+
+@pytest.fixture
+def db(tmp_path):
+    return open_database(str(tmp_path / "db"), 2)
+
+
+@pytest.fixture
+def exports(tmp_path):
+    patients = tmp_path / "patients.csv"
+    patients.write_text(PATIENTS)
+    appointments = tmp_path / "appointments.ndjson"
+    appointments.write_text("\n".join(json.dumps(record) for record in APPOINTMENTS))
+    return str(patients), str(appointments)
+
+
+def appointments(db) -> dict[int, tuple]:
+    return {
+        row[0]: row[2:]
+        for shard in db.shards
+        for row in shard.conn.execute("SELECT * FROM appointments")
+    }
+
+
+def index_names(db) -> set[str]:
+    return {
+        (shard.name, name)
+        for shard in db.shards
+        for (name,) in shard.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        )
+    }
+
+
+def test_valid_rows_are_normalized_and_the_rest_rejected(db, exports):
+    indexes = index_names(db)
+    importer = BulkImporter(db, chunk_size=2)
+
+    patients = importer.run(exports[0], "patients")
+    assert (patients["imported"], patients["rejected"]) == (2, 1)
+    assert db.find_patient("John Smith", "555-010-1001", "1985-03-15") == (1, "John Smith")
+
+    stats = importer.run(exports[1], "appointments")
+    assert (stats["rows"], stats["imported"], stats["rejected"]) == (5, 2, 3)
+    assert appointments(db) == {
+        1: ("2099-01-05", "09:00", "Dr. Anderson", "General Checkup", "scheduled"),
+        2: ("2099-01-06", "14:30", "Dr. Brown", "Blood Test", "scheduled"),
+    }
+    assert db.shard_of_appointment(2) is db.shard_of_patient(2)
+    # Deferred indexes are back, and the imported slots are claimed
+    assert index_names(db) == indexes
+    assert db.directory.execute("SELECT COUNT(*) FROM doctor_slots").fetchone()[0] == 2
+
+
+def test_importing_again_updates_in_place(db, exports, tmp_path):
+    importer = BulkImporter(db)
+    importer.run(exports[0], "patients")
+    importer.run(exports[1], "appointments")
+
+    update = tmp_path / "update.ndjson"
+    update.write_text(json.dumps({**APPOINTMENTS[0], "status": "confirmed"}))
+    assert importer.run(str(update), "appointments")["imported"] == 1
+    assert appointments(db)[1][-1] == "confirmed"
+    assert len(appointments(db)) == 2
@@ -0,0 +1,59 @@
+"""Appointments prefetched at login"""
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.stubs import install_stub
+
+USER = {"full_name": "John Smith", "phone_number": "555-010-1001", "date_of_birth": "1985-03-15"}
+
+
+def login() -> dict:
+    import graph.nodes
+
+    return graph.nodes.auth_node(
+        {"messages": [HumanMessage(content="I'm John Smith")], "user_data": USER}
+    )
+
+
+def test_login_carries_the_prefetched_appointments():
+    install_stub()
+    result = login()
+    assert result["user_verified"]
+    assert result["available_appointments"]
+    assert result["appointments_fetched_at"]
+
+
+def test_a_failed_prefetch_neither_fails_the_login_nor_calls_the_model_again(monkeypatch):
+    stub = install_stub()
+    import graph.nodes
+
+    def unavailable(patient_id):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(graph.nodes, "fetch_appointments", unavailable)
+    result = login()
+    assert result["user_verified"]
+    assert result["user_data"]["user_id"] == 1
+    assert "available_appointments" not in result
+    assert len(stub.calls) == 1
+
+
+def test_stale_appointments_are_read_again_only_for_intents_that_need_them():
+    install_stub()
+    import graph.nodes
+
+    state = {
+        "user_verified": True,
+        "user_data": {**USER, "user_id": 1},
+        "available_appointments": [],
+        "appointments_fetched_at": 0,
+    }
+    listing = graph.nodes.chatbot_node(
+        {**state, "messages": [HumanMessage(content="show my appointments")]}
+    )
+    assert listing["intent"] == "list"
+    assert listing["available_appointments"]
+
+    goodbye = graph.nodes.chatbot_node({**state, "messages": [HumanMessage(content="bye")]})
+    assert goodbye["intent"] == "end"
+    assert "available_appointments" not in goodbye
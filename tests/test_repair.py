@@ -0,0 +1,87 @@
+"""Local repair of near-miss structured outputs, and the targeted re-ask for
+fields it can't fix"""
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from benchmarks.stubs import install_stub
+from graph.models import *
+from graph.repair import RepairError, invoke_repaired, repair
+
+MESSAGES = [HumanMessage(content="I'd like to cancel my appointment")]
+
+
+@pytest.fixture
+def stub():
+    stub = install_stub()
+    yield stub
+    stub.mangle = None
+
+
+def test_near_misses_are_fixed_without_a_model_call():
+    data, errors = repair(
+        UserDataExtraction,
+        {
+            "data_complete": True,
+            "full_name": "john  smith",
+            "phone_number": "+1 (555) 010-1001",
+            "date_of_birth": "15th March 1985",
+            "message": "Thanks!",
+        },
+    )
+    assert errors == []
+    assert data["full_name"] == "John Smith"
+    assert data["phone_number"] == "555-010-1001"
+    assert data["date_of_birth"] == "1985-03-15"
+
+    data, errors = repair(
+        IntentDecision, {"intent": "Cancel", "confidence": "85%", "message": "Sure."}
+    )
+    assert errors == []
+    assert (data["intent"], data["confidence"]) == ("cancel", 0.85)
+    data, errors = repair(ConfirmationDecision, {"appointment_id": "#2"})
+    assert data["appointment_id"] == 2
+
+
+def test_unfixable_values_are_reported():
+    # A wrong phone number and, despite "complete", no date of birth
+    _, errors = repair(
+        UserDataExtraction,
+        {
+            "data_complete": True,
+            "full_name": "Jane Doe",
+            "phone_number": "555-0101",
+            "message": "Thanks!",
+        },
+    )
+    assert {error.field for error in errors} == {"phone_number", "date_of_birth"}
+
+    _, errors = repair(IntentDecision, {"intent": "cancel or reschedule", "message": "?"})
+    assert [error.field for error in errors] == ["intent"]
+
+
+def test_a_repairable_output_takes_one_call(stub):
+    stub.mangle = lambda name, args: {**args, "intent": " CANCEL ", "confidence": 90}
+    decision = invoke_repaired(stub(), IntentDecision, MESSAGES)
+    assert (decision.intent, decision.confidence) == ("cancel", 0.9)
+    assert len(stub.calls) == 1
+
+
+def test_only_unfixable_fields_are_asked_for_again(stub):
+    stub.mangle = lambda name, args: {**args, "intent": "no idea", "confidence": 0.8}
+    decision = invoke_repaired(stub(), IntentDecision, MESSAGES)
+    assert (decision.intent, decision.confidence) == ("cancel", 0.8)
+    assert [call["schema"] for call in stub.calls] == [
+        "IntentDecision",
+        "IntentDecisionFields",
+    ]
+
+
+def test_ambiguous_values_are_not_asked_for_again(stub, monkeypatch):
+    monkeypatch.setattr("graph.repair.DATE_ORDER", "")
+    stub.mangle = lambda name, args: {**args, "date_of_birth": "03/04/1985"}
+    messages = [HumanMessage(content="John Smith, 555-010-1001, born 1985-03-04")]
+    with pytest.raises(RepairError) as error:
+        invoke_repaired(stub(), UserDataExtraction, messages)
+    assert error.value.errors[0].choices == ["1985-03-04", "1985-04-03"]
+    assert len(stub.calls) == 1
@@ -0,0 +1,69 @@
+"""Resolving references to a patient's appointments without the model"""
+
+from datetime import date
+
+from graph.resolver import CANCEL_MAX_AMBIGUITY, resolve_appointment
+
+TODAY = date(2099, 1, 5)  # A Monday
+
+APPOINTMENTS = [
+    {"id": 1, "date": "2099-01-06", "time": "09:00", "doctor": "Dr. Anderson",
+     "type": "General Checkup", "status": "scheduled"},
+    {"id": 2, "date": "2099-01-08", "time": "14:30", "doctor": "Dr. Brown",
+     "type": "Blood Test", "status": "scheduled"},
+    {"id": 3, "date": "2099-01-12", "time": "10:15", "doctor": "Dr. Brown",
+     "type": "Follow-up", "status": "confirmed"},
+    {"id": 4, "date": "2099-01-02", "time": "09:00", "doctor": "Dr. Wilson",
+     "type": "X-Ray", "status": "scheduled"},
+]
+
+
+def resolve(text: str, **kwargs):
+    return resolve_appointment(text, APPOINTMENTS, today=TODAY, **kwargs)
+
+
+def test_each_kind_of_reference_picks_one_appointment():
+    assert resolve("confirm the blood test").appointment_id == 2
+    assert resolve("the one with Dr. Anderson").appointment_id == 1
+    assert resolve("tomorrow's appointment").appointment_id == 1
+    assert resolve("the 2:30 pm one").appointment_id == 2
+    assert resolve("appointment #3").appointment_id == 3
+    assert resolve("the one next week").appointment_id == 3
+    assert resolve("the second one").appointment_id == 2
+
+
+def test_constraints_narrow_down_together():
+    result = resolve("the Dr. Brown one on thursday")
+    assert (result.appointment_id, result.ambiguity) == (2, 0)
+    assert result.matched == ["doctor", "date"]
+    assert resolve("the last one with Dr. Brown").appointment_id == 3
+
+
+def test_ties_are_left_to_the_model():
+    result = resolve("my appointment with Dr. Brown")
+    assert result.appointment_id is None
+    assert result.ambiguity == 1
+
+
+def test_a_partial_runner_up_is_resolved_for_confirming_but_not_cancelling():
+    results = {**APPOINTMENTS[1], "id": 5, "type": "Test Results", "doctor": "Dr. Wilson"}
+    appointments = APPOINTMENTS + [results]
+    # Blood Test matches fully, Test Results by half its words
+    result = resolve_appointment("the blood test", appointments, today=TODAY)
+    assert (result.appointment_id, result.ambiguity) == (2, 0.5)
+    cancel = resolve_appointment(
+        "the blood test", appointments, today=TODAY, max_ambiguity=CANCEL_MAX_AMBIGUITY
+    )
+    assert cancel.appointment_id is None
+
+
+def test_text_the_rules_cant_read_safely_resolves_to_nothing():
+    for text in (
+        "not the blood test",
+        "cancel both",
+        "is it the blood test?",
+        "the one with Dr. Smith",
+        "the x-ray",  # In the past
+        "my appointment",
+    ):
+        assert resolve(text).appointment_id is None, text
@@ -0,0 +1,62 @@
+"""Routing the answer to a node's clarifying question straight back to it"""
+
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from graph.nodes import PENDING_ACTION_ATTEMPTS, await_reply
+from graph.routing import entry_point_routing
+
+USER = {"user_id": 1, "full_name": "John Smith"}
+
+
+def asked(node: str, state: dict) -> dict:
+    """``state`` after ``node`` asked a question, with the user's reply pending"""
+    messages = state["messages"] + [AIMessage(content="Which appointment do you mean?")]
+    return {**state, "messages": messages, "pending_action": await_reply(state, node)}
+
+
+def reply(state: dict, text: str) -> dict:
+    return {**state, "messages": state["messages"] + [HumanMessage(content=text)]}
+
+
+def conversation(text: str = "I want to confirm my appointment") -> dict:
+    return {
+        "user_verified": True,
+        "user_data": USER,
+        "messages": [HumanMessage(content=text)],
+    }
+
+
+def test_the_answer_goes_back_to_the_asking_node():
+    state = asked("confirm", conversation())
+    assert entry_point_routing(reply(state, "the general checkup")) == "confirm"
+
+
+def test_new_requests_go_through_intent_detection():
+    state = asked("confirm", conversation())
+    assert entry_point_routing(reply(state, "never mind")) == "chatbot"
+    assert entry_point_routing(reply(state, "actually cancel it")) == "chatbot"
+    assert entry_point_routing(reply(state, "show my appointments")) == "chatbot"
+
+
+def test_only_the_next_message_and_only_while_fresh():
+    state = reply(asked("confirm", conversation()), "the general checkup")
+    later = reply(reply(state, "Done."), "the blood test")
+    assert entry_point_routing(later) == "chatbot"
+
+    state["pending_action"]["expires_at"] = time.time() - 1
+    assert entry_point_routing(state) == "chatbot"
+
+
+def test_a_node_asks_again_a_limited_number_of_times():
+    state = conversation()
+    for _ in range(PENDING_ACTION_ATTEMPTS):
+        state = reply(asked("cancel", state), "hmm")
+        assert entry_point_routing(state) == "cancel"
+    assert await_reply(state, "cancel") is None
+
+
+def test_unverified_users_start_with_the_introduction():
+    state = asked("confirm", {**conversation(), "user_verified": False})
+    assert entry_point_routing(reply(state, "the general checkup")) == "introduction"
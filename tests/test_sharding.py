@@ -0,0 +1,83 @@
+"""Rebalancing patients onto new shards while status updates keep landing"""
+
+import threading
+from datetime import date, timedelta
+
+import pytest
+
+import app.tools
+from app.database import open_database
+from app.events import EventLog
+
+PATIENTS = 200
+
+
+def days():
+    day = date(2099, 1, 1)
+    while True:
+        yield day.isoformat()
+        day += timedelta(days=1)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    one = open_database(str(tmp_path), 1)
+    one.add_patients(
+        [
+            (i, f"Patient {i}", f"555-010-{i:04d}", "1985-03-15")
+            for i in range(1, PATIENTS + 1)
+        ]
+    )
+    one.add_appointments(
+        [
+            (i, i, day, "09:00", "Dr. Anderson", "General Checkup", "scheduled")
+            for i, day in zip(range(1, PATIENTS + 1), days())
+        ]
+    )
+    # Reopened with more shards: everyone is still on the first until rebalanced
+    db = open_database(str(tmp_path), 4)
+    monkeypatch.setattr(app.tools, "DB", db)
+    monkeypatch.setattr(app.tools, "EVENTS", EventLog(db, fold_delay=0))
+    app.tools._shard_name.cache_clear()
+    yield db
+    app.tools._shard_name.cache_clear()
+
+
+def test_updates_during_a_rebalance_land_once_on_the_patients_new_shard(db):
+    written = {}
+    done = threading.Event()
+
+    def write():
+        status = "confirmed"
+        while not done.is_set():
+            for appointment_id in range(1, PATIENTS + 1, 7):
+                app.tools.commit_status_updates(
+                    [{"appointment_id": appointment_id, "status": status}]
+                )
+                written[appointment_id] = status
+            status = "scheduled" if status == "confirmed" else "confirmed"
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        moved = db.rebalance(batch_size=16)
+    finally:
+        done.set()
+        writer.join()
+
+    assert moved > 0
+    assert db.rebalance() == 0
+    for appointment_id in range(1, PATIENTS + 1):
+        rows = [
+            (shard.name, row[0])
+            for shard in db.shards
+            for row in shard.conn.execute(
+                "SELECT status FROM appointments WHERE id = ?", (appointment_id,)
+            )
+        ]
+        assert rows == [
+            (
+                db.shard_of_patient(appointment_id).name,
+                written.get(appointment_id, "scheduled"),
+            )
+        ]
@@ -0,0 +1,88 @@
+"""Concurrent same-thread /chat requests through the turn queue"""
+
+import asyncio
+
+import httpx
+
+from app.turns import TurnQueue
+from benchmarks.stubs import install_stub
+
+LOGIN = "I'm John Smith, 555-010-1001, 1985-03-15"
+
+
+def test_concurrent_chat_keeps_every_message_in_order():
+    install_stub(0.05)
+    import app.api as api
+
+    messages = [f"message #{i}" for i in range(6)]
+
+    async def burst():
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            login = await client.post("/chat", json={"message": LOGIN})
+            thread_id = login.json()["thread_id"]
+
+            async def send(i: int, message: str):
+                # Staggered so the arrival order is known; all land mid-turn
+                await asyncio.sleep(i * 0.005)
+                return await client.post(
+                    "/chat", json={"message": message, "thread_id": thread_id}
+                )
+
+            responses = await asyncio.gather(
+                *(send(i, message) for i, message in enumerate(messages))
+            )
+            return thread_id, responses
+
+    thread_id, responses = asyncio.run(burst())
+
+    assert all(response.status_code == 200 for response in responses)
+    history = api.chatbot.get_state({"configurable": {"thread_id": thread_id}}).values[
+        "messages"
+    ]
+    # Merged turns join their messages with newlines
+    sent = [
+        line
+        for m in history
+        if m.type == "human"
+        for line in m.content.split("\n")
+        if line.startswith("message #")
+    ]
+    assert sent == messages
+    # Each turn answered before the next began: no two human messages in a row
+    types = [m.type for m in history]
+    assert ("human", "human") not in zip(types, types[1:])
+
+
+def test_batches_keep_their_own_options():
+    queue = TurnQueue()
+    calls = []
+
+    def run_with(options):
+        async def run(messages):
+            calls.append((options, messages))
+            await asyncio.sleep(0.01)
+            return options
+
+        return run
+
+    async def burst():
+        requests = [("a", False), ("b", False), ("c", True), ("d", True), ("e", False)]
+
+        async def send(i: int, message: str, options: bool):
+            await asyncio.sleep(i * 0.001)
+            return await queue.submit("t", message, run_with(options), options)
+
+        return await asyncio.gather(
+            *(send(i, message, options) for i, (message, options) in enumerate(requests))
+        )
+
+    results = asyncio.run(burst())
+
+    assert calls == [
+        (False, ["a"]),
+        (False, ["b"]),
+        (True, ["c", "d"]),
+        (False, ["e"]),
+    ]
+    assert results == [False, False, True, True, False]
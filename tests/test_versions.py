@@ -0,0 +1,26 @@
+"""Per-patient version tags behind the portal's ETags"""
+
+from app.database import open_database
+
+
+def test_writes_through_another_connection_change_the_version(tmp_path):
+    db = open_database(str(tmp_path), 2)
+    db.add_patients([(1, "John Smith", "555-010-1001", "1985-03-15")])
+    db.add_appointments(
+        [(1, 1, "2099-01-05", "09:00", "Dr. Anderson", "General Checkup", "scheduled")]
+    )
+    before = db.patient_version(1)
+
+    # Another process's importer, on its own connections to the same files
+    other = open_database(str(tmp_path), 2)
+    other.upsert_appointments(
+        [(1, 1, "2099-01-05", "09:00", "Dr. Anderson", "General Checkup", "confirmed")]
+    )
+    assert db.patient_version(1) != before
+
+    moved = db.patient_version(1)
+    source = db.shard_of_patient(1).name
+    target = next(shard.name for shard in db.shards if shard.name != source)
+    assert other.move_patient(1, target)
+    assert db.patient_version(1) not in (None, moved)
+    assert db.patient_version(2) is None
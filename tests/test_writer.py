@@ -0,0 +1,141 @@
+"""Status updates committed per shard by commit_status_updates, directly or
+through the write-behind writer"""
+
+import threading
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+import app.tools
+from app.database import open_database
+from app.events import EventLog
+from app.writer import CommitError, StatusWriter
+from benchmarks.stubs import install_stub
+
+ROWS = [
+    (1, 1, "2099-01-05", "09:00", "Dr. Anderson", "General Checkup", "scheduled"),
+    (2, 2, "2099-01-05", "10:00", "Dr. Anderson", "General Checkup", "scheduled"),
+]
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db = open_database(str(tmp_path), 2)
+    db.add_patients(
+        [
+            (1, "John Smith", "555-010-1001", "1985-03-15"),
+            (2, "Jane Doe", "555-010-1002", "1990-07-22"),
+        ]
+    )
+    db.add_appointments(ROWS)
+    monkeypatch.setattr(app.tools, "DB", db)
+    monkeypatch.setattr(app.tools, "EVENTS", EventLog(db, fold_delay=0))
+    app.tools._shard_name.cache_clear()
+    return db
+
+
+def transitions(db, appointment_id: int) -> list[tuple]:
+    shard = db.shard_of_appointment(appointment_id)
+    return shard.conn.execute(
+        """SELECT old_status, new_status FROM appointment_events
+        WHERE appointment_id = ? AND old_status IS NOT NULL ORDER BY id""",
+        (appointment_id,),
+    ).fetchall()
+
+
+def status(db, appointment_id: int) -> str:
+    shard = db.shard_of_appointment(appointment_id)
+    return shard.conn.execute(
+        "SELECT status FROM appointments WHERE id = ?", (appointment_id,)
+    ).fetchone()[0]
+
+
+def test_updates_of_one_appointment_apply_in_order(db):
+    app.tools.commit_status_updates(
+        [
+            {"appointment_id": 1, "status": "confirmed"},
+            {"appointment_id": 1, "status": "cancelled"},
+        ]
+    )
+    assert status(db, 1) == "cancelled"
+    assert transitions(db, 1) == [("scheduled", "confirmed"), ("confirmed", "cancelled")]
+
+
+def test_a_failed_shard_rolls_back_and_fails_only_its_updates(db):
+    healthy = db.shard_of_patient(1)
+    if db.shard_of_patient(2) is healthy:
+        db.move_patient(2, next(s.name for s in db.shards if s is not healthy))
+    broken = db.shard_of_patient(2)
+    broken.conn.execute("DROP TABLE patient_versions")
+
+    with pytest.raises(CommitError) as error:
+        app.tools.commit_status_updates(
+            [
+                {"appointment_id": 1, "status": "confirmed"},
+                {"appointment_id": 2, "status": "confirmed"},
+            ]
+        )
+    assert set(error.value.failed) == {2}
+    assert not broken.conn.in_transaction
+    assert status(db, 1) == "confirmed"
+    assert status(db, 2) == "scheduled"
+    assert transitions(db, 2) == []
+
+
+def test_a_single_update_commits_before_returning(db):
+    result = app.tools.update_appointment_status.func(2, "cancelled")
+    assert result["durable"]
+    assert status(db, 2) == "cancelled"
+    assert transitions(db, 2) == [("scheduled", "cancelled")]
+
+
+def test_write_behind_updates_are_read_back_until_committed(db):
+    gate = threading.Event()
+
+    def commit(shard, updates):
+        gate.wait(5)
+        app.tools.commit_status_updates(updates, shard)
+
+    writer = StatusWriter(commit, max_delay=0)
+    first = writer.submit(1, "confirmed", owner=1)
+    second = writer.submit(1, "cancelled", owner=1)
+    stored = [{"id": 1, "status": "scheduled"}]
+    assert writer.overlay(1, stored)[0]["status"] == "cancelled"
+    assert writer.overlay(2, stored)[0]["status"] == "scheduled"
+
+    gate.set()
+    assert first.result(5) and second.result(5)
+    assert writer.overlay(1, stored)[0]["status"] == "scheduled"
+    assert status(db, 1) == "cancelled"
+    assert transitions(db, 1) == [("scheduled", "confirmed"), ("confirmed", "cancelled")]
+
+
+def confirm(patient_id: int) -> dict:
+    install_stub()
+    import graph.nodes
+
+    return graph.nodes.confirm_node(
+        {
+            "messages": [HumanMessage(content="confirm my general checkup")],
+            "user_verified": True,
+            "user_data": {"user_id": patient_id},
+            "available_appointments": app.tools.query_appointments(patient_id),
+        }
+    )
+
+
+def test_confirm_node_answers_once_its_write_behind_update_is_durable(db):
+    result = confirm(1)
+    assert result["available_appointments"][0]["status"] == "confirmed"
+    assert status(db, 1) == "confirmed"
+
+
+def test_confirm_node_reports_a_failed_commit(db, monkeypatch):
+    def fail(updates, shard=None):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(app.tools, "commit_status_updates", fail)
+    result = confirm(1)
+    assert "couldn't save" in result["messages"][0].content
+    assert "available_appointments" not in result
+    assert status(db, 1) == "scheduled"